@@ -0,0 +1,257 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime
+
+import config
+import metrics
+
+# 起床・工程開始のアラーム (サーバーから WebSocket / SSE で通知する)
+# 以前は準備画面 (prepare/view.tsx) が予定と工程を読んで、カウントダウンも次の工程への切り替えも
+# 画面側で行っていた。今は通知を受けたい利用者が接続している間だけ、その利用者の近い予定を読んで
+# 「起床時刻」と「起床時刻 + 各工程の開始オフセット」をタイマーにし、時刻が来たら接続に送る。
+# - タイマーはワーカーに1つのヒープ (発火時刻順) と、先頭の時刻に合わせた1つの loop.call_at で持つ。
+#   10万件でも追加は O(log n)、発火の遅れはイベントループの混み具合 (通常1ms未満) だけ
+# - 予定が書き換わったら、その利用者のアラームは世代番号を上げて丸ごと無効にし、読み直す
+#   (ヒープからは発火時に捨てる。無効なものが有効なものより多くなったらヒープを作り直す)
+# - 利用者ごとのアラームはその利用者の接続があるワーカーだけが持つ。予定の書き換えは ETag の
+#   バージョン (user_schedules:{user_id}) を ALARM_REFRESH 秒ごとに見て気づく
+#   (PLAN_CACHE_BACKEND=redis なら他のワーカーでの書き込みにも気づく)
+# - 1ワーカーが持つアラームは ALARM_MAX_PENDING 件まで。超えた分は登録しない
+
+# ヒープの要素: (発火時刻 (loop.time()), 連番, user_id, 世代, schedule_id, 工程の位置 (-1 = 起床), 工程のリスト)
+WAKE_UP = -1
+
+
+class UserAlarms:
+    __slots__ = ("queues", "generation", "pending", "version", "loaded_at")
+
+    def __init__(self):
+        # この利用者の接続ごとのイベントのキュー
+        self.queues = set()
+        self.generation = 0
+        # ヒープに入っている有効なアラームの数
+        self.pending = 0
+        # 最後に読んだときの予定のバージョン
+        self.version = None
+        self.loaded_at = 0.0
+
+
+class AlarmEngine:
+    def __init__(self, loader, versions, max_pending: int, queue_size: int, refresh: float, reload_after: float):
+        # loader(user_id) → [(発火時刻 (UNIX時刻), schedule_id, 工程の位置, 工程のリスト), ...]
+        self.loader = loader
+        self.versions = versions
+        self.max_pending = max_pending
+        self.queue_size = queue_size
+        self.refresh = refresh
+        self.reload_after = reload_after
+        self.users = {}
+        self.heap = []
+        self.sequence = itertools.count()
+        # ヒープに入っている有効なアラームと無効になったアラームの数
+        self.pending = 0
+        self.stale = 0
+        self.handle = None
+        self.task = None
+
+    # ----- 接続 -----
+    async def subscribe(self, user_id) -> asyncio.Queue:
+        # 接続ごとにキューを1つ返す。アラームの時刻になるとイベント (dict) が入り、終了時は None が入る
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = UserAlarms()
+            user.queues.add(queue)
+            try:
+                await self.reload(user_id)
+            except BaseException:
+                self.unsubscribe(user_id, queue)
+                raise
+        else:
+            user.queues.add(queue)
+        return queue
+
+    def unsubscribe(self, user_id, queue: asyncio.Queue):
+        user = self.users.get(user_id)
+        if user is None:
+            return
+        user.queues.discard(queue)
+        if not user.queues:
+            # 最後の接続が切れたら、この利用者のアラームはもう要らない
+            self._cancel(user)
+            del self.users[user_id]
+
+    # ----- アラームの登録 -----
+    async def reload(self, user_id):
+        # 予定を読み直して、この利用者のアラームを入れ替える
+        user = self.users.get(user_id)
+        if user is None:
+            return
+        keys = [f"user_schedules:{user_id}"]
+        version = (await self.versions.current(keys))[0]
+        alarms = await self.loader(user_id)
+        # 読んでいる間に接続が切れていたら何もしない
+        if self.users.get(user_id) is not user:
+            return
+        user.version = version
+        user.loaded_at = time.monotonic()
+        self.schedule(user_id, alarms)
+
+    def schedule(self, user_id, alarms: list):
+        user = self.users[user_id]
+        self._cancel(user)
+        wall_now = time.time()
+        loop_now = asyncio.get_running_loop().time()
+        room = self.max_pending - self.pending
+        alarms = sorted(alarm for alarm in alarms if alarm[0] >= wall_now)
+        if len(alarms) > room:
+            logging.warning("Alarm limit reached; dropping %d alarms for user %s", len(alarms) - room, user_id)
+            metrics.alarms_dropped.inc("limit", amount=len(alarms) - room)
+            alarms = alarms[:max(room, 0)]
+        for fire_at, schedule_id, step_index, steps in alarms:
+            # 壁時計の時刻を loop.time() に直す (時計が動いても発火はずれない)
+            heapq.heappush(self.heap, (loop_now + fire_at - wall_now, next(self.sequence), user_id, user.generation, schedule_id, step_index, steps))
+        user.pending = len(alarms)
+        self.pending += len(alarms)
+        self._arm()
+
+    def _cancel(self, user: UserAlarms):
+        user.generation += 1
+        self.pending -= user.pending
+        self.stale += user.pending
+        user.pending = 0
+        if self.stale > max(self.pending, 1024):
+            self._compact()
+
+    def _compact(self):
+        # 無効になったアラームを取り除いてヒープを作り直す
+        self.heap = [entry for entry in self.heap if self._live(entry)]
+        heapq.heapify(self.heap)
+        self.stale = 0
+        self._arm()
+
+    def _live(self, entry) -> bool:
+        user = self.users.get(entry[2])
+        return user is not None and user.generation == entry[3]
+
+    # ----- 発火 -----
+    def _arm(self):
+        # ヒープの先頭の時刻にタイマーを合わせる
+        if not self.heap:
+            if self.handle is not None:
+                self.handle.cancel()
+                self.handle = None
+            return
+        when = self.heap[0][0]
+        if self.handle is not None:
+            if self.handle.when() == when:
+                return
+            self.handle.cancel()
+        self.handle = asyncio.get_running_loop().call_at(when, self._fire)
+
+    def _fire(self):
+        self.handle = None
+        now = asyncio.get_running_loop().time()
+        wall_now = time.time()
+        heap = self.heap
+        while heap and heap[0][0] <= now:
+            entry = heapq.heappop(heap)
+            if not self._live(entry):
+                self.stale -= 1
+                continue
+            when, _, user_id, _, schedule_id, step_index, steps = entry
+            user = self.users[user_id]
+            user.pending -= 1
+            self.pending -= 1
+            metrics.alarm_lateness.observe(now - when)
+            self._deliver(user, self._event(schedule_id, step_index, steps, wall_now - (now - when)))
+        self._arm()
+
+    @staticmethod
+    def _event(schedule_id, step_index, steps, fire_at: float) -> dict:
+        at = datetime.fromtimestamp(round(fire_at)).isoformat()
+        if step_index == WAKE_UP:
+            return {"type": "wake_up", "schedule_id": schedule_id, "at": at}
+        step = steps[step_index]
+        return {
+            "type": "step",
+            "schedule_id": schedule_id,
+            "process_order": step["process_order"],
+            "step_name": step["step_name"],
+            "step_time": step["step_time"],
+            "at": at
+        }
+
+    def _deliver(self, user: UserAlarms, event: dict):
+        metrics.alarms_fired.inc(event["type"])
+        for queue in user.queues:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 受け取りが追いつかない接続には送らない (メモリを増やさない)
+                metrics.alarms_dropped.inc("slow_client")
+
+    # ----- 予定の書き換えの確認 -----
+    async def _refresh(self):
+        while True:
+            await asyncio.sleep(self.refresh)
+            try:
+                user_ids = list(self.users)
+                if not user_ids:
+                    continue
+                versions = await self.versions.current([f"user_schedules:{user_id}" for user_id in user_ids])
+                now = time.monotonic()
+                for user_id, version in zip(user_ids, versions):
+                    user = self.users.get(user_id)
+                    if user is not None and (user.version != version or now - user.loaded_at >= self.reload_after):
+                        await self.reload(user_id)
+            except Exception as e:
+                logging.warning("Failed to refresh alarms: %s", e)
+
+    def start(self):
+        # lifespan の中 (イベントループの上) で呼ぶ
+        self.task = asyncio.get_running_loop().create_task(self._refresh())
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "stale": self.stale,
+            "users": len(self.users),
+            "subscribers": sum(len(user.queues) for user in self.users.values())
+        }
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+        # 接続中のストリームを終わらせる
+        for user in self.users.values():
+            for queue in user.queues:
+                try:
+                    queue.put_nowait(None)
+                except asyncio.QueueFull:
+                    queue.get_nowait()
+                    queue.put_nowait(None)
+        self.users.clear()
+        self.heap = []
+        self.pending = self.stale = 0
+
+
+def create_alarm_engine(loader, versions) -> AlarmEngine:
+    return AlarmEngine(
+        loader,
+        versions,
+        max_pending=config.alarm_max_pending,
+        queue_size=config.alarm_queue_size,
+        refresh=config.alarm_refresh,
+        reload_after=config.alarm_reload
+    )
@@ -0,0 +1,97 @@
+"""アラームエンジンの発火の遅れとメモリの計測
+
+AlarmEngine に --users 人 × --per-user 件 (既定で合計10万件) のアラームを登録し、
+--window 秒の間にばらけて発火させる。発火の遅れ (予定時刻との差) の p50/p99/最大と、
+登録にかかった時間、アラーム1件あたりのメモリ (tracemalloc) を出す。
+DBは読まない (loader が作ったアラームをそのまま渡す)。
+
+    cd backend
+    python -m benchmarks.bench_alarms --users 1000 --per-user 100 --window 10
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import tracemalloc
+
+import metrics
+from alarms import AlarmEngine
+
+
+class FixedVersions:
+    # 予定は書き換わらない
+    async def current(self, keys: list) -> list:
+        return ["0"] * len(keys)
+
+
+class LatenessRecorder:
+    def __init__(self, values: list):
+        self.values = values
+
+    def observe(self, value: float):
+        self.values.append(value)
+
+
+async def subscribe_all(args, start: float):
+    rng = random.Random(0)
+    # 工程のリストはプランごとに1つを共有する (実際も plan_cache のエントリを共有する)
+    steps = [{"step_name": f"step{index}", "step_time": 5, "process_order": index + 1} for index in range(args.per_user)]
+
+    async def loader(user_id):
+        return [(start + rng.random() * args.window, user_id * 10, index, steps) for index in range(args.per_user)]
+
+    engine = AlarmEngine(loader, FixedVersions(), max_pending=args.users * args.per_user, queue_size=args.per_user, refresh=3600, reload_after=3600)
+    queues = [await engine.subscribe(user_id) for user_id in range(args.users)]
+    return engine, queues
+
+
+async def run(args):
+    # 登録の時間 (tracemallocなし) とメモリ (tracemallocあり) は別々に測る
+    started = time.perf_counter()
+    engine, _ = await subscribe_all(args, time.time() + 3600)
+    elapsed = time.perf_counter() - started
+    total = engine.pending
+    await engine.close()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    engine, _ = await subscribe_all(args, time.time() + 3600)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    await engine.close()
+
+    # 発火の遅れ (エンジンが metrics.alarm_lateness に記録する値) を集める
+    lateness = []
+    metrics.alarm_lateness = LatenessRecorder(lateness)
+    # 登録が終わってから --delay 秒後に最初のアラームが来るようにする
+    engine, queues = await subscribe_all(args, time.time() + elapsed + args.delay)
+
+    async def drain(queue):
+        for _ in range(args.per_user):
+            await queue.get()
+
+    await asyncio.wait_for(asyncio.gather(*(drain(queue) for queue in queues)), timeout=args.window + args.delay + 30)
+    await engine.close()
+
+    lateness.sort()
+    print(f"alarms        {total}")
+    print(f"schedule      {elapsed * 1000:.1f} ms ({elapsed / total * 1e6:.2f} us/alarm)")
+    print(f"memory        {memory / 1024 / 1024:.1f} MB ({memory / total:.0f} bytes/alarm)")
+    print(f"lateness p50  {statistics.median(lateness) * 1000:.3f} ms")
+    print(f"lateness p99  {lateness[int(len(lateness) * 0.99)] * 1000:.3f} ms")
+    print(f"lateness max  {lateness[-1] * 1000:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--per-user", type=int, default=100)
+    parser.add_argument("--window", type=float, default=10)
+    parser.add_argument("--delay", type=float, default=2)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""プラン登録のスループット計測
+
+従来の「plan_regを1回 + processを1ステップごとに1回」登録する方法と、
+RPCでまとめて登録する方法 (1プランずつ / 一括) を、メモリバックエンドに
+ネットワーク往復を模した遅延を入れて比べる。
+
+    cd backend
+    python -m benchmarks.bench_create_plan --plans 200 --steps 15 --latency-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+from db import QueryRunner, Repository
+from memory_backend import MemoryClient
+
+
+def make_plans(count: int, steps: int) -> list:
+    return [{
+        "user_id": 1,
+        "plan_name": f"plan-{index}",
+        "steps": [{"step_name": f"step-{order}", "step_time": 5} for order in range(steps)]
+    } for index in range(count)]
+
+
+async def legacy(repo: Repository, plans: list):
+    # 変更前の create_plan と同じ往復回数 (1 + ステップ数)
+    for plan in plans:
+        rows = await repo.execute(repo.client.table("plan_reg").insert({"user_id": plan["user_id"], "plan_name": plan["plan_name"]}))
+        for index, step in enumerate(plan["steps"]):
+            await repo.execute(repo.client.table("process").insert({**step, "plan_id": rows[0]["plan_id"], "process_order": index + 1}))
+
+
+async def per_plan_rpc(repo: Repository, plans: list):
+    for plan in plans:
+        await repo.create_plan(plan["user_id"], plan["plan_name"], plan["steps"])
+
+
+async def bulk_rpc(repo: Repository, plans: list):
+    await repo.create_plans_bulk(plans)
+
+
+async def measure(name: str, func, plans: list, latency_ms: float):
+    client = MemoryClient(latency_ms=latency_ms)
+    repo = Repository(client, QueryRunner(pool_size=4, timeout=60))
+    started = time.perf_counter()
+    await func(repo, plans)
+    elapsed = time.perf_counter() - started
+    repo.runner.shutdown()
+    print(f"{name:<14} {elapsed * 1000:10.1f} ms {len(plans) / elapsed:10.1f} plans/s {client.calls:8d} round trips")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=200)
+    parser.add_argument("--steps", type=int, default=15)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    plans = make_plans(args.plans, args.steps)
+    await measure("legacy", legacy, plans, args.latency_ms)
+    await measure("rpc per plan", per_plan_rpc, plans, args.latency_ms)
+    await measure("rpc bulk", bulk_rpc, plans, args.latency_ms)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
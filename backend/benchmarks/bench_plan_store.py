@@ -0,0 +1,87 @@
+"""プランキャッシュの1プランあたりのメモリ (dict のまま / 列に詰めた PlanStore)
+
+よくある工程名 (歯磨き・朝食・着替え…) を組み合わせた --plans 件のプラン (工程は3〜10個) を
+build_plan_entry でエントリにして、それぞれの保存先に入れる。
+
+- local:   LocalCacheBackend (エントリの dict をそのまま持つ。PLAN_CACHE_BACKEND=local)
+- compact: PlanStore (工程を array に詰め、工程名を共有する。PLAN_CACHE_BACKEND=compact)
+
+1プランあたりのメモリ (tracemalloc)、PlanStore.memory() の概算、入れる時間 (エントリを作る時間を含む) と get 1回の時間を出す。
+DBから読んだ行と同じく、工程名の文字列はプランごとに別のオブジェクトとして作る。
+
+    cd backend
+    python -m benchmarks.bench_plan_store --plans 1000000 --local-plans 100000
+"""
+import argparse
+import asyncio
+import random
+import time
+import tracemalloc
+
+from cache import CompactCacheBackend, LocalCacheBackend, build_plan_entry
+
+STEP_NAMES = ["歯磨き", "朝食", "着替え", "洗顔", "シャワー", "髪を整える", "化粧", "ひげそり", "ゴミ出し", "弁当を作る",
+              "コーヒー", "ストレッチ", "ニュースを見る", "犬の散歩", "荷物の確認", "戸締まり"]
+PLAN_NAMES = ["平日", "休日", "出張", "在宅", "早番", "遅番"]
+
+
+def make_entries(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for plan_id in range(1, count + 1):
+        names = rng.sample(STEP_NAMES, rng.randint(3, 10))
+        # .encode().decode() でDBの応答と同じく毎回別の str にする
+        steps = [{"step_name": name.encode().decode(), "step_time": rng.choice((3, 5, 10, 15, 20)), "process_order": order}
+                 for order, name in enumerate(names, 1)]
+        plan = {"plan_id": plan_id, "plan_name": rng.choice(PLAN_NAMES).encode().decode(), "total_minutes": None}
+        yield build_plan_entry(plan, steps)
+
+
+async def fill(backend, count: int) -> float:
+    started = time.perf_counter()
+    for entry in make_entries(count):
+        await backend.set(str(entry["plan_id"]), entry)
+    return time.perf_counter() - started
+
+
+async def measure(name: str, make_backend, count: int, gets: int):
+    # 入れる時間 (tracemallocなし) とメモリ (tracemallocあり) は別々に測る
+    backend = make_backend(count)
+    elapsed = await fill(backend, count)
+    rng = random.Random(1)
+    keys = [str(rng.randint(1, count)) for _ in range(gets)]
+    started = time.perf_counter()
+    for key in keys:
+        await backend.get(key)
+    get_time = time.perf_counter() - started
+    estimate = backend.memory()
+    del backend
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    backend = make_backend(count)
+    await fill(backend, count)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del backend
+
+    print(f"{name:<8} {count:>9} {memory / count:>11.0f} {estimate / count if estimate >= 0 else float('nan'):>11.0f} "
+          f"{memory / 1024 / 1024:>9.1f} {elapsed / count * 1e6:>10.2f} {get_time / gets * 1e6:>9.2f}")
+
+
+async def run(args):
+    print(f"{'':<8} {'plans':>9} {'bytes/plan':>11} {'概算/plan':>11} {'MB':>9} {'put us':>10} {'get us':>9}")
+    await measure("local", lambda count: LocalCacheBackend(max_size=count, ttl=3600), args.local_plans, args.gets)
+    await measure("compact", lambda count: CompactCacheBackend(max_size=count, ttl=3600), args.plans, args.gets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=1000000, help="compact に入れるプラン数")
+    parser.add_argument("--local-plans", type=int, default=100000, help="local に入れるプラン数 (dict のままなので少なめにする)")
+    parser.add_argument("--gets", type=int, default=100000)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
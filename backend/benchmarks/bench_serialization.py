@@ -0,0 +1,70 @@
+"""レスポンスのJSON化のマイクロベンチマーク
+
+予定一覧のレスポンス (schedule_reg の行のリスト) をJSONにする時間を比べる。
+
+- before: 型なしで dict を返したときの経路 (jsonable_encoder + JSONResponse)
+- after:  response_model=List[ScheduleRow] + ORJSONResponse の経路
+          (FastAPIと同じく pydantic で検証してから mode="json" で取り出し、orjsonで書き出す)
+
+    cd backend
+    python -m benchmarks.bench_serialization --schedules 1000 --repeat 200
+"""
+import argparse
+import random
+import time
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from schemas import ScheduleRow
+
+
+def make_rows(count: int) -> list:
+    rng = random.Random(0)
+    return [{
+        "schedule_id": index + 1,
+        "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "departure_time": f"{rng.randint(6, 9):02d}:{rng.choice(['00', '15', '30', '45'])}:00",
+        "wake_up_time": f"{rng.randint(5, 8):02d}:{rng.randint(0, 59):02d}:00",
+        "plan_id": rng.randint(1, 500)
+    } for index in range(count)]
+
+
+def timed(name: str, func, repeat: int, count: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        body = func()
+    elapsed = (time.perf_counter() - started) / repeat
+    print(f"{name:<8} {elapsed * 1000:10.3f} ms per {count} schedules ({len(body)} bytes)")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--schedules", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = make_rows(args.schedules)
+    adapter = TypeAdapter(List[ScheduleRow])
+
+    def before() -> bytes:
+        return JSONResponse(jsonable_encoder(rows)).body
+
+    def after() -> bytes:
+        return ORJSONResponse(adapter.dump_python(adapter.validate_python(rows), mode="json")).body
+
+    # どちらも同じJSONになること
+    assert orjson.loads(before()) == orjson.loads(after())
+
+    slow = timed("before", before, args.repeat, args.schedules)
+    fast = timed("after", after, args.repeat, args.schedules)
+    print(f"speedup  {slow / fast:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""同じプランへの同時アクセスで、上流への呼び出しがまとめられることの確認
+
+遅いメモリバックエンドの前で、同じ plan_id を N 件同時に読み込み、
+single-flight あり / なし の上流呼び出し回数と所要時間を比べる。
+
+    cd backend
+    python -m benchmarks.bench_single_flight --clients 50 --latency-ms 50
+"""
+import argparse
+import asyncio
+import time
+
+from cache import build_plan_entry
+from db import QueryRunner, Repository
+from memory_backend import MemoryClient
+from singleflight import SingleFlight
+
+
+async def run(clients: int, latency_ms: float, coalesce: bool):
+    client = MemoryClient(latency_ms=latency_ms)
+    repo = Repository(client, QueryRunner(pool_size=clients * 2, timeout=60))
+    await repo.create_plan(1, "朝", [{"step_name": "歯磨き", "step_time": 5}, {"step_name": "朝食", "step_time": 15}])
+    client.calls = 0
+    flight = SingleFlight()
+
+    async def load_plan():
+        plans = await repo.get_plan(1)
+        steps = await repo.get_steps(1)
+        return build_plan_entry(plans[0], steps)
+
+    async def read():
+        if coalesce:
+            return await flight.do(("plan", "1"), load_plan)
+        return await load_plan()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(read() for _ in range(clients)))
+    elapsed = time.perf_counter() - started
+    repo.runner.shutdown()
+
+    assert all(result == results[0] for result in results)
+    label = "single-flight" if coalesce else "direct"
+    print(f"{label:<14} {elapsed * 1000:8.1f} ms {client.calls:6d} upstream calls  {flight.stats()}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    await run(args.clients, args.latency_ms, coalesce=False)
+    await run(args.clients, args.latency_ms, coalesce=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
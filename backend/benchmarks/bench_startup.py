@@ -0,0 +1,56 @@
+"""ワーカーの起動時間とメモリの計測
+
+新しいプロセスで app を読み込み、lifespan の起動 (共有リソースの作成) までにかかる時間と
+最大常駐メモリ (ru_maxrss) を測る。プロセスごとの値なので、--runs 回起動して中央値を出す。
+
+    cd backend
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+import orjson
+
+# 子プロセスで実行するスクリプト
+CHILD = """
+import asyncio, resource, sys, time
+import orjson
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+
+async def start():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter()
+
+ready = asyncio.run(start())
+sys.stdout.write(orjson.dumps({
+    "import_ms": (imported - started) * 1000,
+    "ready_ms": (ready - started) * 1000,
+    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "modules": len(sys.modules)
+}).decode())
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    env = {**os.environ, "DB_BACKEND": os.environ.get("DB_BACKEND", "memory"), "LOG_LEVEL": "ERROR"}
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, "-c", CHILD], cwd=backend_dir, env=env, capture_output=True, check=True).stdout
+        results.append(orjson.loads(output))
+
+    for key in ("import_ms", "ready_ms", "maxrss_mb", "modules"):
+        print(f"{key:<10} {statistics.median(result[key] for result in results):10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""ストレージエンジンごとのDB呼び出しのレイテンシ
+
+ハンドラが使う Repository のメソッドを、エンジンごとに同じ順番・同じデータで --repeat 回ずつ呼び、
+1回あたりのレイテンシの中央値と p95 を並べる (HTTPやキャッシュを通さない、エンジンだけの比較)。
+
+- sqlite:   組み込みSQLite (DB_BACKEND=sqlite。一時ファイルに作る)
+- memory:   メモリのスタンドイン。--latency でSupabaseまでの往復時間を足して、ネットワーク越しの代わりにする
+- supabase: 本物のSupabase (.env の SUPABASE_URL / SUPABASE_KEY。bench_storage_* のユーザーとデータを作る)
+
+    cd backend
+    python -m benchmarks.bench_storage --engines sqlite memory --latency 20 --schedules 1000 --repeat 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import config
+from db import QueryRunner, Repository
+from scheduling import wake_up_time
+
+
+def open_engine(name: str, args) -> Repository:
+    runner = QueryRunner(pool_size=config.db_pool_size, timeout=config.db_timeout)
+    if name == "sqlite":
+        from sqlite_backend import SqliteClient, SqliteRepository
+        return SqliteRepository(SqliteClient(os.path.join(tempfile.mkdtemp(), "bench.sqlite3"), config.sqlite_synchronous), runner)
+    if name == "memory":
+        from memory_backend import MemoryClient
+        return Repository(MemoryClient(latency_ms=args.latency), runner)
+    from supabase import create_client
+    return Repository(create_client(config.supabase_url, config.supabase_key), runner)
+
+
+async def seed(repo: Repository, args) -> dict:
+    # 1人分のユーザー・プラン・予定を入れる
+    user = (await repo.insert_user(f"bench_storage_{uuid.uuid4().hex[:8]}", "x"))[0]
+    steps = [{"step_name": f"step{index}", "step_time": 5} for index in range(5)]
+    plan_ids = await repo.create_plans_bulk([{"user_id": user["user_id"], "plan_name": f"plan{number}", "steps": steps} for number in range(10)])
+    _, wake_up = wake_up_time("08:00:00", 25)
+    days = [f"{2025 + index // 336}-{index // 28 % 12 + 1:02d}-{index % 28 + 1:02d}" for index in range(args.schedules)]
+    rows = []
+    for start in range(0, len(days), 500):
+        rows += await repo.insert_schedules([{
+            "date": day, "departure_time": "08:00:00", "wake_up_time": wake_up, "plan_id": plan_ids[index % len(plan_ids)], "user_id": user["user_id"]
+        } for index, day in enumerate(days[start:start + 500])])
+    return {"user": user, "plan_ids": plan_ids, "schedule_ids": [row["schedule_id"] for row in rows], "days": days}
+
+
+def operations(data: dict) -> list:
+    user_id = data["user"]["user_id"]
+    user_name = data["user"]["user_name"]
+    plan_id = data["plan_ids"][0]
+    schedule_id = data["schedule_ids"][len(data["schedule_ids"]) // 2]
+    middle = data["days"][len(data["days"]) // 2]
+    steps = [{"step_name": "歯磨き", "step_time": 5}, {"step_name": "朝食", "step_time": 15}]
+    columns = "schedule_id, date, departure_time, wake_up_time, plan_id"
+    # (名前, 1回分の呼び出し)
+    return [
+        ("get_user_by_name", lambda repo: repo.get_user_by_name(user_name, "user_id, user_name, password")),
+        ("get_plan", lambda repo: repo.get_plan(plan_id, "plan_id, plan_name, total_minutes")),
+        ("get_steps", lambda repo: repo.get_steps(plan_id, "step_name, step_time, process_order, start_offset")),
+        ("get_plans_by_user", lambda repo: repo.get_plans_by_user(user_id)),
+        ("list_schedules", lambda repo: repo.list_schedules(user_id, columns, None, None, [middle, schedule_id], 101)),
+        ("get_schedule_full", lambda repo: repo.get_schedule_full(schedule_id)),
+        ("get_next_schedule", lambda repo: repo.get_next_schedule(user_id, middle, "07:00:00", columns)),
+        ("list_changes", lambda repo: repo.list_changes(user_id, 0, 501)),
+        ("create_plan", lambda repo: repo.create_plan(user_id, "bench", steps)),
+        ("insert_schedule", lambda repo: repo.insert_schedule({"date": middle, "departure_time": "09:00:00", "wake_up_time": "08:40:00", "plan_id": plan_id, "user_id": user_id})),
+    ]
+
+
+async def measure(repo: Repository, call, repeat: int) -> tuple:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await call(repo)
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95)]
+
+
+async def run(args):
+    results = {}
+    for engine in args.engines:
+        repo = open_engine(engine, args)
+        try:
+            data = await seed(repo, args)
+            for name, call in operations(data):
+                results[(engine, name)] = await measure(repo, call, args.repeat)
+        finally:
+            repo.close()
+
+    print(f"{'(ms)':<20}" + "".join(f" {engine + ' p50':>14} {engine + ' p95':>14}" for engine in args.engines))
+    for name, _ in operations({"user": {"user_id": 0, "user_name": ""}, "plan_ids": [0], "schedule_ids": [0], "days": [""]}):
+        print(f"{name:<20}" + "".join(f" {results[(engine, name)][0] * 1000:>14.3f} {results[(engine, name)][1] * 1000:>14.3f}" for engine in args.engines))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=["sqlite", "memory", "supabase"], default=["sqlite", "memory"])
+    parser.add_argument("--latency", type=float, default=20, help="memory の1往復に足すミリ秒 (Supabaseまでの往復の代わり)")
+    parser.add_argument("--schedules", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""差分同期 (GET /sync) と一覧の全件取得の比較
+
+DB_BACKEND=memory に1人分のプランと予定を入れて、画面を開き直すたびに行う読み込みを比べる。
+
+- lists:        GET /user/{id}/plans + GET /schedules/user/{id}?limit=500 (今の画面と同じ全件取得)
+- sync (none):  前回の since で GET /sync (変更なし)
+- sync (one):   予定を1件登録した後の GET /sync
+- sync (full):  since なしの GET /sync (初回の全件同期)
+
+それぞれのレスポンスの合計バイト数と、1回あたりのレイテンシの中央値・p95、DBの往復回数を出す。
+MEMORY_LATENCY_MS で1往復ごとの遅延を足すと、Supabaseに近い条件で比べられる。
+
+    cd backend
+    MEMORY_LATENCY_MS=5 python -m benchmarks.bench_sync --plans 20 --schedules 300 --repeat 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# 変更をすぐに確定扱いにする (ベンチマークの中で since を進めるため)
+os.environ.setdefault("SYNC_SETTLE_SECONDS", "0")
+
+
+async def measure(name: str, once, repeat: int, calls, before=None):
+    # once() (1回分の読み込み。受け取ったバイト数を返す) を repeat 回測る
+    latencies = []
+    for _ in range(repeat):
+        if before is not None:
+            await before()
+        started_calls = calls()
+        started = time.perf_counter()
+        size = await once()
+        latencies.append(time.perf_counter() - started)
+        round_trips = calls() - started_calls
+    latencies.sort()
+    print(f"{name:<14} {size:>9} {statistics.median(latencies) * 1000:>9.2f} {latencies[int(len(latencies) * 0.95)] * 1000:>9.2f} {round_trips:>6}")
+
+
+async def get(client, url: str, params: dict = None):
+    response = await client.get(url, params=params)
+    response.raise_for_status()
+    return response
+
+
+async def run(args):
+    import httpx
+
+    from app import app
+    from resources import resources
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        registered = (await client.post("/register", json={"username": "sync_bench", "password": "password"})).json()
+        user_id = registered["user_id"]
+        client.headers["Authorization"] = f"Bearer {registered['token']}"
+        plans = [{
+            "user_id": user_id,
+            "plan_name": f"plan{number}",
+            "steps": [{"step_name": f"step{step}", "step_time": 5} for step in range(5)]
+        } for number in range(args.plans)]
+        plan_ids = (await client.post("/plans/bulk", json=plans)).json()["plan_ids"]
+        await client.post("/register_schedule/batch", json={
+            "user_id": str(user_id),
+            "entries": [{"date": f"2025-{index // 28 % 12 + 1:02d}-{index % 28 + 1:02d}", "departure_time": "08:00:00", "plan_id": str(plan_ids[index % len(plan_ids)])} for index in range(args.schedules)]
+        })
+
+        async def full_sync():
+            # since なしから more=false になるまで読む
+            size, since = 0, None
+            while True:
+                response = await get(client, "/sync", {"since": since} if since else None)
+                size += len(response.content)
+                page = response.json()
+                since = page["since"]
+                if not page["more"]:
+                    return size, since
+
+        _, since = await full_sync()
+        state = {"since": since}
+
+        async def lists():
+            plans = await get(client, f"/user/{user_id}/plans")
+            schedules = await get(client, f"/schedules/user/{user_id}", {"limit": 500})
+            return len(plans.content) + len(schedules.content)
+
+        async def sync_since(token):
+            response = await get(client, "/sync", {"since": token})
+            state["since"] = response.json()["since"]
+            return len(response.content)
+
+        async def add_schedule():
+            # 1件登録する (sync (one) は、その1件だけを受け取る)
+            state["added"] = state.get("added", 0) + 1
+            await client.post("/register_schedule", json={"user_id": str(user_id), "date": "2026-01-01", "departure_time": f"08:{state['added'] % 60:02d}:00", "plan_id": str(plan_ids[0])})
+
+        def calls():
+            return resources.db.client.calls
+
+        print(f"{'':<14} {'bytes':>9} {'p50 ms':>9} {'p95 ms':>9} {'DB往復':>6}")
+        await measure("lists", lists, args.repeat, calls)
+        await measure("sync (none)", lambda: sync_since(since), args.repeat, calls)
+        await measure("sync (one)", lambda: sync_since(state["since"]), args.repeat, calls, before=add_schedule)
+
+        async def full_size():
+            return (await full_sync())[0]
+
+        await measure("sync (full)", full_size, args.repeat, calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--schedules", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""起床時間計算のマイクロベンチマーク
+
+変更前の calculate_wake_up_time (strptime + 工程ごとにtimedeltaを引く) と、
+合計分数を使った整数演算版 / numpyによる一括計算版を比べる。
+
+    cd backend
+    python -m benchmarks.bench_wake_up --pairs 10000 --steps 10
+"""
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from scheduling import total_minutes, wake_up_time, wake_up_times_batch
+
+
+def legacy_calculate_wake_up_time(departure_time: str, steps: list) -> str:
+    departure_dt = datetime.strptime(departure_time, '%H:%M:%S')
+    for step in sorted(steps, key=lambda x: x['process_order'], reverse=True):
+        departure_dt -= timedelta(minutes=step['step_time'])
+    return departure_dt.strftime('%H:%M:%S')
+
+
+def timed(name: str, func, count: int):
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {elapsed * 1000:10.2f} ms {elapsed / count * 1e6:10.3f} us/pair")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=10000)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--plans", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    plans = [[{"step_name": f"step-{order}", "step_time": rng.randint(1, 30), "process_order": order + 1} for order in range(args.steps)] for _ in range(args.plans)]
+    totals = [total_minutes(steps) for steps in plans]
+    pairs = [(f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00", rng.randrange(args.plans)) for _ in range(args.pairs)]
+
+    # numpyの読み込みを計測に含めないように一度呼んでおく
+    wake_up_times_batch(["00:00:00"], [0])
+
+    legacy = timed("legacy", lambda: [legacy_calculate_wake_up_time(departure, plans[plan]) for departure, plan in pairs], args.pairs)
+    scalar = timed("scalar", lambda: [wake_up_time(departure, totals[plan])[1] for departure, plan in pairs], args.pairs)
+    batch, _ = timed("batch", lambda: wake_up_times_batch([departure for departure, _ in pairs], [totals[plan] for _, plan in pairs]), args.pairs)
+
+    assert legacy == scalar == batch, "results differ"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""ワーカー数ごとのスループット比較
+
+server.py をワーカー数を変えて起動し (DB_BACKEND=memory + MEMORY_SEED_USERS)、それぞれに
+load_test --url で同じ負荷をかけて、全体のスループットと p50/p95/p99 を並べる。
+負荷をかける側も1プロセスなので、コア数が少ないマシンではその分も差し引いて読むこと。
+ワーカーを2つ以上にするには、server.py と同じく PLAN_CACHE_BACKEND=redis (と動いているRedis) が必要。
+
+    cd backend
+    PLAN_CACHE_BACKEND=redis REDIS_URL=redis://localhost:6379/0 python -m benchmarks.bench_workers --workers 1 2 4 --requests 5000
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import orjson
+
+
+def wait_ready(url: str, timeout: float = 30):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/readyz", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not become ready")
+
+
+def run_once(workers: int, args, backend_dir: str) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    env = {
+        **os.environ,
+        "DB_BACKEND": "memory",
+        "MEMORY_SEED_USERS": str(args.users),
+        "BCRYPT_ROUNDS": os.environ.get("BCRYPT_ROUNDS", "4"),
+        "LOG_LEVEL": "WARNING",
+        "RATE_LIMIT_ENABLED": "0"
+    }
+    server = subprocess.Popen([sys.executable, "server.py", "--workers", str(workers), "--port", str(args.port)], cwd=backend_dir, env=env)
+    try:
+        wait_ready(url)
+        # 全ワーカーが起動し終わるのを少し待つ
+        time.sleep(1)
+        with tempfile.NamedTemporaryFile(suffix=".json") as output:
+            subprocess.run([
+                sys.executable, "-m", "benchmarks.load_test",
+                "--url", url,
+                "--scenario", args.scenario,
+                "--concurrency", str(args.concurrency),
+                "--requests", str(args.requests),
+                "--users", str(args.users),
+                "--save", output.name
+            ], cwd=backend_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+            return orjson.loads(output.read())["total"]
+    finally:
+        # SIGTERMで止める (処理中のリクエストを終えてから終了する)
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenario", default="mixed")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{'workers':>7} {'errors':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for workers in args.workers:
+        total = run_once(workers, args, backend_dir)
+        print(f"{workers:>7} {total['errors']:>6} {total['rps']:>9.1f} {total['p50_ms']:>8.2f} {total['p95_ms']:>8.2f} {total['p99_ms']:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""予定の登録の、その場での書き込みと書き込みの後回し (WRITE_BEHIND) の比較
+
+DB_BACKEND=memory で --clients 人が同時に --requests 件ずつ POST /register_schedule を送り、
+返事が返るまでのレイテンシの中央値・p95と、全件がDBに書き込まれるまでのDBの往復回数を出す。
+
+- direct:       今まで通り、1件ごとにinsertしてから返事をする
+- write-behind: journal (SQLite) に書いた時点で仮のIDを返し、バックグラウンドで複数行insertにまとめて書く
+
+MEMORY_LATENCY_MS で1往復ごとの遅延を足すと、Supabaseに近い条件で比べられる。
+
+    cd backend
+    MEMORY_LATENCY_MS=20 python -m benchmarks.bench_write_behind --clients 10 --requests 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("JOURNAL_PATH", os.path.join(tempfile.mkdtemp(), "journal.sqlite3"))
+
+
+async def measure(name: str, client, args, plan_id, user_id, calls, journal):
+    latencies = []
+
+    async def one_client(number: int):
+        for index in range(args.requests):
+            started = time.perf_counter()
+            response = await client.post("/register_schedule", json={
+                "user_id": str(user_id),
+                "date": f"2026-{index % 12 + 1:02d}-{number % 28 + 1:02d}",
+                "departure_time": "08:00:00",
+                "plan_id": str(plan_id)
+            })
+            latencies.append(time.perf_counter() - started)
+            response.raise_for_status()
+
+    started_calls = calls()
+    started = time.perf_counter()
+    await asyncio.gather(*(one_client(number) for number in range(args.clients)))
+    accepted = time.perf_counter() - started
+    # 後回しにした分が全部書き込まれるまで待つ
+    await journal.settle(user_id)
+    written = time.perf_counter() - started
+    total = args.clients * args.requests
+    latencies.sort()
+    print(f"{name:<13} {statistics.median(latencies) * 1000:>9.2f} {latencies[int(len(latencies) * 0.95)] * 1000:>9.2f} {total / accepted:>9.0f} {written:>9.2f} {calls() - started_calls:>7}")
+
+
+async def run(args):
+    import httpx
+
+    from app import app
+    from resources import resources
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        registered = (await client.post("/register", json={"username": "write_behind_bench", "password": "password"})).json()
+        user_id = registered["user_id"]
+        plan_id = (await client.post("/plans/", json={
+            "user_id": user_id,
+            "plan_name": "bench",
+            "steps": [{"step_name": f"step{step}", "step_time": 5} for step in range(5)]
+        })).json()["plan_id"]
+        # プランをキャッシュに載せておく
+        await client.get(f"/plans/{plan_id}")
+
+        def calls():
+            return resources.db.client.calls
+
+        journal = resources.journal
+        print(f"{'':<13} {'p50 ms':>9} {'p95 ms':>9} {'req/s':>9} {'書込完了s':>9} {'DB往復':>7}")
+        journal.write_behind = False
+        await measure("direct", client, args, plan_id, user_id, calls, journal)
+        journal.write_behind = True
+        await measure("write-behind", client, args, plan_id, user_id, calls, journal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
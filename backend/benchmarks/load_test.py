@@ -0,0 +1,286 @@
+"""APIの負荷試験・レイテンシ計測
+
+FastAPIの app をプロセス内で起動し (DB_BACKEND=memory のスタンドインを使うのでSupabaseは不要)、
+ログイン集中・プラン作成・予定一覧などのリクエストを指定した並列度で流して、
+エンドポイントごとのスループットと p50/p95/p99 を表示する。
+
+    cd backend
+    python -m benchmarks.load_test --scenario mixed --concurrency 32 --requests 5000
+    python -m benchmarks.load_test --scenario mixed --save benchmarks/baseline.json
+    python -m benchmarks.load_test --scenario mixed --compare benchmarks/baseline.json --threshold 0.2
+
+--url を付けると、起動済みのサーバー (server.py) にHTTPで負荷をかける。ワーカーごとにメモリが別なので、
+サーバーは DB_BACKEND=memory MEMORY_SEED_USERS=<--users> で起動して、全ワーカーに同じデータを入れておく。
+ワーカーを2つ以上にするには PLAN_CACHE_BACKEND=redis (と動いているRedis) が必要 (無ければ server.py が起動しない)。
+
+    DB_BACKEND=memory MEMORY_SEED_USERS=20 BCRYPT_ROUNDS=4 PLAN_CACHE_BACKEND=redis REDIS_URL=redis://localhost:6379/0 python server.py --workers 2
+    python -m benchmarks.load_test --url http://127.0.0.1:8000
+
+--compare では、どれかのエンドポイントの p95 が基準より threshold 以上遅くなるか、
+スループットが threshold 以上落ちたら終了コード1で終わる。
+"""
+import argparse
+import asyncio
+import logging
+import math
+import os
+import random
+import sys
+import time
+
+import orjson
+
+# app を読み込む前に、メモリバックエンドと軽いbcryptコストを設定しておく
+os.environ.setdefault("DB_BACKEND", "memory")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# 1つの接続元から大量に送るので、レート制限は切っておく
+os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+# httpx はリクエストごとにINFOのログを出す。計測中のループでログを書くとその分 p95 がぶれるので止める
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+PASSWORD = "password"
+
+
+# ----- リクエストの種類 -----
+async def login(client, rng, data):
+    user = rng.choice(data["users"])
+    return "POST /login", await client.post("/login", json={"username": user["user_name"], "password": PASSWORD})
+
+
+async def create_plan(client, rng, data):
+    user = rng.choice(data["users"])
+    steps = [{"step_name": name, "step_time": rng.randint(1, 20)} for name in rng.sample(STEP_NAMES, rng.randint(3, 10))]
+    return "POST /plans/", await client.post("/plans/", json={"user_id": user["user_id"], "plan_name": "朝の準備", "steps": steps})
+
+
+async def get_plan(client, rng, data):
+    plan_id = rng.choice(data["plan_ids"])
+    return "GET /plans/{plan_id}", await client.get(f"/plans/{plan_id}")
+
+
+async def list_plans(client, rng, data):
+    user = rng.choice(data["users"])
+    return "GET /user/{user_id}/plans", await client.get(f"/user/{user['user_id']}/plans")
+
+
+async def list_schedules(client, rng, data):
+    user = rng.choice(data["users"])
+    return "GET /schedules/user/{user_id}", await client.get(f"/schedules/user/{user['user_id']}")
+
+
+async def schedule_full(client, rng, data):
+    schedule_id = rng.choice(data["schedule_ids"])
+    return "GET /schedule/{schedule_id}/full", await client.get(f"/schedule/{schedule_id}/full")
+
+
+async def register_schedule(client, rng, data):
+    user = rng.choice(data["users"])
+    return "POST /register_schedule", await client.post("/register_schedule", json={
+        "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "departure_time": f"{rng.randint(6, 9):02d}:{rng.choice(['00', '15', '30', '45'])}:00",
+        "plan_id": str(rng.choice(data["plan_ids"])),
+        "user_id": str(user["user_id"])
+    })
+
+
+STEP_NAMES = ["歯磨き", "朝食", "着替え", "洗顔", "髪を整える", "弁当を作る", "ゴミ出し", "化粧", "シャワー", "持ち物の確認"]
+
+# シナリオ = (リクエストの種類, 重み) のリスト
+SCENARIOS = {
+    "login": [(login, 1)],
+    "plans": [(create_plan, 1), (get_plan, 3)],
+    "schedules": [(list_schedules, 3), (schedule_full, 2), (register_schedule, 1)],
+    "mixed": [(login, 1), (create_plan, 1), (get_plan, 4), (list_plans, 2), (list_schedules, 4), (schedule_full, 3), (register_schedule, 1)],
+}
+
+
+async def seed(client, users: int, plans_per_user: int, schedules_per_user: int) -> dict:
+    # APIを通して初期データを入れる
+    data = {"users": [], "plan_ids": [], "schedule_ids": []}
+    rng = random.Random(1)
+    for index in range(users):
+        name = f"user{index}"
+        response = await client.post("/register", json={"username": name, "password": PASSWORD})
+        response.raise_for_status()
+        user = (await client.post("/login", json={"username": name, "password": PASSWORD})).json()
+        data["users"].append(user)
+
+        response = await client.post("/plans/bulk", json=[{
+            "user_id": user["user_id"],
+            "plan_name": f"plan{number}",
+            "steps": [{"step_name": step, "step_time": rng.randint(1, 20)} for step in rng.sample(STEP_NAMES, 5)]
+        } for number in range(plans_per_user)])
+        response.raise_for_status()
+        plan_ids = response.json()["plan_ids"]
+        data["plan_ids"].extend(plan_ids)
+
+        response = await client.post("/register_schedule/batch", json={
+            "user_id": str(user["user_id"]),
+            "entries": [{
+                "date": f"2025-{month:02d}-{day:02d}",
+                "departure_time": "08:15:00",
+                "plan_id": str(rng.choice(plan_ids))
+            } for month in range(1, 13) for day in range(1, 29)][:schedules_per_user]
+        })
+        response.raise_for_status()
+        data["schedule_ids"].extend(response.json()["schedule_ids"])
+    return data
+
+
+async def discover(client, users: int) -> dict:
+    # MEMORY_SEED_USERS で入れたデータのIDを読み込みだけで集める (どのワーカーに当たっても同じ結果になる)
+    data = {"users": [], "plan_ids": [], "schedule_ids": []}
+    for index in range(users):
+        response = await client.post("/login", json={"username": f"user{index}", "password": PASSWORD})
+        response.raise_for_status()
+        user = response.json()
+        data["users"].append(user)
+        plans = (await client.get(f"/user/{user['user_id']}/plans")).json()
+        data["plan_ids"].extend(plan["plan_id"] for plan in plans)
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}", params={"limit": 500})).json()
+        data["schedule_ids"].extend(schedule["schedule_id"] for schedule in schedules)
+    return data
+
+
+def percentile(sorted_values: list, ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(math.ceil(ratio * len(sorted_values)) - 1, 0)]
+
+
+def summarize(latencies: dict, errors: dict, elapsed: float) -> dict:
+    endpoints = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors.get(name, 0),
+            "rps": round(len(values) / elapsed, 1),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 2)
+        }
+    every = sorted(value for values in latencies.values() for value in values)
+    total = {
+        "count": len(every),
+        "errors": sum(errors.values()),
+        "rps": round(len(every) / elapsed, 1),
+        "p50_ms": round(percentile(every, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(every, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(every, 0.99) * 1000, 2)
+    }
+    return {"endpoints": endpoints, "total": total}
+
+
+def print_report(report: dict):
+    print(f"{'endpoint':<34} {'count':>7} {'errors':>6} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, row in list(report["endpoints"].items()) + [("TOTAL", report["total"])]:
+        print(f"{name:<34} {row['count']:>7} {row['errors']:>6} {row['rps']:>9.1f} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['p99_ms']:>8.2f}")
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list:
+    # 基準より悪くなったエンドポイントの説明を返す
+    regressions = []
+    for name, base in baseline["endpoints"].items():
+        current = report["endpoints"].get(name)
+        if current is None:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + threshold):
+            regressions.append(f"{name}: p95 {base['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current["rps"] < base["rps"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {base['rps']} rps -> {current['rps']} rps")
+    return regressions
+
+
+async def run(args) -> dict:
+    import httpx
+
+    if args.url:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+            data = await discover(client, args.users)
+            report = await drive(client, data, args)
+    else:
+        from app import app
+
+        # ASGITransport は lifespan を送らないので、共有リソースはここで開く
+        transport = httpx.ASGITransport(app=app)
+        async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            data = await seed(client, args.users, args.plans_per_user, args.schedules_per_user)
+            report = await drive(client, data, args)
+
+    report["config"] = {
+        "scenario": args.scenario,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "users": args.users,
+        "url": args.url,
+        "memory_latency_ms": float(os.environ.get("MEMORY_LATENCY_MS", "0")),
+        "bcrypt_rounds": int(os.environ["BCRYPT_ROUNDS"]),
+        "metrics_enabled": os.environ.get("METRICS_ENABLED", "1") != "0"
+    }
+    return report
+
+
+async def drive(client, data: dict, args) -> dict:
+    # シナリオの重みに従ってリクエストを args.requests 回、args.concurrency 並列で送る
+    operations, weights = zip(*SCENARIOS[args.scenario])
+    latencies = {}
+    errors = {}
+    remaining = args.requests
+
+    async def worker(seed_value: int):
+        nonlocal remaining
+        rng = random.Random(seed_value)
+        while remaining > 0:
+            remaining -= 1
+            operation = rng.choices(operations, weights)[0]
+            started = time.perf_counter()
+            name, response = await operation(client, rng, data)
+            latencies.setdefault(name, []).append(time.perf_counter() - started)
+            if response.status_code >= 500:
+                errors[name] = errors.get(name, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(index) for index in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return summarize(latencies, errors, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--plans-per-user", type=int, default=5)
+    parser.add_argument("--schedules-per-user", type=int, default=60)
+    parser.add_argument("--save", help="結果をJSONで保存するパス")
+    parser.add_argument("--compare", help="比較する基準のJSON")
+    parser.add_argument("--url", help="起動済みのサーバーのURL (省略時はプロセス内でappを動かす)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="許容する悪化の割合 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.save:
+        with open(args.save, "wb") as file:
+            file.write(orjson.dumps(report, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS))
+        print(f"saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare, "rb") as file:
+            baseline = orjson.loads(file.read())
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print("regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"no regressions beyond {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import orjson
+
+import config
+from plan_store import PlanStore
+from scheduling import step_offsets, total_minutes
+
+# プランのリードスルーキャッシュ
+# プランの工程は create_plan の後ほとんど変わらないのに、/plans/{plan_id} や register_schedule の
+# たびに plan_reg と process を読み直していたので、plan_id をキーにして
+#   {"plan_id", "plan_name", "steps" (process_order昇順), "offsets", "total_minutes"}
+# をまとめてキャッシュする。保存先は差し替えられる (プロセス内 / 列に詰めたプロセス内 / Redisプロトコルのサーバ)。
+
+
+class LocalCacheBackend:
+    # プロセス内のLRU + TTLキャッシュ
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.evictions = 0
+
+    async def get(self, key: str):
+        item = self.entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value):
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        self.entries.pop(key, None)
+
+    def size(self) -> int:
+        return len(self.entries)
+
+    def memory(self) -> int:
+        # dict のまま持つので測らない (bench_plan_store で比べられる)
+        return -1
+
+    async def close(self):
+        pass
+
+
+class CompactCacheBackend:
+    # プロセス内に、工程を array に詰めて持つ (plan_store.PlanStore)。1ワーカーで100万プランを持てる大きさ
+    def __init__(self, max_size: int, ttl: float):
+        self.store = PlanStore(capacity=max_size, ttl=ttl)
+
+    @property
+    def evictions(self) -> int:
+        return self.store.evictions
+
+    async def get(self, key: str):
+        return self.store.get(key)
+
+    async def set(self, key: str, value):
+        self.store.put(key, value)
+
+    async def delete(self, key: str):
+        self.store.delete(key)
+
+    def size(self) -> int:
+        return len(self.store)
+
+    def memory(self) -> int:
+        return self.store.memory()
+
+    async def close(self):
+        pass
+
+
+class RedisConnection:
+    # Redisプロトコル(RESP)を話すサーバへの最小限の非同期クライアント
+    # 1本の接続を使い回し、コマンドは順番に送る。切れたら次のコマンドでつなぎ直す
+    def __init__(self, url: str):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.database = int(parsed.path.lstrip("/") or 0)
+        self.reader = None
+        self.writer = None
+        self.lock = asyncio.Lock()
+
+    async def _connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._send("AUTH", self.password)
+        if self.database:
+            await self._send("SELECT", str(self.database))
+
+    async def _send(self, *args):
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+            payload.append(b"$%d\r\n%s\r\n" % (len(data), data))
+        self.writer.write(b"".join(payload))
+        await self.writer.drain()
+        return await self._read_reply()
+
+    async def _read_reply(self):
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionError("Redis connection closed")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body
+        if kind == b"-":
+            raise Exception(body.decode('utf-8'))
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            if length < 0:
+                return None
+            return (await self.reader.readexactly(length + 2))[:-2]
+        if kind == b"*":
+            return [await self._read_reply() for _ in range(int(body))]
+        raise Exception(f"Unexpected Redis reply: {line!r}")
+
+    async def command(self, *args):
+        async with self.lock:
+            try:
+                if self.writer is None:
+                    await self._connect()
+                return await self._send(*args)
+            except Exception:
+                # 次の呼び出しでつなぎ直す
+                await self.close()
+                raise
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = None
+        self.writer = None
+
+
+class RedisCacheBackend:
+    # Redisプロトコルのサーバに保存する。複数のuvicornワーカーで同じキャッシュを共有できる
+    # 追い出しはサーバ側 (maxmemory-policy) に任せ、TTLは SET ... EX で付ける
+    def __init__(self, url: str, ttl: float, prefix: str = "plan:"):
+        self.redis = RedisConnection(url)
+        self.ttl = max(int(ttl), 1)
+        self.prefix = prefix
+        self.evictions = 0
+
+    async def get(self, key: str):
+        data = await self.redis.command("GET", self.prefix + key)
+        return None if data is None else orjson.loads(data)
+
+    async def set(self, key: str, value):
+        await self.redis.command("SET", self.prefix + key, orjson.dumps(value), "EX", self.ttl)
+
+    async def delete(self, key: str):
+        await self.redis.command("DEL", self.prefix + key)
+
+    def size(self) -> int:
+        # 共有キャッシュの件数はサーバ側でしか分からない
+        return -1
+
+    def memory(self) -> int:
+        return -1
+
+    async def close(self):
+        await self.redis.close()
+
+
+def build_plan_entry(plan: dict, steps: list) -> dict:
+    # total_minutes / start_offset は書き込み時に保存した値を使い、無い行(古いデータ)だけここで計算する
+    steps = sorted(steps, key=lambda step: step["process_order"])
+    offsets = [step.get("start_offset") for step in steps]
+    if None in offsets:
+        offsets = step_offsets(steps)
+    total = plan.get("total_minutes")
+    if total is None:
+        total = total_minutes(steps)
+    return {
+        "plan_id": plan["plan_id"],
+        "plan_name": plan["plan_name"],
+        "steps": [{"step_name": step["step_name"], "step_time": step["step_time"], "process_order": step["process_order"]} for step in steps],
+        # offsets[i] = 起床から steps[i] を始めるまでの分数
+        "offsets": offsets,
+        "total_minutes": total
+    }
+
+
+class PlanCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get_plan(self, plan_id, loader):
+        # キャッシュに無ければ loader(plan_id) で読み込んで保存する
+        # キャッシュの障害ではリクエストを失敗させず、DBから読んだ値を返す
+        key = str(plan_id)
+        try:
+            entry = await self.backend.get(key)
+        except Exception as e:
+            logging.warning("Plan cache get failed: %s", e)
+            entry = None
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = await loader(plan_id)
+        if entry is not None:
+            try:
+                await self.backend.set(key, entry)
+            except Exception as e:
+                logging.warning("Plan cache set failed: %s", e)
+        return entry
+
+    async def invalidate(self, plan_id):
+        try:
+            await self.backend.delete(str(plan_id))
+        except Exception as e:
+            logging.warning("Plan cache invalidate failed: %s", e)
+
+    def stats(self) -> dict:
+        size = self.backend.size()
+        memory = self.backend.memory()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.backend.evictions,
+            "size": size,
+            # 測れない保存先では -1
+            "bytes": memory,
+            "bytes_per_plan": memory // size if memory >= 0 and size > 0 else -1
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+def create_plan_cache() -> PlanCache:
+    if config.plan_cache_backend == "redis":
+        backend = RedisCacheBackend(config.redis_url, ttl=config.plan_cache_ttl)
+    elif config.plan_cache_backend == "compact":
+        backend = CompactCacheBackend(max_size=config.plan_cache_size, ttl=config.plan_cache_ttl)
+    else:
+        backend = LocalCacheBackend(max_size=config.plan_cache_size, ttl=config.plan_cache_ttl)
+    return PlanCache(backend)
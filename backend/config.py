@@ -0,0 +1,141 @@
+from dotenv import load_dotenv
+import os
+
+# 環境変数の読み込み
+# .envファイルのパスを指定
+env_file_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+load_dotenv(dotenv_path=env_file_path)
+
+# Supabaseクライアントの設定
+supabase_url: str = os.getenv("SUPABASE_URL")
+supabase_key: str = os.getenv("SUPABASE_KEY")
+
+# データアクセス層の設定
+# DB_BACKEND: "supabase" (本番)、"sqlite" (1台で動かすときの組み込みDB) または "memory" (負荷試験・ローカル用のスタンドイン)
+db_backend: str = os.getenv("DB_BACKEND", "supabase")
+# Supabase呼び出しを逃がすスレッドプールのサイズ (= 同時に張れるHTTP接続数の上限)
+db_pool_size: int = int(os.getenv("DB_POOL_SIZE", "16"))
+# 1回のexecute()に許す最大秒数
+db_timeout: float = float(os.getenv("DB_TIMEOUT", "5.0"))
+# SQLiteのファイル (同じホストのワーカーで共有する) と、コミットごとにディスクへ同期する度合い (off / normal / full)
+sqlite_path: str = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.sqlite3"))
+sqlite_synchronous: str = os.getenv("SQLITE_SYNCHRONOUS", "normal")
+# メモリバックエンドで1回の呼び出しに足す疑似レイテンシ(ミリ秒)
+memory_latency_ms: float = float(os.getenv("MEMORY_LATENCY_MS", "0"))
+# メモリバックエンドの起動時に入れておく負荷試験用のユーザー数 (user0... / パスワードは "password")
+memory_seed_users: int = int(os.getenv("MEMORY_SEED_USERS", "0"))
+
+# パスワードハッシュの設定
+# BCRYPT_ROUNDS: bcryptのコスト。変更するとログイン成功時に古いハッシュを自動で作り直す
+bcrypt_rounds: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# ハッシュ計算用プロセス数 (0ならCPUコア数)
+bcrypt_workers: int = int(os.getenv("BCRYPT_WORKERS", "0"))
+# 実行中 + 待ち中のハッシュ計算がこの数を超えたら503を返す
+bcrypt_queue_limit: int = int(os.getenv("BCRYPT_QUEUE_LIMIT", "64"))
+
+# プランキャッシュの設定
+# PLAN_CACHE_BACKEND: "local" (ワーカーごとのメモリ)、"compact" (ワーカーごとのメモリに列に詰めて持つ) または "redis" (ワーカー間で共有)
+plan_cache_backend: str = os.getenv("PLAN_CACHE_BACKEND", "local")
+# local / compact のときに保持するプラン数の上限 (超えたら最も古く使われたものから追い出す。compact は近似)
+plan_cache_size: int = int(os.getenv("PLAN_CACHE_SIZE", "1024"))
+# キャッシュの有効期限(秒)
+plan_cache_ttl: float = float(os.getenv("PLAN_CACHE_TTL", "300"))
+redis_url: str = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# HTTPキャッシュ (ETag) の設定
+# 0ならブラウザは毎回 If-None-Match で確認する。正の値ならその秒数は確認なしで使い回す
+http_cache_max_age: int = int(os.getenv("HTTP_CACHE_MAX_AGE", "0"))
+
+# 計測の設定 (0にすると /metrics 用の記録をすべて止める)
+metrics_enabled: bool = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# ログの設定
+# LOG_LEVEL: 出力する最低レベル。LOG_FORMAT: "json" (1行1JSON) または "text"
+log_level: str = os.getenv("LOG_LEVEL", "INFO").upper()
+log_format: str = os.getenv("LOG_FORMAT", "json")
+# DEBUGのログ (レスポンスの中身など量が多いもの) のうち実際に出す割合
+log_debug_sample: float = float(os.getenv("LOG_DEBUG_SAMPLE", "0.01"))
+
+# ログインセッションの設定
+# SESSION_SECRET: トークンの署名鍵。全ワーカーで同じ値にする (未設定ならプロセスごとに乱数)
+session_secret: str = os.getenv("SESSION_SECRET", "")
+# トークンの有効期限(秒)
+session_ttl: int = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+# ログアウトしたトークンを覚えておく数の上限 (local のとき)
+# トークンは期限 (SESSION_TTL) まで覚えておく必要があるので、SESSION_TTL の間のログアウト数より大きくする
+# 期限内のトークンでいっぱいになったら、/logout は503を返す (古いものを忘れて通してしまうことはしない)
+session_revocation_size: int = int(os.getenv("SESSION_REVOCATION_SIZE", "10000"))
+
+# レート制限の設定 (ratelimit.py)
+rate_limit_enabled: bool = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+# "回数/秒数" (0なら制限なし)。同じ利用者が1つのルートに続けて送れる数と、その回復のペース
+# auth: /login と /register、write: プラン・予定の登録、read: それ以外
+rate_limit_auth: str = os.getenv("RATE_LIMIT_AUTH", "10/60")
+rate_limit_write: str = os.getenv("RATE_LIMIT_WRITE", "60/60")
+rate_limit_read: str = os.getenv("RATE_LIMIT_READ", "600/60")
+# localのときに覚えておくバケット数の上限
+rate_limit_size: int = int(os.getenv("RATE_LIMIT_SIZE", "100000"))
+# 1ワーカーが同時に処理する auth / write のリクエスト数の上限。超えたら503 (0なら上限なし)
+concurrency_limit_auth: int = int(os.getenv("CONCURRENCY_LIMIT_AUTH", "32"))
+concurrency_limit_write: int = int(os.getenv("CONCURRENCY_LIMIT_WRITE", "64"))
+
+# ユーザー名のBloomフィルタの設定 (usernames.py)
+username_filter_enabled: bool = os.getenv("USERNAME_FILTER_ENABLED", "1") != "0"
+# この件数を入れたときに誤答 (無い名前を「あるかもしれない」と答える) の割合が USERNAME_FILTER_FP_RATE になる大きさで作る
+username_filter_capacity: int = int(os.getenv("USERNAME_FILTER_CAPACITY", "1000000"))
+username_filter_fp_rate: float = float(os.getenv("USERNAME_FILTER_FP_RATE", "0.001"))
+# 作り直すときに user_reg_log を1回に読む件数と、作り直す間隔(秒)
+username_filter_batch: int = int(os.getenv("USERNAME_FILTER_BATCH", "1000"))
+username_filter_rebuild: float = float(os.getenv("USERNAME_FILTER_REBUILD", "3600"))
+
+# 起床・工程開始のアラームの設定 (alarms.py)
+# 1ワーカーが持つアラーム数の上限と、接続ごとに溜めておくイベント数の上限
+alarm_max_pending: int = int(os.getenv("ALARM_MAX_PENDING", "100000"))
+alarm_queue_size: int = int(os.getenv("ALARM_QUEUE_SIZE", "64"))
+# 何時間先までの予定をアラームにするか
+alarm_horizon_hours: float = float(os.getenv("ALARM_HORIZON_HOURS", "24"))
+# 予定が書き換わっていないかを確かめる間隔(秒) / 書き換わっていなくても読み直す間隔(秒)
+alarm_refresh: float = float(os.getenv("ALARM_REFRESH", "30"))
+alarm_reload: float = float(os.getenv("ALARM_RELOAD", "3600"))
+# ストリームが途切れないように送る空のイベントの間隔(秒)
+alarm_keepalive: float = float(os.getenv("ALARM_KEEPALIVE", "15"))
+
+# 差分同期 (GET /sync) の設定
+# 1回に返す変更の数の上限 (超えたら more=true で続きを返す)
+sync_page_size: int = int(os.getenv("SYNC_PAGE_SIZE", "500"))
+# この秒数より新しい変更はまだ確定扱いにしない (次の since に含めず、次回もう一度返す)
+# version の採番と書き込みの確定の順番が入れ替わっても、取りこぼさないようにするため
+sync_settle_seconds: float = float(os.getenv("SYNC_SETTLE_SECONDS", "2"))
+
+# 書き込みの journal の設定 (journal.py)
+# Idempotency-Key の記録と、後回しにした書き込みを置くSQLiteファイル (空なら両方使わない)
+journal_path: str = os.getenv("JOURNAL_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "journal.sqlite3"))
+# 1にすると、プラン・予定の登録を journal に書いた時点で仮のIDを返し、Supabaseにはバックグラウンドでまとめて書く
+write_behind: bool = os.getenv("WRITE_BEHIND", "0") == "1"
+# 1回の複数行insertで書く件数の上限と、溜まった行を送る間隔(秒)
+journal_batch: int = int(os.getenv("JOURNAL_BATCH", "100"))
+journal_flush_interval: float = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "0.2"))
+# 送信に失敗した行を送り直す回数の上限と、送り直すまでの待ち時間の上限(秒)
+journal_max_attempts: int = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "10"))
+journal_retry_max: float = float(os.getenv("JOURNAL_RETRY_MAX", "300"))
+# 同じ Idempotency-Key の再送に前の結果を返す期間(秒)
+journal_retention: float = float(os.getenv("JOURNAL_RETENTION", str(24 * 3600)))
+# 同じユーザーの読み込みが、未送信の書き込みを待つ最大秒数
+journal_settle_timeout: float = float(os.getenv("JOURNAL_SETTLE_TIMEOUT", "5"))
+
+# 本番用の起動スクリプト (server.py) の設定
+server_host: str = os.getenv("SERVER_HOST", "0.0.0.0")
+server_port: int = int(os.getenv("SERVER_PORT", "8000"))
+# ワーカープロセス数 (0ならCPUコア数。PLAN_CACHE_BACKEND=redis でなければ1)。uvicorn / gunicorn と同じ環境変数名
+# 2以上にするには PLAN_CACHE_BACKEND=redis が必要 (ログアウトとETagのバージョンをワーカー間で共有するため)
+web_concurrency: int = int(os.getenv("WEB_CONCURRENCY", "0"))
+# 1ワーカーが同時に処理する接続・リクエスト数の上限。超えた分には503を返す (0なら上限なし)
+server_limit_concurrency: int = int(os.getenv("SERVER_LIMIT_CONCURRENCY", "0"))
+# accept待ちの接続キューの長さ
+server_backlog: int = int(os.getenv("SERVER_BACKLOG", "2048"))
+# keep-aliveの接続を次のリクエストを待って開けておく秒数
+server_keep_alive: int = int(os.getenv("SERVER_KEEP_ALIVE", "5"))
+# 停止時に処理中のリクエストが終わるのを待つ最大秒数
+server_graceful_timeout: int = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+# この数のリクエストを処理したらワーカーを入れ替える (0なら入れ替えない)
+server_max_requests: int = int(os.getenv("SERVER_MAX_REQUESTS", "0"))
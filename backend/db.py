@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from metrics import upstream_call
+
+# データアクセス層
+# supabase-py のクライアントは同期 (execute() がHTTP往復の間ブロックする) なので、
+# そのまま async def の中で呼ぶとuvicornのイベントループ全体が止まってしまう。
+# ここでは execute() を上限付きのスレッドプールに逃がし、呼び出しごとにタイムアウトをかける。
+# ハンドラは必ず Repository のメソッドを通してテーブルにアクセスする。
+
+
+class DatabaseTimeoutError(Exception):
+    pass
+
+
+def rejected_by_database(error: BaseException) -> bool:
+    # DBが書き込みを断った (コミットされていないと言い切れる) 失敗か
+    # タイムアウト・キャンセル・通信の失敗は含まない (スレッドで動いている execute() が後からコミットすることがある)
+    if isinstance(error, sqlite3.Error):
+        return True
+    try:
+        from postgrest.exceptions import APIError
+    except ImportError:
+        return False
+    return isinstance(error, APIError)
+
+
+class QueryRunner:
+    def __init__(self, pool_size: int, timeout: float):
+        self.timeout = timeout
+        # スレッド数 = 同時にSupabaseへ張れる接続数の上限
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="db")
+
+    async def execute(self, query, timeout: float = None):
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, query.execute)
+        try:
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        except asyncio.TimeoutError:
+            logging.error("Database call timed out after %ss", timeout or self.timeout)
+            raise DatabaseTimeoutError("Database call timed out")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+class Repository:
+    def __init__(self, client, runner: QueryRunner):
+        self.client = client
+        self.runner = runner
+
+    async def execute(self, query, timeout: float = None) -> list:
+        response = await self.runner.execute(query, timeout)
+        return response.data
+
+    def close(self):
+        self.runner.shutdown()
+
+    # ----- user_reg_log -----
+    @upstream_call
+    async def get_user_by_name(self, user_name: str, columns: str = "*") -> list:
+        return await self.execute(self.client.table("user_reg_log").select(columns).eq("user_name", user_name))
+
+    @upstream_call
+    async def insert_user(self, user_name: str, password_hash: str) -> list:
+        return await self.execute(self.client.table("user_reg_log").insert({
+            "user_name": user_name,
+            "password": password_hash
+        }))
+
+    @upstream_call
+    async def update_user_password(self, user_id, password_hash: str) -> list:
+        return await self.execute(self.client.table("user_reg_log").update({"password": password_hash}).eq("user_id", user_id))
+
+    @upstream_call
+    async def list_user_names(self, after_id=None, limit: int = 1000) -> list:
+        # user_id 順に limit 件ずつ (after_id より後) 読む。ユーザー名のフィルタの作り直し用
+        query = self.client.table("user_reg_log").select("user_id, user_name")
+        if after_id is not None:
+            query = query.gt("user_id", after_id)
+        return await self.execute(query.order("user_id").limit(limit))
+
+    # ----- plan_reg / process -----
+    @upstream_call
+    async def create_plan(self, user_id, plan_name: str, steps: list) -> dict:
+        # plan_reg と process を1回のRPCでまとめて登録する (sql/create_plan_with_steps.sql)
+        # stepsの並び順がそのまま process_order になる
+        return await self.execute(self.client.rpc("create_plan_with_steps", {
+            "p_user_id": user_id,
+            "p_plan_name": plan_name,
+            "p_steps": steps
+        }))
+
+    @upstream_call
+    async def create_plans_bulk(self, plans: list) -> list:
+        # 複数プランを1トランザクションで登録し、plan_idを入力と同じ順番で返す
+        result = await self.execute(self.client.rpc("create_plans_bulk", {"p_plans": plans}))
+        return result["plan_ids"]
+
+    @upstream_call
+    async def get_plan(self, plan_id, columns: str = "plan_id, plan_name") -> list:
+        return await self.execute(self.client.table("plan_reg").select(columns).eq("plan_id", plan_id))
+
+    @upstream_call
+    async def get_plans_by_user(self, user_id, columns: str = "plan_id, plan_name") -> list:
+        return await self.execute(self.client.table("plan_reg").select(columns).eq("user_id", user_id))
+
+    @upstream_call
+    async def get_steps(self, plan_id, columns: str = "*", desc: bool = None) -> list:
+        query = self.client.table("process").select(columns).eq("plan_id", plan_id)
+        if desc is not None:
+            query = query.order("process_order", desc=desc)
+        return await self.execute(query)
+
+    @upstream_call
+    async def get_plans_with_steps(self, user_id, plan_ids: list) -> list:
+        # 複数のプランを工程ごと1回の往復で取得する (GET /sync 用)
+        return await self.execute(
+            self.client.table("plan_reg").select("plan_id, plan_name, total_minutes, process(step_name, step_time, process_order)")
+            .eq("user_id", user_id).in_("plan_id", plan_ids)
+        )
+
+    # ----- schedule_reg -----
+    @upstream_call
+    async def insert_schedule(self, schedule_data: dict) -> list:
+        return await self.execute(self.client.table("schedule_reg").insert(schedule_data))
+
+    @upstream_call
+    async def insert_schedules(self, rows: list) -> list:
+        # 複数行を1回のinsertで登録する (返ってくる行の順番は渡した順番と同じ)
+        return await self.execute(self.client.table("schedule_reg").insert(rows))
+
+    @upstream_call
+    async def get_schedule(self, schedule_id, columns: str = "*") -> list:
+        return await self.execute(self.client.table("schedule_reg").select(columns).eq("schedule_id", schedule_id))
+
+    @upstream_call
+    async def get_schedule_full(self, schedule_id) -> list:
+        # 予定・プラン・工程を埋め込み(外部キーをたどるselect)で1回の往復でまとめて取得する
+        return await self.execute(self.client.table("schedule_reg").select(
+            "schedule_id, date, departure_time, wake_up_time, plan_id, "
+            "plan_reg(plan_id, plan_name, total_minutes, process(step_name, step_time, process_order, start_offset))"
+        ).eq("schedule_id", schedule_id))
+
+    @upstream_call
+    async def list_schedules(self, user_id, columns: str, date_from: str = None, date_to: str = None, after: list = None, limit: int = None) -> list:
+        # (date, schedule_id) 順のキーセットページネーション (sql/schedule_indexes.sql のインデックスを使う)
+        # after は前のページの最後の行の [date, schedule_id]
+        query = self.client.table("schedule_reg").select(columns).eq("user_id", user_id)
+        if date_from:
+            query = query.gte("date", date_from)
+        if date_to:
+            query = query.lte("date", date_to)
+        if after:
+            last_date, last_id = after
+            query = query.or_(f"date.gt.{last_date},and(date.eq.{last_date},schedule_id.gt.{last_id})")
+        query = query.order("date").order("schedule_id")
+        if limit:
+            query = query.limit(limit)
+        return await self.execute(query)
+
+    @upstream_call
+    async def get_schedules_by_ids(self, user_id, schedule_ids: list, columns: str) -> list:
+        return await self.execute(self.client.table("schedule_reg").select(columns).eq("user_id", user_id).in_("schedule_id", schedule_ids))
+
+    @upstream_call
+    async def get_next_schedule(self, user_id, today: str, now: str, columns: str) -> list:
+        # 今日のまだ出発していない予定か、明日以降で最初の予定を1件だけ取得
+        return await self.execute(
+            self.client.table("schedule_reg").select(columns).eq("user_id", user_id)
+            .gte("date", today)
+            .or_(f"date.gt.{today},and(date.eq.{today},departure_time.gte.{now})")
+            .order("date").order("departure_time").limit(1)
+        )
+
+
+    # ----- change_log -----
+    @upstream_call
+    async def list_changes(self, user_id, since: int, limit: int) -> list:
+        # version が since より後の変更を version 順に limit 件 (sql/change_log.sql のインデックスを使う)
+        return await self.execute(
+            self.client.table("change_log").select("version, entity, entity_id, logged_at")
+            .eq("user_id", user_id).gt("version", since).order("version").limit(limit)
+        )
+
+
+def create_client_from_config():
+    if config.db_backend == "memory":
+        from memory_backend import MemoryClient, seed_fixtures
+        client = MemoryClient(latency_ms=config.memory_latency_ms)
+        if config.memory_seed_users:
+            # 複数ワーカーの負荷試験用 (ワーカーごとにメモリが別なので、全ワーカーに同じデータを入れておく)
+            import bcrypt
+
+            password_hash = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=config.bcrypt_rounds)).decode('utf-8')
+            seed_fixtures(client, config.memory_seed_users, password_hash)
+        return client
+
+    from supabase import create_client
+
+    # 環境変数が正しく読み込まれているか確認
+    if not config.supabase_url or not config.supabase_key:
+        raise Exception("Supabase URL and Key must be set in environment variables")
+    return create_client(config.supabase_url, config.supabase_key)
+
+
+def create_repository(client=None) -> Repository:
+    runner = QueryRunner(pool_size=config.db_pool_size, timeout=config.db_timeout)
+    if client is None and config.db_backend == "sqlite":
+        # 同じメソッドをSQLで実行する Repository (sqlite_backend.py)
+        from sqlite_backend import SqliteClient, SqliteRepository
+        return SqliteRepository(SqliteClient(config.sqlite_path, config.sqlite_synchronous), runner)
+    if client is None:
+        client = create_client_from_config()
+    return Repository(client, runner)
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import bcrypt
+from fastapi import HTTPException, status
+
+import config
+from metrics import bcrypt_duration, timer
+
+# パスワードハッシュ化サービス
+# bcryptはコスト12で1回あたり数百ミリ秒CPUを使うので、イベントループ上で直接呼ぶと
+# その間ほかのリクエストがすべて止まる。ここではコア数分のプロセスプールで実行し、
+# 待ち行列が上限を超えたら503で即座に断る (ログイン集中でスケジュール読み込みが詰まらないように)。
+
+
+# プロセスプールに渡す関数はpickleできるようにモジュールの先頭レベルに置く
+def _hash_password(password: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds))
+
+
+def _check_password(password: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(password, hashed)
+
+
+def hash_rounds(hashed: str) -> int:
+    # "$2b$12$..." の形式からコスト(ラウンド数)を取り出す
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int, workers: int, queue_limit: int):
+        self.rounds = rounds
+        self.queue_limit = queue_limit
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        # 実行中 + 待ち中のハッシュ計算の数
+        self.pending = 0
+
+    async def _submit(self, func, *args):
+        if self.pending >= self.queue_limit:
+            logging.warning("Password hashing queue is full (%d pending)", self.pending)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Server is busy, please retry later", headers={"Retry-After": "1"})
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        with timer(bcrypt_duration, "hash"):
+            hashed = await self._submit(_hash_password, password.encode('utf-8'), self.rounds)
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        with timer(bcrypt_duration, "verify"):
+            return await self._submit(_check_password, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        return hash_rounds(hashed) != self.rounds
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+def create_hasher() -> PasswordHasher:
+    # 既定ではコア数をWebのワーカー数で分ける (ワーカーごとにプールを持つので、合計がコア数になるように)
+    workers = config.bcrypt_workers or max((os.cpu_count() or 1) // (config.web_concurrency or 1), 1)
+    return PasswordHasher(rounds=config.bcrypt_rounds, workers=workers, queue_limit=config.bcrypt_queue_limit)
@@ -0,0 +1,153 @@
+import hashlib
+import logging
+import re
+import uuid
+
+import config
+from cache import RedisConnection
+
+# GETエンドポイントのHTTPキャッシュ (ETag / If-None-Match)
+# プラン・予定などのエンティティごとにバージョン番号を持ち、書き込みのたびに上げる。
+# ETagは「URL + 関係するエンティティのバージョン」から作るので、クライアントが
+# If-None-Match で送ってきたETagが今のものと同じなら、Supabaseに問い合わせずに304を返せる。
+# バージョンはこのAPIを通った書き込みでしか上がらないので、SupabaseのダッシュボードなどでDBを
+# 直接書き換えた場合は、ワーカーを再起動する (ローカル) かRedisの version:* を消すこと。
+
+
+class LocalVersionBackend:
+    # ワーカーごとのメモリに持つ。起動ごとに epoch が変わるので、再起動前のETagは必ず外れる
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.versions = {}
+
+    async def get(self, keys: list) -> list:
+        return [f"{self.epoch}.{self.versions.get(key, 0)}" for key in keys]
+
+    async def bump(self, key: str):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    async def close(self):
+        pass
+
+
+class RedisVersionBackend:
+    # 複数ワーカーで共有する。epoch もRedisに置くので、Redisが空になれば古いETagは外れる
+    def __init__(self, url: str, prefix: str = "version:"):
+        self.redis = RedisConnection(url)
+        self.prefix = prefix
+        self.epoch = None
+
+    async def _epoch(self) -> str:
+        if self.epoch is None:
+            await self.redis.command("SET", self.prefix + "epoch", uuid.uuid4().hex[:8], "NX")
+            self.epoch = (await self.redis.command("GET", self.prefix + "epoch")).decode('ascii')
+        return self.epoch
+
+    async def get(self, keys: list) -> list:
+        epoch = await self._epoch()
+        values = await self.redis.command("MGET", *(self.prefix + key for key in keys))
+        return [f"{epoch}.{int(value or 0)}" for value in values]
+
+    async def bump(self, key: str):
+        await self.redis.command("INCR", self.prefix + key)
+
+    async def close(self):
+        await self.redis.close()
+
+
+class VersionStore:
+    def __init__(self, backend, etags: bool = True):
+        self.backend = backend
+        # False なら ETagMiddleware は何もしない (バージョンは single-flight などのために持ち続ける)
+        self.etags = etags
+
+    async def bump(self, kind: str, entity_id):
+        # 書き込み後に呼ぶ。失敗してもリクエストは失敗させない
+        try:
+            await self.backend.bump(f"{kind}:{entity_id}")
+        except Exception as e:
+            logging.warning("Failed to bump version of %s:%s: %s", kind, entity_id, e)
+
+    async def current(self, keys: list) -> list:
+        # "kind:id" ごとの今のバージョン (書き込みがあったかを後で比べる用)
+        return await self.backend.get(keys)
+
+    async def etag(self, keys: list, path: str, query: bytes) -> str:
+        versions = await self.backend.get(keys)
+        digest = hashlib.sha1("|".join([path, query.decode('latin-1'), *versions]).encode('utf-8')).hexdigest()
+        return f'"{digest[:20]}"'
+
+    async def close(self):
+        await self.backend.close()
+
+
+# ETagを付けるGETエンドポイントと、そのレスポンスの内容を決めるエンティティ
+CACHEABLE_ROUTES = [
+    (re.compile(r"^/plans/(?P<id>[^/]+)$"), "plan"),
+    (re.compile(r"^/user/(?P<id>[^/]+)/plans$"), "user_plans"),
+    (re.compile(r"^/schedules/user/(?P<id>[^/]+)$"), "user_schedules"),
+    (re.compile(r"^/schedule/(?P<id>[^/]+)/times$"), "schedule"),
+    (re.compile(r"^/schedule/(?P<id>[^/]+)/full$"), "schedule"),
+]
+
+
+def match_route(path: str):
+    for pattern, kind in CACHEABLE_ROUTES:
+        matched = pattern.match(path)
+        if matched:
+            return [f"{kind}:{matched.group('id')}"]
+    return None
+
+
+class ETagMiddleware:
+    def __init__(self, app, get_versions, max_age: int = 0):
+        # get_versions() で VersionStore を取る (lifespan で作られるので、ミドルウェアを組み立てる時点ではまだ無い)
+        self.app = app
+        self.get_versions = get_versions
+        # max_age=0 のときはブラウザに保存はさせるが、使う前に毎回 If-None-Match で確認させる
+        self.cache_control = f"private, max-age={max_age}" if max_age else "private, no-cache"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        keys = match_route(scope["path"])
+        if keys is None:
+            return await self.app(scope, receive, send)
+
+        versions = self.get_versions()
+        if not versions.etags:
+            return await self.app(scope, receive, send)
+
+        # DBを読む前にバージョンを取る (読んでいる間に書き込みがあっても、次の確認で必ず外れる)
+        try:
+            etag = await versions.etag(keys, scope["path"], scope["query_string"])
+        except Exception as e:
+            logging.warning("Failed to compute ETag for %s: %s", scope["path"], e)
+            return await self.app(scope, receive, send)
+
+        headers = [(b"etag", etag.encode('ascii')), (b"cache-control", self.cache_control.encode('ascii'))]
+        if_none_match = dict(scope["headers"]).get(b"if-none-match", b"").decode('latin-1')
+        # "*" (何か表現があれば一致) は見ない: 無いプランや予定にも304を返して404を隠してしまうので、
+        # 具体的なETagが一致したときだけ304にする
+        if etag in [value.strip() for value in if_none_match.split(",")]:
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_with_etag(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message = {**message, "headers": list(message.get("headers", [])) + headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_etag)
+
+
+def create_version_store() -> VersionStore:
+    # 共有するかどうかはプランキャッシュと同じ設定に従う
+    if config.plan_cache_backend == "redis":
+        return VersionStore(RedisVersionBackend(config.redis_url))
+    if (config.web_concurrency or 1) == 1:
+        return VersionStore(LocalVersionBackend())
+    # 他のワーカーの書き込みでバージョンが上がらず、変わったデータに304を返してしまうので、ETagは使わない
+    logging.warning("HTTP revalidation (ETag) disabled: WEB_CONCURRENCY > 1 needs PLAN_CACHE_BACKEND=redis")
+    return VersionStore(LocalVersionBackend(), etags=False)
@@ -0,0 +1,431 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import metrics
+from db import rejected_by_database
+
+# 書き込みの journal (Idempotency-Key と書き込みの後回し)
+# プラン・予定の登録を、Supabaseに書く前にローカルのSQLiteファイルに1行ずつ記録する。
+# - Idempotency-Key: 同じユーザーが同じキーで同じ登録を送り直したら、もう一度書かずに前の結果を返す
+#   (通信が切れてクライアントが再送しても、プランや予定が2件できない)
+# - WRITE_BEHIND=1 のとき: 検証が済んだ登録を journal に書いた時点で仮のID (負の数 = -seq) を返し、
+#   バックグラウンドのタスクが溜まった行を複数行insert (create_plans_bulk / insert_schedules) でまとめて書く。
+#   DBが断った (何も書かれていない) ときだけ指数バックオフで再送し、JOURNAL_MAX_ATTEMPTS 回失敗した行は state='failed' で残す。
+#   タイムアウト・通信の失敗・送信中にワーカーが落ちた行は、書かれたかどうか分からないので送り直さず state='unknown' にする
+#   (送り直すと同じプラン・予定が2件できる)。
+#   同じユーザーの読み込み (一覧・仮のIDでの取得) は、そのユーザーの未送信の行が書き込まれるまで待ってから読む。
+# SQLiteのファイルは同じホストのワーカーで共有する (WALモード。送信する行は BEGIN IMMEDIATE で1つのワーカーだけが取る)。
+# SQLiteの呼び出しはブロックするので、1本の専用スレッドで順番に実行する。
+
+SCHEMA = """
+create table if not exists journal (
+    seq integer primary key autoincrement,  -- 仮のID = -seq
+    kind text not null,                     -- 'plan' / 'schedule' / 'plan_bulk' / 'schedule_batch' (一括登録は Idempotency-Key だけに使う)
+    user_id text not null,
+    idempotency_key text,
+    fingerprint text,                       -- リクエストの内容のハッシュ (同じキーで別の内容を送られたら断る)
+    payload text not null,                  -- Supabaseに書く内容 (JSON)
+    state text not null,                    -- 'direct' (その場で書いている) / 'unknown' (書き込みの結果が分からない) / 'pending' / 'flushing' / 'done' / 'failed'
+    attempts integer not null default 0,
+    next_attempt real not null default 0,
+    claimed_at real,
+    result_id integer,                      -- 書き込まれた後の本当のID
+    result_ids text,                        -- 一括登録で書き込まれた本当のIDのリスト (JSON)
+    created_at real not null,
+    done_at real
+);
+create unique index if not exists journal_idempotency_idx on journal (user_id, kind, idempotency_key) where idempotency_key is not null;
+create index if not exists journal_state_idx on journal (state, next_attempt);
+create index if not exists journal_user_idx on journal (user_id, state);
+"""
+
+# 送信中のまま (ワーカーが落ちた・送った後の記録に失敗した) の行を、この秒数が過ぎたら unknown にする
+FLUSH_LEASE = 120
+# done の行を消す間隔(秒)
+CLEANUP_INTERVAL = 60
+# 読み込みが書き込みを待つときに journal を確かめる間隔(秒)
+WAIT_POLL = 0.01
+
+
+class IdempotencyConflict(Exception):
+    # 同じ Idempotency-Key のリクエストが処理中 (409) / 別の内容で使われている (422)
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def request_fingerprint(body: dict) -> str:
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def is_provisional(entity_id) -> bool:
+    # WRITE_BEHIND で返した仮のID (負の数) か
+    try:
+        return int(entity_id) < 0
+    except (TypeError, ValueError):
+        return False
+
+
+def entry_id(entry: dict):
+    # 再送されたリクエストに返すID (書き込み済みなら本当のID、まだなら仮のID。一括登録ならIDのリスト)
+    if entry.get("result_ids") is not None:
+        return json.loads(entry["result_ids"])
+    return entry["result_id"] if entry["result_id"] is not None else -entry["seq"]
+
+
+class Journal:
+    def __init__(self, path: str, write_behind: bool, batch_size: int, interval: float, max_attempts: int, retry_max: float, retention: float, settle_timeout: float):
+        self.path = path
+        self.write_behind = write_behind
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.retry_max = retry_max
+        self.retention = retention
+        self.settle_timeout = settle_timeout
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="journal")
+        self.connection = None
+        # 送信のタスクが次の間隔を待っている Future (wake() で早める)
+        self.waiter = None
+        self.task = None
+        self.flushed = 0
+        self.flush_errors = 0
+
+    def open(self):
+        # 以降の呼び出しはすべて self.executor のスレッドから
+        self.connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("pragma journal_mode=wal")
+        # 受け付けた書き込みは返事をする前にディスクに載せる
+        self.connection.execute("pragma synchronous=full")
+        self.connection.execute("pragma busy_timeout=5000")
+        self.connection.executescript(SCHEMA)
+        # result_ids の列が無かったころの journal ファイルには足す
+        columns = {row["name"] for row in self.connection.execute("pragma table_info(journal)")}
+        if "result_ids" not in columns:
+            self.connection.execute("alter table journal add column result_ids text")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+
+    # ----- 受け付け -----
+    def _begin(self, kind: str, user_id: str, key, fingerprint, payload: dict, deferred: bool) -> dict:
+        state = "pending" if deferred else "direct"
+        try:
+            cursor = self.connection.execute(
+                "insert into journal (kind, user_id, idempotency_key, fingerprint, payload, state, created_at) values (?, ?, ?, ?, ?, ?, ?)",
+                (kind, user_id, key, fingerprint, json.dumps(payload), state, time.time())
+            )
+            return {"seq": cursor.lastrowid, "state": state, "result_id": None, "result_ids": None, "replay": False}
+        except sqlite3.IntegrityError:
+            row = self.connection.execute(
+                "select seq, state, result_id, result_ids, fingerprint from journal where user_id = ? and kind = ? and idempotency_key = ?",
+                (user_id, kind, key)
+            ).fetchone()
+            if row is None:
+                raise
+            if row["fingerprint"] != fingerprint:
+                raise IdempotencyConflict(422, "Idempotency-Key was already used for a different request")
+            if row["state"] == "direct" and row["result_id"] is None:
+                raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+            if row["state"] == "unknown":
+                # 前の書き込みがコミットされたか分からないので、書き直すと2件になるかもしれない
+                raise IdempotencyConflict(409, "The outcome of an earlier request with this Idempotency-Key is unknown")
+            return {"seq": row["seq"], "state": row["state"], "result_id": row["result_id"], "result_ids": row["result_ids"], "replay": True}
+
+    async def begin(self, kind: str, user_id, key, body: dict, payload: dict, deferred: bool) -> dict:
+        # 登録を1行記録する。同じキーの行が既にあれば、その行を replay=True で返す
+        # deferred=False の行は、呼び出し側が書き込んだ後に finish() / 失敗したら discard() する
+        # 後回しにした行は、JOURNAL_FLUSH_INTERVAL ごとにまとめて送る (1件ごとに送信を起こすとまとまらない)
+        return await self._run(self._begin, kind, str(user_id), key, request_fingerprint(body) if key else None, payload, deferred)
+
+    def _finish(self, seq: int, result):
+        result_id, result_ids = (None, json.dumps(result)) if isinstance(result, list) else (result, None)
+        self.connection.execute("update journal set state = 'done', result_id = ?, result_ids = ?, done_at = ? where seq = ?", (result_id, result_ids, time.time(), seq))
+
+    async def finish(self, seq: int, result):
+        # result: 書き込んだ本当のID (一括登録ならIDのリスト)
+        await self._run(self._finish, seq, result)
+
+    def _discard(self, seq: int):
+        self.connection.execute("delete from journal where seq = ?", (seq,))
+
+    async def discard(self, seq: int):
+        # その場の書き込みが書かれずに失敗した (同じキーで送り直せば、もう一度書く)
+        await self._run(self._discard, seq)
+
+    def _abandon(self, seq: int):
+        self.connection.execute("update journal set state = 'unknown', done_at = ? where seq = ?", (time.time(), seq))
+
+    async def abandon(self, seq: int):
+        # その場の書き込みが、書かれたかどうか分からないまま終わった (タイムアウト・キャンセル・通信の失敗)
+        # 同じキーの再送には 409 を返し続ける (JOURNAL_RETENTION が過ぎたら消す)
+        await self._run(self._abandon, seq)
+
+    # ----- 読み込み側 (read-your-writes) -----
+    def _lookup(self, kind: str, seq: int):
+        row = self.connection.execute("select seq, user_id, state, result_id, payload from journal where seq = ? and kind = ?", (seq, kind)).fetchone()
+        return dict(row) if row is not None else None
+
+    async def lookup(self, kind: str, provisional_id) -> dict:
+        # 仮のIDの行 (無ければ None)
+        entry = await self._run(self._lookup, kind, -int(provisional_id))
+        if entry is not None:
+            entry["payload"] = json.loads(entry["payload"])
+        return entry
+
+    def _unflushed(self, user_id: str) -> bool:
+        # まだ1回も失敗していない未送信の行があるか (失敗してバックオフ中の行までは待たない)
+        return self.connection.execute(
+            "select 1 from journal where user_id = ? and state in ('pending', 'flushing') and attempts = 0 limit 1", (user_id,)
+        ).fetchone() is not None
+
+    async def _wait(self, done) -> bool:
+        # done() が True になるまで (最大 JOURNAL_SETTLE_TIMEOUT 秒) 送信を急かして待つ
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.settle_timeout
+        while not await done():
+            if loop.time() >= deadline:
+                return False
+            self.wake()
+            await asyncio.sleep(WAIT_POLL)
+        return True
+
+    async def settle(self, user_id) -> bool:
+        # user_id の未送信の登録が書き込まれるまで待つ (一覧を読む前に呼ぶ)
+        if not self.write_behind:
+            return True
+        user_id = str(user_id)
+
+        async def flushed():
+            return not await self._run(self._unflushed, user_id)
+
+        if await flushed():
+            return True
+        settled = await self._wait(flushed)
+        if not settled:
+            logging.warning("Pending writes of user %s were not flushed within %.1f seconds", user_id, self.settle_timeout)
+        return settled
+
+    async def resolve(self, kind: str, provisional_id):
+        # 仮のIDを本当のIDに変える (まだ送信されていなければ送信されるまで待つ)。無い・送れなかったら None
+        seq = -int(provisional_id)
+        entry = {}
+
+        async def written():
+            entry["row"] = await self._run(self._lookup, kind, seq)
+            row = entry["row"]
+            return row is None or row["result_id"] is not None or row["state"] in ("failed", "unknown")
+
+        await self._wait(written)
+        row = entry.get("row")
+        return row["result_id"] if row is not None else None
+
+    # ----- 送信 -----
+    def _claim(self) -> list:
+        now = time.time()
+        self.connection.execute("begin immediate")
+        try:
+            # 送信中のまま FLUSH_LEASE が過ぎた行は、insert がコミットされたかもしれないので送り直さない
+            stale = self.connection.execute(
+                "update journal set state = 'unknown', done_at = ? where state = 'flushing' and claimed_at < ?", (now, now - FLUSH_LEASE)
+            ).rowcount
+            rows = self.connection.execute(
+                "select seq, kind, user_id, payload, attempts, created_at from journal"
+                " where state = 'pending' and next_attempt <= ? order by seq limit ?",
+                (now, self.batch_size)
+            ).fetchall()
+            self.connection.executemany("update journal set state = 'flushing', claimed_at = ? where seq = ?", [(now, row["seq"]) for row in rows])
+            self.connection.execute("commit")
+        except BaseException:
+            self.connection.execute("rollback")
+            raise
+        if stale:
+            logging.error("%d journal entries were left flushing past the lease; their outcome is unknown", stale)
+        return [{**dict(row), "payload": json.loads(row["payload"])} for row in rows]
+
+    def _done(self, written: list):
+        now = time.time()
+        self.connection.executemany("update journal set state = 'done', result_id = ?, done_at = ? where seq = ?", [(result_id, now, entry["seq"]) for entry, result_id in written])
+
+    def _retry(self, entries: list, count: bool = True):
+        # count=False: 失敗ではなく順番待ち (仮のIDのプランがまだ書き込まれていない) なので、回数を増やさない
+        now = time.time()
+        for entry in entries:
+            attempts = entry["attempts"] + (1 if count else 0)
+            if attempts >= self.max_attempts:
+                self.connection.execute("update journal set state = 'failed', attempts = ? where seq = ?", (attempts, entry["seq"]))
+                logging.error("Giving up on journal entry %s (%s of user %s) after %d attempts", entry["seq"], entry["kind"], entry["user_id"], attempts)
+                continue
+            delay = min(2 ** attempts, self.retry_max) * random.uniform(0.5, 1.0) if count else self.interval
+            self.connection.execute("update journal set state = 'pending', attempts = ?, next_attempt = ? where seq = ?", (attempts, now + delay, entry["seq"]))
+
+    def _fail(self, entries: list):
+        self.connection.executemany("update journal set state = 'failed' where seq = ?", [(entry["seq"],) for entry in entries])
+
+    def _unknown(self, entries: list):
+        now = time.time()
+        self.connection.executemany("update journal set state = 'unknown', done_at = ? where seq = ?", [(now, entry["seq"]) for entry in entries])
+
+    async def _write(self, kind: str, entries: list, write, on_flushed):
+        # entries を1回の複数行insertで書き込む
+        try:
+            result_ids = await write(entries)
+        except Exception as e:
+            self.flush_errors += 1
+            metrics.journal_flush_errors.inc(kind)
+            if rejected_by_database(e):
+                logging.warning("Failed to flush %d %s entries: %s", len(entries), kind, e)
+                await self._run(self._retry, entries)
+            else:
+                # 複数行insertがコミットされたかもしれないので、送り直さない
+                logging.error("Outcome of flushing %s entries %s is unknown (%r); they will not be retried", kind, [entry["seq"] for entry in entries], e)
+                await self._run(self._unknown, entries)
+            return
+        written = list(zip(entries, result_ids))
+        await self._run(self._done, written)
+        now = time.time()
+        for entry, result_id in written:
+            self.flushed += 1
+            metrics.journal_flushed.inc(kind)
+            metrics.journal_flush_lag.observe(now - entry["created_at"])
+            await on_flushed(entry, result_id)
+
+    async def _write_plans(self, db, entries: list) -> list:
+        return await db.create_plans_bulk([entry["payload"] for entry in entries])
+
+    async def _write_schedules(self, db, entries: list) -> list:
+        rows = await db.insert_schedules([entry["payload"] for entry in entries])
+        if not rows or len(rows) != len(entries):
+            raise RuntimeError(f"{len(rows or [])} of {len(entries)} schedule rows returned")
+        return [row["schedule_id"] for row in rows]
+
+    async def _resolve_plans(self, entries: list) -> list:
+        # 仮のIDのプランを参照している予定は、そのプランが書き込まれてから送る
+        ready, waiting, orphaned = [], [], []
+        for entry in entries:
+            plan_id = entry["payload"]["plan_id"]
+            if not is_provisional(plan_id):
+                ready.append(entry)
+                continue
+            plan = await self._run(self._lookup, "plan", -int(plan_id))
+            if plan is not None and plan["result_id"] is not None:
+                entry["payload"] = {**entry["payload"], "plan_id": plan["result_id"]}
+                ready.append(entry)
+            elif plan is None or plan["state"] in ("failed", "unknown"):
+                logging.error("Journal entry %s refers to plan %s that was never written", entry["seq"], plan_id)
+                orphaned.append(entry)
+            else:
+                waiting.append(entry)
+        if orphaned:
+            await self._run(self._fail, orphaned)
+        if waiting:
+            await self._run(self._retry, waiting, False)
+        return ready
+
+    async def flush_once(self, db, on_flushed) -> int:
+        # 送信できる行を最大 JOURNAL_BATCH 件取って書き込む。取った件数を返す
+        entries = await self._run(self._claim)
+        # 初めて送る行はまとめて、失敗したことのある行は1件ずつ送る (1件の不正な行でまとめた全部が失敗し続けないように)
+        for kind, write in (("plan", self._write_plans), ("schedule", self._write_schedules)):
+            group = [entry for entry in entries if entry["kind"] == kind]
+            if kind == "schedule":
+                group = await self._resolve_plans(group)
+            fresh = [entry for entry in group if entry["attempts"] == 0]
+            batches = ([fresh] if fresh else []) + [[entry] for entry in group if entry["attempts"] > 0]
+            for batch in batches:
+                await self._write(kind, batch, lambda batch: write(db, batch), on_flushed)
+        return len(entries)
+
+    def _cleanup(self):
+        # 再送を受け付ける期間が過ぎた done / unknown の行と、書いている途中でワーカーが落ちた direct の行を消す
+        # (failed の行は、失われた書き込みを後で調べられるように残す)
+        now = time.time()
+        self.connection.execute(
+            "delete from journal where (state in ('done', 'unknown') and done_at < ?) or (state = 'direct' and created_at < ?)",
+            (now - self.retention, now - FLUSH_LEASE)
+        )
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def _sleep(self):
+        # JOURNAL_FLUSH_INTERVAL 秒か、wake() が呼ばれるまで待つ
+        # (asyncio.wait_for(event.wait(), timeout) は、タイムアウトと同時に cancel されると止まらないことがある)
+        loop = asyncio.get_running_loop()
+        self.waiter = loop.create_future()
+        handle = loop.call_later(self.interval, self.wake)
+        try:
+            await self.waiter
+        finally:
+            handle.cancel()
+            self.waiter = None
+
+    async def _flush_loop(self, db, on_flushed):
+        cleaned = 0.0
+        while True:
+            await self._sleep()
+            try:
+                # 1回で取り切れなかったら続けて送る
+                while await self.flush_once(db, on_flushed) >= self.batch_size:
+                    pass
+                if time.monotonic() - cleaned > CLEANUP_INTERVAL:
+                    await self._run(self._cleanup)
+                    cleaned = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error("Journal flush failed: %s", e)
+
+    def start(self, db, on_flushed):
+        # on_flushed(entry, result_id): 書き込んだ行ごとに呼ぶ (キャッシュ・ETagのバージョンの更新)
+        # WRITE_BEHIND=0 でも、前に後回しにした行が残っていれば送る
+        self.task = asyncio.get_running_loop().create_task(self._flush_loop(db, on_flushed))
+
+    def _counts(self) -> dict:
+        return {row["state"]: row["count"] for row in self.connection.execute("select state, count(*) as count from journal group by state")}
+
+    async def stats(self) -> dict:
+        counts = await self._run(self._counts)
+        return {
+            "pending": counts.get("pending", 0) + counts.get("flushing", 0),
+            "failed": counts.get("failed", 0),
+            # 結果が分からないまま終わったその場の書き込み (同じキーの再送には409を返している)
+            "unknown": counts.get("unknown", 0),
+            "flushed": self.flushed,
+            "flush_errors": self.flush_errors
+        }
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        # 送信中の行は、FLUSH_LEASE 秒後に次に起動したワーカーが unknown にする
+        await self._run(self.connection.close)
+        self.executor.shutdown(wait=True)
+
+
+def create_journal():
+    # JOURNAL_PATH が空なら Idempotency-Key も書き込みの後回しも使わない
+    if not config.journal_path:
+        if config.write_behind:
+            logging.warning("WRITE_BEHIND needs JOURNAL_PATH; writes go straight to the database")
+        return None
+    journal = Journal(
+        config.journal_path, config.write_behind, config.journal_batch, config.journal_flush_interval,
+        config.journal_max_attempts, config.journal_retry_max, config.journal_retention, config.journal_settle_timeout
+    )
+    journal.open()
+    return journal
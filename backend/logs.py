@@ -0,0 +1,119 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+import time
+
+import orjson
+
+import config
+
+# 構造化ログ
+# リクエストを処理するスレッド(イベントループ)ではLogRecordをキューに積むだけにして、
+# メッセージの組み立て・JSON化・書き出しはバックグラウンドのスレッドで行う。
+# 呼び出し側は f-string ではなく logging.info("... %s", value) や extra={...} で渡すこと
+# (レベルで捨てられるログは組み立てられず、出すログも組み立てはバックグラウンドで行われる)。
+# キューに積んだ後に引数の中身を書き換えないこと。
+
+REDACTED = "[REDACTED]"
+# この名前を含むキーの値は出力しない
+SECRET_KEYS = ("password", "token", "secret", "authorization", "api_key", "supabase_key", "cookie")
+# メッセージに紛れ込んだbcryptのハッシュとBearerトークン
+SECRET_PATTERN = re.compile(r"\$2[abxy]\$\d{2}\$[./A-Za-z0-9]{53}|(?i:bearer)\s+[A-Za-z0-9._~+/=-]+")
+
+# LogRecord が最初から持っている属性 (これ以外は extra で渡されたものとして出力する)
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "taskName", "sample_rate", "color_message"}
+
+
+def redact(value):
+    # 辞書・リストをたどって秘密の値を伏せる
+    if isinstance(value, dict):
+        return {key: REDACTED if any(name in str(key).lower() for name in SECRET_KEYS) else redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, str):
+        return SECRET_PATTERN.sub(REDACTED, value)
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    # 1レコード = 1行のJSON
+    def format(self, record) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = REDACTED if any(name in key.lower() for name in SECRET_KEYS) else redact(value)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return orjson.dumps(entry, default=str).decode('utf-8')
+
+
+class TextFormatter(logging.Formatter):
+    # 今までと同じ形式 (ローカルで読む用)。秘密の値は同じように伏せる
+    def __init__(self):
+        super().__init__('%(asctime)s - %(levelname)s - %(message)s')
+
+    def formatMessage(self, record) -> str:
+        return SECRET_PATTERN.sub(REDACTED, super().formatMessage(record))
+
+
+class DebugSampler(logging.Filter):
+    # DEBUGのログを rate の割合だけ通す。extra={"sample_rate": 0.1} でレコードごとに変えられる
+    # キューに積む前に判定するので、捨てるログはほとんどコストがかからない
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+        return random.random() < getattr(record, "sample_rate", self.rate)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    # 標準のQueueHandlerは積む前にメッセージを組み立ててしまうので、レコードをそのまま積む
+    # (同じプロセス内のキューなのでpickleする必要はない)
+    def prepare(self, record):
+        return record
+
+
+listener = None
+
+
+def setup_logging():
+    # ルートロガーにキューのハンドラを付けて、書き出し用のスレッドを起動する
+    global listener
+    if listener is not None:
+        return listener
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if config.log_format == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    handler = LazyQueueHandler(log_queue)
+    handler.addFilter(DebugSampler(config.log_debug_sample))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(config.log_level)
+
+    listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    listener.start()
+    # 終了時にキューに残っているログを書き出してからスレッドを止める
+    atexit.register(shutdown_logging)
+    return listener
+
+
+def shutdown_logging():
+    global listener
+    if listener is not None:
+        listener.stop()
+        listener = None
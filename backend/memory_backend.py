@@ -0,0 +1,399 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+# Supabaseのテーブルをメモリ上で再現するスタンドイン
+# supabase.table(...).select(...).eq(...).execute() と同じ書き方で使えるので、
+# 本物のSupabaseが無くてもデータアクセス層の負荷試験ができる
+
+# テーブルごとの自動採番カラム
+PRIMARY_KEYS = {
+    "user_reg_log": "user_id",
+    "plan_reg": "plan_id",
+    "process": "process_id",
+    "schedule_reg": "schedule_id",
+    "change_log": "version",
+}
+
+# sql/change_log.sql のトリガーの再現: テーブル → (記録するエンティティ, そのIDのカラム)
+CHANGE_LOGGED = {
+    "plan_reg": ("plan", "plan_id"),
+    "process": ("plan", "plan_id"),
+    "schedule_reg": ("schedule", "schedule_id"),
+}
+
+# 埋め込み(select("*, plan_reg(*)") のような外部キーをたどる読み込み)に使うリレーション
+# (親テーブル, 埋め込むテーブル): (親のカラム, 埋め込む側のカラム, 複数行かどうか)
+RELATIONS = {
+    ("schedule_reg", "plan_reg"): ("plan_id", "plan_id", False),
+    ("plan_reg", "process"): ("plan_id", "plan_id", True),
+    ("plan_reg", "schedule_reg"): ("plan_id", "plan_id", True),
+    ("user_reg_log", "plan_reg"): ("user_id", "user_id", True),
+    ("user_reg_log", "schedule_reg"): ("user_id", "user_id", True),
+}
+
+
+class MemoryResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class MemoryQuery:
+    def __init__(self, client, table_name: str):
+        self.client = client
+        self.table_name = table_name
+        self.action = "select"
+        self.columns = None
+        self.payload = None
+        self.filters = []
+        # eq() の条件はインデックスで候補を絞るのにも使う
+        self.equals = []
+        self.orders = []
+        self.limit_count = None
+        self.count_mode = None
+
+    # ----- 操作 -----
+    def select(self, *columns, count=None):
+        self.action = "select"
+        self.columns = _parse_columns(",".join(columns))
+        self.count_mode = count
+        return self
+
+    def insert(self, payload):
+        self.action = "insert"
+        self.payload = payload
+        return self
+
+    def update(self, payload):
+        self.action = "update"
+        self.payload = payload
+        return self
+
+    def delete(self):
+        self.action = "delete"
+        return self
+
+    # ----- フィルタ -----
+    def eq(self, column, value):
+        self.filters.append(lambda row: _same(row.get(column), value))
+        self.equals.append((column, value))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(lambda row: not _same(row.get(column), value))
+        return self
+
+    def in_(self, column, values):
+        values = [str(value) for value in values]
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: _OPERATORS["gt"](row.get(column), value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: _OPERATORS["gte"](row.get(column), value))
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: _OPERATORS["lt"](row.get(column), value))
+        return self
+
+    def lte(self, column, value):
+        self.filters.append(lambda row: _OPERATORS["lte"](row.get(column), value))
+        return self
+
+    def or_(self, filters: str):
+        # PostgRESTの or=(...) と同じ書き方 ("date.gt.2024-01-01,and(date.eq.2024-01-01,schedule_id.gt.3)")
+        self.filters.append(_parse_logic("or", filters))
+        return self
+
+    def order(self, column, desc=False):
+        self.orders.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        return self.client.run(self)
+
+
+class MemoryRpc:
+    def __init__(self, client, name: str, params: dict):
+        self.client = client
+        self.name = name
+        self.params = params
+
+    def execute(self):
+        return self.client.run_rpc(self)
+
+
+class MemoryClient:
+    def __init__(self, latency_ms: float = 0):
+        self.latency = latency_ms / 1000
+        self.tables = {name: [] for name in PRIMARY_KEYS}
+        self.sequences = {name: 0 for name in PRIMARY_KEYS}
+        self.lock = threading.Lock()
+        # (テーブル, カラム) → {値の文字列: 行のリスト}。eq() で初めて使われたときに作る
+        self.indexes = {}
+        # execute() が呼ばれた回数 (= ネットワーク往復の回数)
+        self.calls = 0
+
+    def table(self, table_name: str) -> MemoryQuery:
+        return MemoryQuery(self, table_name)
+
+    from_ = table
+
+    def rpc(self, name: str, params: dict) -> MemoryRpc:
+        return MemoryRpc(self, name, params)
+
+    def run(self, query: MemoryQuery) -> MemoryResponse:
+        if self.latency:
+            time.sleep(self.latency)
+        with self.lock:
+            self.calls += 1
+            rows = self.tables.setdefault(query.table_name, [])
+            if query.action == "insert":
+                return MemoryResponse(self._insert(query.table_name, query.payload))
+
+            if query.equals:
+                column, value = query.equals[0]
+                rows = self._index(query.table_name, column).get(str(value), [])
+            matched = [row for row in rows if all(check(row) for check in query.filters)]
+
+            if query.action == "update":
+                for row in matched:
+                    row.update(query.payload)
+                self._drop_indexes(query.table_name)
+                for row in matched:
+                    self._log_change(query.table_name, row)
+                return MemoryResponse([dict(row) for row in matched])
+
+            if query.action == "delete":
+                removed = {id(row) for row in matched}
+                self.tables[query.table_name] = [row for row in self.tables[query.table_name] if id(row) not in removed]
+                self._drop_indexes(query.table_name)
+                for row in matched:
+                    self._log_change(query.table_name, row)
+                return MemoryResponse([dict(row) for row in matched])
+
+            for column, desc in reversed(query.orders):
+                matched.sort(key=lambda row: _key(row.get(column)), reverse=desc)
+            count = len(matched) if query.count_mode else None
+            if query.limit_count is not None:
+                matched = matched[:query.limit_count]
+            data = [self._project(query.table_name, row, query.columns) for row in matched]
+            return MemoryResponse(data, count)
+
+    def _project(self, table_name: str, row: dict, columns: list) -> dict:
+        if not columns:
+            return dict(row)
+        result = {}
+        for column in columns:
+            if column == "*":
+                result.update(row)
+            elif isinstance(column, tuple):
+                name, sub_columns = column
+                local, foreign, many = RELATIONS[(table_name, name)]
+                related = [
+                    self._project(name, other, sub_columns)
+                    for other in self._index(name, foreign).get(str(row.get(local)), [])
+                ]
+                result[name] = related if many else (related[0] if related else None)
+            else:
+                result[column] = row.get(column)
+        return result
+
+    def run_rpc(self, rpc: MemoryRpc) -> MemoryResponse:
+        # sql/ 以下のストアドファンクションと同じ処理をPythonで再現する
+        # 途中で失敗したら、その呼び出しで追加した行をすべて取り消す (トランザクションの代わり)
+        if self.latency:
+            time.sleep(self.latency)
+        handler = getattr(self, f"_rpc_{rpc.name}", None)
+        if handler is None:
+            raise Exception(f"Could not find the function {rpc.name}")
+        with self.lock:
+            self.calls += 1
+            lengths = {name: len(rows) for name, rows in self.tables.items()}
+            sequences = dict(self.sequences)
+            try:
+                return MemoryResponse(handler(**rpc.params))
+            except Exception:
+                for name, length in lengths.items():
+                    del self.tables[name][length:]
+                self.indexes.clear()
+                self.sequences = sequences
+                raise
+
+    def _rpc_create_plan_with_steps(self, p_user_id, p_plan_name, p_steps) -> dict:
+        step_times = [int(step["step_time"]) for step in p_steps]
+        plan = self._insert("plan_reg", {"user_id": p_user_id, "plan_name": p_plan_name, "total_minutes": sum(step_times)})[0]
+        rows = []
+        elapsed = 0
+        for index, step in enumerate(p_steps):
+            rows.append({
+                "plan_id": plan["plan_id"],
+                "step_name": step["step_name"],
+                "step_time": step_times[index],
+                "process_order": index + 1,
+                "start_offset": elapsed
+            })
+            elapsed += step_times[index]
+        self._insert("process", rows)
+        return {"plan_id": plan["plan_id"]}
+
+    def _rpc_create_plans_bulk(self, p_plans) -> dict:
+        plan_ids = [
+            self._rpc_create_plan_with_steps(plan["user_id"], plan["plan_name"], plan["steps"])["plan_id"]
+            for plan in p_plans
+        ]
+        return {"plan_ids": plan_ids}
+
+    def _index(self, table_name: str, column: str) -> dict:
+        index = self.indexes.get((table_name, column))
+        if index is None:
+            index = {}
+            for row in self.tables.setdefault(table_name, []):
+                index.setdefault(str(row.get(column)), []).append(row)
+            self.indexes[(table_name, column)] = index
+        return index
+
+    def _drop_indexes(self, table_name: str):
+        for key in [key for key in self.indexes if key[0] == table_name]:
+            del self.indexes[key]
+
+    def _log_change(self, table_name: str, row: dict):
+        # 行が変わったことを change_log に記録する (process はプランの変更として記録する)
+        logged = CHANGE_LOGGED.get(table_name)
+        if logged is None:
+            return
+        entity, column = logged
+        user_id = row.get("user_id")
+        if table_name == "process":
+            plans = self._index("plan_reg", "plan_id").get(str(row.get(column)), [])
+            if not plans:
+                return
+            user_id = plans[0].get("user_id")
+        self._insert("change_log", {"user_id": user_id, "entity": entity, "entity_id": row.get(column), "logged_at": datetime.now(timezone.utc).isoformat()})
+
+    def _insert(self, table_name: str, payload) -> list:
+        records = payload if isinstance(payload, list) else [payload]
+        primary_key = PRIMARY_KEYS.get(table_name)
+        inserted = []
+        for record in records:
+            row = dict(record)
+            if primary_key and row.get(primary_key) is None:
+                self.sequences[table_name] = self.sequences.get(table_name, 0) + 1
+                row[primary_key] = self.sequences[table_name]
+            row.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+            self.tables[table_name].append(row)
+            for (indexed_table, column), index in self.indexes.items():
+                if indexed_table == table_name:
+                    index.setdefault(str(row.get(column)), []).append(row)
+            inserted.append(dict(row))
+            self._log_change(table_name, row)
+        return inserted
+
+
+_OPERATORS = {
+    "eq": lambda left, right: _same(left, right),
+    "neq": lambda left, right: not _same(left, right),
+    "gt": lambda left, right: left is not None and _key(left) > _key(right),
+    "gte": lambda left, right: left is not None and _key(left) >= _key(right),
+    "lt": lambda left, right: left is not None and _key(left) < _key(right),
+    "lte": lambda left, right: left is not None and _key(left) <= _key(right),
+}
+
+
+def _split_top_level(text: str) -> list:
+    # 括弧の外側のカンマで区切る
+    parts, depth, current = [], 0, ""
+    for char in text:
+        if char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        depth += (char == "(") - (char == ")")
+        current += char
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _parse_logic(kind: str, text: str):
+    checks = []
+    for part in _split_top_level(text):
+        if part.startswith(("and(", "or(")):
+            inner_kind, inner = part.split("(", 1)
+            checks.append(_parse_logic(inner_kind, inner[:-1]))
+        else:
+            column, operator, value = part.split(".", 2)
+            checks.append(lambda row, column=column, compare=_OPERATORS[operator], value=value: compare(row.get(column), value))
+    combine = any if kind == "or" else all
+    return lambda row: combine(check(row) for check in checks)
+
+
+def _parse_columns(text: str) -> list:
+    # "a, b, plan_reg(plan_id, process(*))" → ["a", "b", ("plan_reg", ["plan_id", ("process", ["*"])])]
+    columns = []
+    for part in _split_top_level(text.replace(" ", "")):
+        if not part:
+            continue
+        if "(" in part:
+            name, inner = part.split("(", 1)
+            columns.append((name, _parse_columns(inner[:-1])))
+        else:
+            columns.append(part)
+    return columns
+
+
+def _same(left, right) -> bool:
+    # PostgRESTはクエリ文字列で値を受け取るので、"1" と 1 を同じものとして扱う
+    return str(left) == str(right)
+
+
+def _key(value):
+    # 数値は数値として、それ以外は文字列として比較する
+    if isinstance(value, (int, float)):
+        return (0, value, "")
+    try:
+        return (0, float(value), "")
+    except (TypeError, ValueError):
+        return (1, 0, str(value))
+
+
+SEED_STEP_NAMES = ["歯磨き", "朝食", "着替え", "洗顔", "髪を整える", "弁当を作る", "ゴミ出し", "化粧", "シャワー", "持ち物の確認"]
+
+
+def seed_fixtures(client: MemoryClient, users: int, password_hash: str, plans_per_user: int = 5, schedules_per_user: int = 60):
+    # 負荷試験用の決まったデータを入れる (user0, user1, ... / パスワードはすべて password_hash)
+    # 乱数の種を固定しているので、複数ワーカーで起動しても全ワーカーが同じデータ・同じIDを持つ
+    from scheduling import wake_up_time
+
+    rng = random.Random(1)
+    for index in range(users):
+        user_id = client.table("user_reg_log").insert({"user_name": f"user{index}", "password": password_hash}).execute().data[0]["user_id"]
+        plans = [{
+            "user_id": user_id,
+            "plan_name": f"plan{number}",
+            "steps": [{"step_name": name, "step_time": rng.randint(1, 20)} for name in rng.sample(SEED_STEP_NAMES, 5)]
+        } for number in range(plans_per_user)]
+        plan_ids = client.rpc("create_plans_bulk", {"p_plans": plans}).execute().data["plan_ids"]
+        totals = dict(zip(plan_ids, (sum(step["step_time"] for step in plan["steps"]) for plan in plans)))
+
+        schedules = []
+        for month, day in [(month, day) for month in range(1, 13) for day in range(1, 29)][:schedules_per_user]:
+            plan_id = rng.choice(plan_ids)
+            schedules.append({
+                "date": f"2025-{month:02d}-{day:02d}",
+                "departure_time": "08:15:00",
+                "wake_up_time": wake_up_time("08:15:00", totals[plan_id])[1],
+                "plan_id": plan_id,
+                "user_id": user_id
+            })
+        client.table("schedule_reg").insert(schedules).execute()
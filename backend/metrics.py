@@ -0,0 +1,195 @@
+import contextvars
+import functools
+import time
+from bisect import bisect_left
+
+import config
+
+# 計測 (Prometheusのテキスト形式で /metrics から出す)
+# 値はワーカーごとに持つので、複数ワーカーのときはPrometheus側でワーカーごとに集めて合算する。
+# METRICS_ENABLED=0 にすると記録をすべて止める (オーバーヘッドの比較用)。
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+enabled = config.metrics_enabled
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield f"{self.name}{_labels(self.label_names, label_values)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values):
+        self.values[label_values] = value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        # ラベルの値 → [バケットごとの件数..., +Infの件数, 合計値]
+        self.values = {}
+
+    def observe(self, value: float, *label_values):
+        row = self.values.get(label_values)
+        if row is None:
+            row = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def samples(self):
+        for label_values, row in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), row[:-1]):
+                cumulative += count
+                bound_label = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, label_values, bound_label)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, label_values)} {row[-1]}"
+            yield f"{self.name}_count{_labels(self.label_names, label_values)} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter("http_requests_total", "Number of HTTP requests", ("method", "route", "status")))
+http_duration = registry.register(Histogram("http_request_duration_seconds", "HTTP request latency", ("method", "route")))
+upstream_duration = registry.register(Histogram("upstream_call_duration_seconds", "Latency of each database call", ("operation",)))
+upstream_per_request = registry.register(Histogram("upstream_calls_per_request", "Database round trips per HTTP request", ("route",), buckets=(0, 1, 2, 3, 4, 5, 8, 13)))
+bcrypt_duration = registry.register(Histogram("bcrypt_duration_seconds", "Password hashing latency including queueing", ("operation",)))
+rate_limited = registry.register(Counter("rate_limited_total", "Requests rejected by rate or concurrency limits", ("route", "reason")))
+username_filter_checks = registry.register(Counter("username_filter_checks_total", "Username existence checks answered by the Bloom filter", ("result",)))
+alarm_lateness = registry.register(Histogram("alarm_lateness_seconds", "Delay between an alarm's due time and its firing", buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)))
+alarms_fired = registry.register(Counter("alarms_fired_total", "Alarms delivered to subscribers", ("type",)))
+alarms_dropped = registry.register(Counter("alarms_dropped_total", "Alarms not scheduled or not delivered", ("reason",)))
+journal_flushed = registry.register(Counter("journal_flushed_total", "Deferred writes flushed to the database", ("kind",)))
+journal_flush_errors = registry.register(Counter("journal_flush_errors_total", "Failed flushes of deferred writes", ("kind",)))
+journal_flush_lag = registry.register(Histogram("journal_flush_lag_seconds", "Delay between accepting a deferred write and flushing it", buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 30.0, 300.0)))
+# 各モジュールの状態 (/metrics を読んだときに更新する)
+state = registry.register(Gauge("backend_state", "Internal counters of caches, pools and queues", ("component", "name")))
+
+
+# リクエストごとのDB往復回数 (MetricsMiddlewareが1要素のリストを入れる)
+round_trips = contextvars.ContextVar("round_trips", default=None)
+
+
+def upstream_call(func):
+    # Repositoryのメソッド(=DBへの1往復)の時間と回数を記録する
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not enabled:
+            return await func(*args, **kwargs)
+        counter = round_trips.get()
+        if counter is not None:
+            counter[0] += 1
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            upstream_duration.observe(time.perf_counter() - started, func.__name__)
+    return wrapper
+
+
+class timer:
+    # with timer(bcrypt_duration, "hash"): ... の形で区間の時間を記録する
+    def __init__(self, histogram: Histogram, *label_values):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+def route_name(scope) -> str:
+    # ルートのテンプレート ("/plans/{plan_id}") で集計する。ルーティング前に返した応答(304など)は
+    # ルートを探し直す
+    route = scope.get("route")
+    if route is None:
+        from starlette.routing import Match
+
+        for candidate in scope["app"].router.routes:
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", "unmatched")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not enabled:
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+        counter = [0]
+        token = round_trips.set(counter)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            round_trips.reset(token)
+            route = route_name(scope)
+            http_requests.inc(scope["method"], route, status_code)
+            http_duration.observe(elapsed, scope["method"], route)
+            upstream_per_request.observe(counter[0], route)
@@ -0,0 +1,22 @@
+import base64
+
+import orjson
+
+# キーセットページネーション用のカーソル
+# 最後に返した行の (date, schedule_id) をJSONにしてbase64urlで包む。
+# クライアントは中身を気にせず、そのまま次のリクエストの cursor に渡す。
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(list(values))).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    # 壊れたカーソルは ValueError
+    try:
+        values = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
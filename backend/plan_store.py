@@ -0,0 +1,232 @@
+import sys
+import time
+from array import array
+
+# プランキャッシュのエントリを列ごとの array に詰めて持つストア (PLAN_CACHE_BACKEND=compact)
+# エントリ (build_plan_entry の dict) をそのまま持つと、工程1つごとに dict と str と int が並び、
+# 1プランで1〜2KBになる。ここでは1プラン = 行番号1つとして
+#   プラン: plan_id / プラン名の番号 / 工程の開始位置・数 / 合計分数 / 期限 / 参照ビット
+#   工程:   工程名の番号 / step_time / process_order / 起床からの分数 (step_time の累積和)
+# を array に並べ、工程名とプラン名は NameTable で番号にして同じ文字列を1つだけ持つ。
+# get のたびに dict に組み立て直して返す (Redis のときと同じく、呼び出し側は毎回新しい dict を受け取る)。
+# 行は末尾に足すだけで、消した行は印を付けて数え、半分を超えたら詰め直す。
+# 上限を超えたら CLOCK (参照ビットで1周の猶予を与える近似LRU) で追い出す。
+
+UINT16_MAX = 0xFFFF
+UINT32_MAX = 0xFFFFFFFF
+
+
+class NameTable:
+    # 文字列と番号の対応。同じ工程名 (「歯磨き」「朝食」…) は何千プランあっても1つの str を共有する
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+        self.string_bytes = 0
+
+    def intern(self, name: str) -> int:
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+            self.string_bytes += sys.getsizeof(name)
+        return index
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def memory(self) -> int:
+        return sys.getsizeof(self.ids) + sys.getsizeof(self.names) + self.string_bytes
+
+
+class PlanStore:
+    def __init__(self, capacity: int, ttl: float):
+        self.capacity = max(capacity, 1)
+        self.ttl = ttl
+        self.evictions = 0
+        # 列に収まらない値 (step_time が 0〜65535 の外など) のエントリはそのまま持つ
+        self.others = {}
+        self._reset()
+
+    def _reset(self):
+        self.index = {}  # plan_id -> 行番号
+        self.step_names = NameTable()
+        self.plan_names = NameTable()
+        # プランの列 (行番号で引く)
+        self.plan_id = array('q')
+        self.plan_name = array('I')
+        self.first = array('I')
+        self.count = array('H')
+        self.total = array('I')
+        self.expires = array('d')
+        self.referenced = bytearray()
+        self.live = bytearray()
+        # 工程の列 (first[row] から count[row] 個)
+        self.step_name = array('I')
+        self.step_time = array('H')
+        self.process_order = array('H')
+        self.offset = array('I')
+        self.hand = 0
+        self.dead = 0
+
+    @staticmethod
+    def _fits(entry: dict) -> bool:
+        steps = entry["steps"]
+        offsets = entry["offsets"]
+        return (
+            type(entry["plan_id"]) is int
+            and len(steps) <= UINT16_MAX
+            and len(offsets) == len(steps)
+            and all(type(step["step_time"]) is int and 0 <= step["step_time"] <= UINT16_MAX
+                    and type(step["process_order"]) is int and 0 <= step["process_order"] <= UINT16_MAX for step in steps)
+            and all(type(value) is int and 0 <= value <= UINT32_MAX for value in (*offsets, entry["total_minutes"]))
+        )
+
+    @staticmethod
+    def _key(plan_id):
+        try:
+            return int(plan_id)
+        except (TypeError, ValueError):
+            return None
+
+    # ----- 読み書き -----
+    def get(self, plan_id):
+        key = self._key(plan_id)
+        row = self.index.get(key)
+        if row is None:
+            return self._get_other(plan_id)
+        if self.expires[row] < time.monotonic():
+            self._kill(row)
+            return None
+        self.referenced[row] = 1
+        first = self.first[row]
+        end = first + self.count[row]
+        names = self.step_names.names
+        return {
+            "plan_id": self.plan_id[row],
+            "plan_name": self.plan_names.names[self.plan_name[row]],
+            "steps": [
+                {"step_name": names[name], "step_time": step_time, "process_order": order}
+                for name, step_time, order in zip(self.step_name[first:end], self.step_time[first:end], self.process_order[first:end])
+            ],
+            "offsets": self.offset[first:end].tolist(),
+            "total_minutes": self.total[row]
+        }
+
+    def _get_other(self, plan_id):
+        item = self.others.get(str(plan_id))
+        if item is None:
+            return None
+        expires_at, entry = item
+        if expires_at < time.monotonic():
+            del self.others[str(plan_id)]
+            return None
+        return entry
+
+    def put(self, plan_id, entry: dict):
+        self.delete(plan_id)
+        if not self._fits(entry) or entry["plan_id"] != self._key(plan_id):
+            self.others[str(plan_id)] = (time.monotonic() + self.ttl, entry)
+            self._evict()
+            return
+        steps = entry["steps"]
+        self._evict(room=1)
+        row = len(self.plan_id)
+        self.index[entry["plan_id"]] = row
+        self.plan_id.append(entry["plan_id"])
+        self.plan_name.append(self.plan_names.intern(entry["plan_name"]))
+        self.first.append(len(self.step_name))
+        self.count.append(len(steps))
+        self.total.append(entry["total_minutes"])
+        self.expires.append(time.monotonic() + self.ttl)
+        self.referenced.append(0)
+        self.live.append(1)
+        intern = self.step_names.intern
+        self.step_name.extend(intern(step["step_name"]) for step in steps)
+        self.step_time.extend(step["step_time"] for step in steps)
+        self.process_order.extend(step["process_order"] for step in steps)
+        self.offset.extend(entry["offsets"])
+
+    def delete(self, plan_id):
+        row = self.index.get(self._key(plan_id))
+        if row is not None:
+            self._kill(row)
+        self.others.pop(str(plan_id), None)
+
+    def __len__(self) -> int:
+        return len(self.index) + len(self.others)
+
+    # ----- 追い出しと詰め直し -----
+    def _kill(self, row: int):
+        del self.index[self.plan_id[row]]
+        self.live[row] = 0
+        self.dead += 1
+        if self.dead > len(self.index) and self.dead > 1024:
+            self._compact()
+
+    def _evict(self, room: int = 0):
+        # 件数が上限を超えないように追い出す。参照ビットが立っている行は1周だけ見逃す
+        while len(self) + room > self.capacity:
+            if not self.index:
+                self.others.pop(next(iter(self.others)))
+                self.evictions += 1
+                continue
+            if self.hand >= len(self.live):
+                self.hand = 0
+            row = self.hand
+            self.hand += 1
+            if not self.live[row]:
+                continue
+            if self.referenced[row]:
+                self.referenced[row] = 0
+                continue
+            self._kill(row)
+            self.evictions += 1
+
+    def _compact(self):
+        # 生きている行だけで列を作り直す (使われなくなった名前も落とす)
+        plan_id, plan_name, first, count, total = self.plan_id, self.plan_name, self.first, self.count, self.total
+        expires, referenced, live, hand = self.expires, self.referenced, self.live, self.hand
+        step_name, step_time, process_order, offset = self.step_name, self.step_time, self.process_order, self.offset
+        plan_names, step_names = self.plan_names.names, self.step_names.names
+        self._reset()
+        for row in range(len(plan_id)):
+            if not live[row]:
+                continue
+            if row < hand:
+                self.hand = len(self.plan_id) + 1
+            start, end = first[row], first[row] + count[row]
+            self.index[plan_id[row]] = len(self.plan_id)
+            self.plan_id.append(plan_id[row])
+            self.plan_name.append(self.plan_names.intern(plan_names[plan_name[row]]))
+            self.first.append(len(self.step_name))
+            self.count.append(count[row])
+            self.total.append(total[row])
+            self.expires.append(expires[row])
+            self.referenced.append(referenced[row])
+            self.live.append(1)
+            self.step_name.extend(self.step_names.intern(step_names[name]) for name in step_name[start:end])
+            self.step_time.extend(step_time[start:end])
+            self.process_order.extend(process_order[start:end])
+            self.offset.extend(offset[start:end])
+
+    # ----- 大きさ -----
+    def memory(self) -> int:
+        # 列・名前・索引が使っているバイト数の概算 (索引の int は1つ28バイトとして数える)
+        columns = (self.plan_id, self.plan_name, self.first, self.count, self.total, self.expires, self.referenced, self.live,
+                   self.step_name, self.step_time, self.process_order, self.offset)
+        size = sum(sys.getsizeof(column) for column in columns)
+        size += sys.getsizeof(self.index) + len(self.index) * 2 * 28
+        size += self.step_names.memory() + self.plan_names.memory()
+        size += sys.getsizeof(self.others) + len(self.others) * 2048
+        return size
+
+    def stats(self) -> dict:
+        plans = len(self)
+        memory = self.memory()
+        return {
+            "bytes": memory,
+            "bytes_per_plan": memory // plans if plans else 0,
+            "step_names": len(self.step_names),
+            "plan_names": len(self.plan_names)
+        }
@@ -0,0 +1,219 @@
+import logging
+import math
+import time
+from collections import OrderedDict
+
+import orjson
+
+import config
+import metrics
+from cache import RedisConnection
+
+# レート制限と同時実行数の上限 (アドミッション制御)
+# 壊れたクライアントやスクリプトが /login (bcrypt) や /register_schedule (DB往復2回) を連打しても
+# 他の利用者が巻き込まれないように、ルーティングの直後・DBやbcryptに触る前に断る。
+# - レート制限: 利用者 (ログイン中ならユーザーID、それ以外は接続元IP) × ルートごとのトークンバケット。
+#   超えたら429 + Retry-After
+# - 同時実行数: 重いルートのグループごとに、1ワーカーが同時に処理する数の上限。超えたら503 + Retry-After
+# どちらもリクエストの本文を読む前に返すので、断るコストはほぼかからない。
+
+
+def parse_rate(text: str):
+    # "回数/秒数" → (バケットの容量, 1秒あたりの回復量)。"0" や空なら制限なし
+    if not text or text == "0":
+        return None
+    count, _, seconds = text.partition("/")
+    return float(count), float(count) / float(seconds or 1)
+
+
+# ルートのグループ (ルートのテンプレートで指定)。ここに無いルートは "read"
+ROUTE_GROUPS = {
+    ("POST", "/login"): "auth",
+    ("POST", "/register"): "auth",
+    ("POST", "/plans/"): "write",
+    ("POST", "/plans/bulk"): "write",
+    ("POST", "/register_schedule"): "write",
+    ("POST", "/register_schedule/batch"): "write",
+}
+# 制限しないルート (監視・ロードバランサーからの確認)
+EXEMPT_ROUTES = {"/metrics", "/healthz", "/readyz", "unmatched"}
+
+
+class LocalRateLimitBackend:
+    # ワーカーごとのメモリに持つ。ワーカー数 N なら実質の上限は N 倍になる
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # キー → (残りトークン, 最後に更新した時刻)。最も古く使われたものから追い出す
+        self.buckets = OrderedDict()
+
+    async def take(self, key: str, capacity: float, refill: float) -> float:
+        # トークンを1つ取る。取れたら0、取れなければ次に取れるまでの秒数を返す
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / refill
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_size:
+            self.buckets.popitem(last=False)
+        return wait
+
+    async def close(self):
+        pass
+
+
+# 読んで・回復させて・1つ取って・書き戻すまでをRedisの中で1回で行う (ワーカー間で取り合っても数がずれない)
+# 時刻はRedisの TIME を使う (ワーカーごとの時計のずれに影響されない)
+TAKE_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * refill)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill) + 1)
+return tostring(wait)
+"""
+
+
+class RedisRateLimitBackend:
+    # 複数ワーカーで共有する。満タンに戻るまでの時間でキーが消えるので、掃除は要らない
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        self.redis = RedisConnection(url)
+        self.prefix = prefix
+
+    async def take(self, key: str, capacity: float, refill: float) -> float:
+        return float(await self.redis.command("EVAL", TAKE_SCRIPT, "1", self.prefix + key, capacity, refill))
+
+    async def close(self):
+        await self.redis.close()
+
+
+class RateLimiter:
+    def __init__(self, backend, sessions, rates: dict, concurrency: dict):
+        self.backend = backend
+        # ユーザーIDを知るため (署名と期限を確かめるだけ。失効リストは見ない)
+        self.sessions = sessions
+        # グループ → (容量, 回復量) / グループ → 同時実行数の上限
+        self.rates = rates
+        self.concurrency = concurrency
+        # グループ → このワーカーで処理中の数
+        self.in_flight = {group: 0 for group in concurrency}
+
+    def identity(self, scope) -> str:
+        authorization = dict(scope["headers"]).get(b"authorization", b"").decode('latin-1')
+        scheme, _, token = authorization.partition(" ")
+        if scheme.lower() == "bearer" and token:
+            try:
+                return f"user:{self.sessions.decode(token.strip()).user_id}"
+            except ValueError:
+                pass
+        client = scope.get("client")
+        return f"ip:{client[0] if client else 'unknown'}"
+
+    async def retry_after(self, group: str, route: str, scope) -> float:
+        # レート制限を超えていれば次に通るまでの秒数、超えていなければ0
+        rate = self.rates.get(group)
+        if rate is None:
+            return 0.0
+        key = f"{scope['method']} {route}|{self.identity(scope)}"
+        try:
+            return await self.backend.take(key, *rate)
+        except Exception as e:
+            # 保存先 (Redis) が使えないときは制限せずに通す
+            logging.warning("Rate limit check failed for %s: %s", route, e)
+            return 0.0
+
+    def acquire(self, group: str) -> bool:
+        # 同時実行数の枠を1つ取る (awaitを挟まないので、確認と加算の間に他のリクエストは入らない)
+        limit = self.concurrency.get(group)
+        if limit is None:
+            return True
+        if self.in_flight[group] >= limit:
+            return False
+        self.in_flight[group] += 1
+        return True
+
+    def release(self, group: str):
+        if group in self.in_flight:
+            self.in_flight[group] -= 1
+
+    def stats(self) -> dict:
+        return {f"{group}_in_flight": count for group, count in self.in_flight.items()}
+
+    async def close(self):
+        await self.backend.close()
+
+
+async def reject(send, status_code: int, detail: str, retry_after: float):
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode('ascii')),
+            (b"retry-after", str(max(math.ceil(retry_after), 1)).encode('ascii')),
+        ]
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    def __init__(self, app, get_limiter):
+        # get_limiter() で RateLimiter を取る (lifespan で作られるので、ミドルウェアを組み立てる時点ではまだ無い)
+        self.app = app
+        self.get_limiter = get_limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+        route = metrics.route_name(scope)
+        limiter = self.get_limiter()
+        if route in EXEMPT_ROUTES or limiter is None:
+            return await self.app(scope, receive, send)
+
+        group = ROUTE_GROUPS.get((scope["method"], route), "read")
+        wait = await limiter.retry_after(group, route, scope)
+        if wait > 0:
+            metrics.rate_limited.inc(route, "rate")
+            return await reject(send, 429, "Too many requests", wait)
+        if not limiter.acquire(group):
+            metrics.rate_limited.inc(route, "concurrency")
+            return await reject(send, 503, "Server is busy, please retry later", 1)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(group)
+
+
+def create_rate_limiter(sessions) -> RateLimiter:
+    rates = {
+        "auth": parse_rate(config.rate_limit_auth),
+        "write": parse_rate(config.rate_limit_write),
+        "read": parse_rate(config.rate_limit_read),
+    }
+    concurrency = {"auth": config.concurrency_limit_auth, "write": config.concurrency_limit_write}
+    # 共有するかどうかはプランキャッシュと同じ設定に従う
+    if config.plan_cache_backend == "redis":
+        backend = RedisRateLimitBackend(config.redis_url)
+    else:
+        backend = LocalRateLimitBackend(max_size=config.rate_limit_size)
+    return RateLimiter(
+        backend,
+        sessions,
+        rates={group: rate for group, rate in rates.items() if rate is not None},
+        concurrency={group: limit for group, limit in concurrency.items() if limit > 0}
+    )
@@ -0,0 +1,300 @@
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, Header, HTTPException, status
+
+import config
+from cache import build_plan_entry, create_plan_cache
+from db import rejected_by_database
+from journal import IdempotencyConflict, entry_id, is_provisional
+from scheduling import wake_up_datetime
+from sessions import SessionUser
+
+# アプリ全体で共有するリソース (DB・パスワードハッシュ・キャッシュ・セッション)
+# 以前は login.py / user_reg.py / sche_reg.py / app.py がそれぞれimport時に.envを読んで
+# Supabaseクライアントを作っていたが、今は1つのアプリの lifespan で open() / close() し、
+# 各ルーターは resources.db のようにこのオブジェクト経由で使う。
+# supabase・bcrypt (プロセスプール)・Redisなどのモジュールは open() の中で初めてimportする
+# (ルーターを読み込むだけのとき・ワーカーの起動直後に余計なimportをしない)。
+
+
+class Resources:
+    def __init__(self):
+        self.db = None
+        self.hasher = None
+        self.plan_cache = None
+        # GETエンドポイントのETag用のエンティティごとのバージョン
+        self.versions = None
+        # 同じキーの同時読み込みを1回の上流呼び出しにまとめる
+        self.reads = None
+        # ログインセッション (署名つきトークン)
+        self.sessions = None
+        # レート制限と同時実行数の上限 (RATE_LIMIT_ENABLED=0 なら None)
+        self.rate_limiter = None
+        # 登録済みユーザー名のBloomフィルタ (使わないときは None)
+        self.usernames = None
+        # 起床・工程開始のアラーム
+        self.alarms = None
+        # Idempotency-Key の記録と後回しにした書き込み (JOURNAL_PATH が空なら None)
+        self.journal = None
+        # open() が終わってから close() が始まるまで True (/readyz で返す)
+        self.ready = False
+
+    def open(self):
+        from alarms import create_alarm_engine
+        from db import create_repository
+        from hashing import create_hasher
+        from http_cache import create_version_store
+        from journal import create_journal
+        from ratelimit import create_rate_limiter
+        from sessions import create_session_manager
+        from singleflight import SingleFlight
+        from usernames import create_username_filter
+
+        # データアクセス層 (DB_BACKEND で Supabase / SQLite / メモリを切り替え)
+        self.db = create_repository()
+        self.hasher = create_hasher()
+        self.plan_cache = create_plan_cache()
+        self.versions = create_version_store()
+        self.reads = SingleFlight()
+        self.sessions = create_session_manager()
+        # 開き直したとき (テストなど) に前の設定のものが残らないように、使わないものは None に戻す
+        self.rate_limiter = create_rate_limiter(self.sessions) if config.rate_limit_enabled else None
+        self.usernames = create_username_filter() if config.username_filter_enabled else None
+        if self.usernames is not None:
+            # 起動を待たせないように、フィルタはバックグラウンドで読み込む
+            self.usernames.start(self.db)
+        self.alarms = create_alarm_engine(load_alarms, self.versions)
+        self.alarms.start()
+        self.journal = create_journal()
+        if self.journal is not None:
+            self.journal.start(self.db, journal_flushed)
+        self.ready = True
+
+    async def close(self):
+        self.ready = False
+        # 接続中のアラームのストリームを先に終わらせる
+        await self.alarms.close()
+        # 後回しにした書き込みの送信を止める (残った行は次の起動で送る)
+        if self.journal is not None:
+            await self.journal.close()
+        if self.usernames is not None:
+            await self.usernames.close()
+        self.db.close()
+        self.hasher.shutdown()
+        await self.plan_cache.close()
+        await self.versions.close()
+        await self.sessions.close()
+        if self.rate_limiter is not None:
+            await self.rate_limiter.close()
+
+
+resources = Resources()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    resources.open()
+    try:
+        yield
+    finally:
+        await resources.close()
+
+
+async def load_plan(plan_id):
+    # plan_reg と process を読んでキャッシュ用のエントリを作る
+    plans = await resources.db.get_plan(plan_id, "plan_id, plan_name, total_minutes")
+    if not plans:
+        return None
+    steps = await resources.db.get_steps(plan_id, "step_name, step_time, process_order, start_offset")
+    return build_plan_entry(plans[0], steps or [])
+
+
+async def read_once(name: str, kind: str, entity_id, func):
+    # 同じ読み込み (name + entity_id) が同時に来たら single-flight で1回にまとめる
+    # キーにETagと同じバージョンを入れるので、書き込み (バージョンが上がる) の後に来た読み込みが、
+    # 書き込みの前に始まった読み込みに相乗りして古い結果 (しかも新しいETag付き) を受け取ることはない
+    key = f"{kind}:{entity_id}"
+    try:
+        version = (await resources.versions.current([key]))[0]
+    except Exception as e:
+        # バージョンが分からなければまとめない
+        logging.warning("Failed to read version of %s: %s", key, e)
+        return await func()
+    return await resources.reads.do((name, str(entity_id), version), func)
+
+
+async def get_cached_plan(plan_id):
+    # プランのヘッダ・工程(process_order昇順)・合計時間をキャッシュ経由で取得
+    # キャッシュが外れたときの読み込みは、同じplan_idの同時リクエストで1回にまとめる
+    return await resources.plan_cache.get_plan(plan_id, lambda plan_id: read_once("plan", "plan", plan_id, lambda: load_plan(plan_id)))
+
+
+async def plan_written(plan_id, user_id):
+    # プランを書き込んだ後に、キャッシュを捨ててETagのバージョンを上げる
+    await resources.plan_cache.invalidate(plan_id)
+    await resources.versions.bump("plan", plan_id)
+    await resources.versions.bump("user_plans", user_id)
+
+
+async def schedules_written(schedule_ids: list, user_id):
+    # 予定を書き込んだ後に、ETagのバージョンを上げる
+    for schedule_id in schedule_ids:
+        await resources.versions.bump("schedule", schedule_id)
+    await resources.versions.bump("user_schedules", user_id)
+
+
+async def journal_flushed(entry: dict, result_id):
+    # 後回しにした登録が書き込まれた: 本当のIDと仮のID (-seq) の両方のETagを外す
+    if entry["kind"] == "plan":
+        await plan_written(result_id, entry["user_id"])
+        await resources.versions.bump("plan", -entry["seq"])
+    else:
+        await schedules_written([result_id, -entry["seq"]], entry["user_id"])
+
+
+async def settle_writes(user_id):
+    # 同じユーザーの後回しにした登録が書き込まれてから読む (read-your-writes)
+    if resources.journal is not None:
+        await resources.journal.settle(user_id)
+
+
+async def resolve_id(kind: str, entity_id):
+    # 仮のID (WRITE_BEHIND で返した負の数) を本当のIDに変える。それ以外はそのまま返す
+    # 書き込まれなかった (送信に失敗し続けた・無いID) ときは None
+    if not is_provisional(entity_id):
+        return entity_id
+    if resources.journal is None:
+        return None
+    return await resources.journal.resolve(kind, entity_id)
+
+
+async def get_plan_for_write(plan_id):
+    # 予定を登録するときのプラン (登録に使う plan_id, キャッシュのエントリ)
+    # 仮のIDのプランがまだ書き込まれていなければ、WRITE_BEHIND のときは journal の内容からエントリを作り、
+    # 予定も仮のIDのまま journal に入れる (送信するときに本当のIDに変える)。そうでなければ書き込まれるのを待つ
+    if is_provisional(plan_id) and resources.journal is not None:
+        entry = await resources.journal.lookup("plan", plan_id)
+        if entry is None or entry["state"] in ("failed", "unknown"):
+            return plan_id, None
+        if entry["result_id"] is None and resources.journal.write_behind:
+            payload = entry["payload"]
+            steps = [{**step, "process_order": order} for order, step in enumerate(payload["steps"], 1)]
+            return plan_id, build_plan_entry({"plan_id": int(plan_id), "plan_name": payload["plan_name"]}, steps)
+        plan_id = await resources.journal.resolve("plan", plan_id)
+        if plan_id is None:
+            return plan_id, None
+    return plan_id, await get_cached_plan(plan_id)
+
+
+def written_nothing(error: BaseException) -> bool:
+    # その場の書き込みの失敗が、何も書かれていないと言い切れるものか (検証で断った・DBが断った)
+    if isinstance(error, HTTPException):
+        return error.status_code < 500
+    return rejected_by_database(error)
+
+
+async def journaled_write(kind: str, user_id, key: Optional[str], body: dict, payload, write, deferrable: bool = True):
+    # プラン・予定の登録を journal を通して行い、IDを返す
+    # - write(): その場でSupabaseに書いて本当のIDを返す (キャッシュ・ETagの更新も write の中で行う)
+    # - Idempotency-Key があれば、同じキーの再送には書かずに前のIDを返す
+    # - WRITE_BEHIND なら payload を journal に書いた時点で仮のID (負の数) を返す (Supabaseへはバックグラウンドで書く)
+    # 一括登録 (deferrable=False) は後回しにせず、Idempotency-Key だけに使う (write() は本当のIDのリストを返す)
+    journal = resources.journal
+    deferred = journal is not None and journal.write_behind and deferrable
+    if journal is None or (key is None and not deferred):
+        return await write()
+    try:
+        entry = await journal.begin(kind, user_id, key, body, payload, deferred)
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if entry["replay"]:
+        return entry_id(entry)
+    if deferred:
+        # 一覧のETagを外す (次の読み込みはハンドラまで来て、書き込まれるのを待ってから読む)
+        provisional_id = entry_id(entry)
+        if kind == "plan":
+            await plan_written(provisional_id, user_id)
+        else:
+            await schedules_written([provisional_id], user_id)
+        return provisional_id
+    try:
+        result_id = await write()
+    except BaseException as e:
+        if written_nothing(e):
+            await journal.discard(entry["seq"])
+        else:
+            logging.warning("Outcome of %s write with Idempotency-Key is unknown (%r); retries will get 409", kind, e)
+            await journal.abandon(entry["seq"])
+        raise
+    await journal.finish(entry["seq"], result_id)
+    return result_id
+
+
+async def load_alarms(user_id) -> list:
+    # 今から ALARM_HORIZON_HOURS 時間以内の予定の起床時刻と各工程の開始時刻 (UNIX時刻)
+    # [(時刻, schedule_id, 工程の位置 (-1 = 起床), 工程のリスト), ...]
+    now = datetime.now()
+    until = now + timedelta(hours=config.alarm_horizon_hours)
+    # 予定の date は出発日なので、起床が前日になる翌日の予定も読む
+    schedules = await resources.db.list_schedules(
+        user_id, "schedule_id, date, departure_time, wake_up_time, plan_id",
+        date_from=now.date().isoformat(), date_to=(until + timedelta(days=1)).date().isoformat()
+    )
+    alarms = []
+    for schedule in schedules or []:
+        if not schedule.get("wake_up_time"):
+            continue
+        wake_up = wake_up_datetime(schedule["date"], schedule["departure_time"], schedule["wake_up_time"])
+        # 過ぎた時刻のアラームは AlarmEngine が捨てる
+        if wake_up > until:
+            continue
+        alarms.append((wake_up.timestamp(), schedule["schedule_id"], -1, None))
+        plan = await get_cached_plan(schedule["plan_id"])
+        if plan is None:
+            continue
+        for index, offset in enumerate(plan["offsets"]):
+            alarms.append(((wake_up + timedelta(minutes=offset)).timestamp(), schedule["schedule_id"], index, plan["steps"]))
+    return alarms
+
+
+async def username_might_exist(user_name: str) -> bool:
+    # False なら user_reg_log を読まなくても登録されていないと分かる
+    if resources.usernames is None:
+        return True
+    return await resources.usernames.might_exist(user_name)
+
+
+async def username_registered(user_name: str):
+    if resources.usernames is not None:
+        await resources.usernames.add(user_name)
+
+
+async def optional_session(authorization: Optional[str] = Header(None)) -> Optional[SessionUser]:
+    # Authorization: Bearer <token> があればトークンだけでユーザーを決める (DBは読まない)
+    # ヘッダが無ければ None、あっても通らないトークンなら401
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid authorization header", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return await resources.sessions.verify(token.strip())
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+async def idempotency_key(idempotency_key: Optional[str] = Header(None)) -> Optional[str]:
+    # Idempotency-Key ヘッダ (登録のエンドポイント用。同じキーの再送には前の結果を返す)
+    if idempotency_key is not None and not 1 <= len(idempotency_key) <= 255:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key must be 1 to 255 characters")
+    return idempotency_key
+
+
+async def current_session(session: Optional[SessionUser] = Depends(optional_session)) -> SessionUser:
+    # ログインが必須のエンドポイント用
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+    return session
@@ -0,0 +1,46 @@
+from starlette.routing import Match
+
+# 起動時のルート表の確認
+# FastAPIは先に登録したルートから順に照合するので、同じパス・メソッドを2回登録したり、
+# 先に登録した "/plans/{plan_id}" のようなパターンが後のルートのパスをすべて飲み込んだりすると、
+# 後のルートは決して呼ばれない (エラーにもならない)。そういうルート表では起動しないようにする。
+
+# パスパラメータの代わりに入れる値 (型ごとに、その型の変換器が受け付けるもの)
+SAMPLE_VALUES = {
+    "StringConvertor": "__param__",
+    "PathConvertor": "__param__/__param__",
+    "IntegerConvertor": "1",
+    "FloatConvertor": "1.5",
+    "UUIDConvertor": "00000000-0000-0000-0000-000000000000",
+}
+
+
+def _sample_path(route) -> str:
+    # "/plans/{plan_id}" → "/plans/__param__" のように、そのルートにだけ当たる具体的なパスを作る
+    values = {name: SAMPLE_VALUES.get(type(convertor).__name__, "__param__") for name, convertor in route.param_convertors.items()}
+    return route.path_format.format(**values)
+
+
+def find_shadowed_routes(routes: list) -> list:
+    # 後に登録されたルートのうち、前のルートに先に当たってしまうものを説明文のリストで返す
+    problems = []
+    http_routes = [route for route in routes if getattr(route, "methods", None)]
+    for index, route in enumerate(http_routes):
+        path = _sample_path(route)
+        for earlier in http_routes[:index]:
+            methods = route.methods & earlier.methods
+            if not methods:
+                continue
+            match, _ = earlier.matches({"type": "http", "path": path, "method": sorted(methods)[0]})
+            if match == Match.FULL:
+                problems.append(
+                    f"{','.join(sorted(methods))} {route.path} ({route.name}) is shadowed by {earlier.path} ({earlier.name})"
+                )
+                break
+    return problems
+
+
+def check_routes(app):
+    problems = find_shadowed_routes(app.router.routes)
+    if problems:
+        raise RuntimeError("Unreachable routes:\n  " + "\n  ".join(problems))
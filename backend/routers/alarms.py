@@ -0,0 +1,90 @@
+import asyncio
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+
+import config
+from resources import resources
+from sessions import SessionUser
+
+# 起床・工程開始のアラームの受け取り (alarms.py)
+# ブラウザの WebSocket / EventSource はヘッダを付けられないので、トークンは ?token= で渡す。
+# ?schedule_id= を付けるとその予定のアラームだけを受け取る。
+router = APIRouter()
+
+
+async def session_from_token(token: Optional[str]) -> SessionUser:
+    if not token:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    try:
+        return await resources.sessions.verify(token)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+
+
+def wanted(event: dict, schedule_id: Optional[str]) -> bool:
+    return schedule_id is None or str(event["schedule_id"]) == schedule_id
+
+
+# WebSocket: アラームごとに1つのJSONのテキストメッセージを送る
+@router.websocket("/alarms/ws")
+async def alarms_websocket(websocket: WebSocket, token: Optional[str] = Query(None), schedule_id: Optional[str] = Query(None)):
+    try:
+        session = await session_from_token(token)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    queue = await resources.alarms.subscribe(session.user_id)
+    # クライアントからのメッセージは読み捨てて、切断だけを見る
+    receiving = asyncio.create_task(websocket.receive_text())
+    try:
+        while True:
+            getting = asyncio.create_task(queue.get())
+            done, _ = await asyncio.wait({receiving, getting}, return_when=asyncio.FIRST_COMPLETED)
+            if receiving in done:
+                getting.cancel()
+                receiving.result()
+                receiving = asyncio.create_task(websocket.receive_text())
+                if getting not in done:
+                    continue
+            event = getting.result()
+            if event is None:
+                await websocket.close(code=status.WS_1001_GOING_AWAY)
+                break
+            if wanted(event, schedule_id):
+                await websocket.send_text(orjson.dumps(event).decode('utf-8'))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receiving.cancel()
+        resources.alarms.unsubscribe(session.user_id, queue)
+
+
+# Server-Sent Events: EventSource で受け取る (event: wake_up / step)
+@router.get("/alarms/stream")
+async def alarms_stream(token: Optional[str] = Query(None), schedule_id: Optional[str] = Query(None)):
+    session = await session_from_token(token)
+    queue = await resources.alarms.subscribe(session.user_id)
+
+    async def events():
+        try:
+            # 接続できたことを知らせる (EventSource の onopen より先にプロキシのバッファを流す)
+            yield b": connected\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=config.alarm_keepalive)
+                except asyncio.TimeoutError:
+                    # プロキシやロードバランサーにアイドルで切られないように
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    break
+                if wanted(event, schedule_id):
+                    yield b"event: " + event["type"].encode('ascii') + b"\ndata: " + orjson.dumps(event) + b"\n\n"
+        finally:
+            resources.alarms.unsubscribe(session.user_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
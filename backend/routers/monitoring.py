@@ -0,0 +1,50 @@
+import os
+
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import PlainTextResponse
+
+import metrics
+from resources import resources
+from schemas import HealthResponse
+
+router = APIRouter()
+
+
+# 計測値 (Prometheusのテキスト形式)
+@router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    for name, value in resources.plan_cache.stats().items():
+        metrics.state.set(value, "plan_cache", name)
+    for name, value in resources.reads.stats().items():
+        metrics.state.set(value, "single_flight", name)
+    metrics.state.set(resources.hasher.pending, "bcrypt", "pending")
+    metrics.state.set(resources.hasher.queue_limit, "bcrypt", "queue_limit")
+    for name, value in resources.alarms.stats().items():
+        metrics.state.set(value, "alarms", name)
+    if resources.usernames is not None:
+        for name, value in (await resources.usernames.stats()).items():
+            metrics.state.set(value, "username_filter", name)
+    if resources.journal is not None:
+        for name, value in (await resources.journal.stats()).items():
+            metrics.state.set(value, "journal", name)
+    if resources.rate_limiter is not None:
+        for name, value in resources.rate_limiter.stats().items():
+            metrics.state.set(value, "rate_limiter", name)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
+# 生存確認 (プロセスがリクエストを処理できていれば200)
+@router.get("/healthz", response_model=HealthResponse)
+async def get_health():
+    return {"status": "ok", "pid": os.getpid()}
+
+
+# 準備完了の確認 (共有リソースが使える状態で、パスワードハッシュの待ち行列が満杯でなければ200)
+# ロードバランサーは503のワーカーにリクエストを振らない
+@router.get("/readyz", response_model=HealthResponse)
+async def get_ready():
+    if not resources.ready:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Not ready")
+    if resources.hasher.pending >= resources.hasher.queue_limit:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Password hashing queue is full")
+    return {"status": "ready", "pid": os.getpid()}
@@ -0,0 +1,179 @@
+import logging
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+
+from resources import get_cached_plan, idempotency_key, journaled_write, plan_written, read_once, resolve_id, resources, settle_writes
+from schemas import PlanBulkResponse, PlanCreate, PlanCreateResponse, PlanDetailResponse, PlanInclude, PlanSummary, StepsResponse
+
+# プランの登録・取得
+router = APIRouter()
+
+# 一括登録で受け付けるプラン数の上限
+PLAN_BULK_LIMIT = 500
+
+
+def steps_payload(plan: PlanCreate) -> list:
+    # 並び順がそのまま process_order (1始まり) になる
+    return [{"step_name": step.step_name, "step_time": step.step_time} for step in plan.steps]
+
+
+# プラン登録エンドポイント (POST)
+@router.post("/plans/", response_model=PlanCreateResponse)
+async def create_plan(request: Request,plan: PlanCreate, key: Optional[str] = Depends(idempotency_key)):
+    try:
+        steps = steps_payload(plan)
+
+        async def insert():
+            # プランと全ステップを1回のRPCでまとめて作成 (途中で失敗したら何も残らない)
+            result = await resources.db.create_plan(plan.user_id, plan.plan_name, steps)
+            plan_id = result.get("plan_id") if result else None
+
+            if plan_id is None:
+                logging.error("Plan ID not found in response: %s", result)
+                raise HTTPException(status_code=500, detail="Plan ID not found in response")
+            logging.info("Plan created", extra={"plan_id": plan_id, "user_id": plan.user_id, "steps": len(plan.steps)})
+
+            await plan_written(plan_id, plan.user_id)
+            return plan_id
+
+        # Idempotency-Key の再送には前のIDを、WRITE_BEHIND なら journal に書いて仮のIDを返す
+        # (journal の内容は create_plans_bulk の1件分と同じ形)
+        plan_id = await journaled_write("plan", plan.user_id, key, plan.model_dump(), {"user_id": plan.user_id, "plan_name": plan.plan_name, "steps": steps}, insert)
+
+        return {"message": "Plan created successfully", "plan_id": plan_id}
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# プラン一括登録エンドポイント (POST)
+# Idempotency-Key を付ければ、タイムアウトの後に送り直しても同じプランが2回登録されない
+@router.post("/plans/bulk", response_model=PlanBulkResponse)
+async def create_plans_bulk(plans: List[PlanCreate], key: Optional[str] = Depends(idempotency_key)):
+    if not plans:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No plans given")
+    if len(plans) > PLAN_BULK_LIMIT:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {PLAN_BULK_LIMIT} plans can be created at once")
+    try:
+        payload = [{"user_id": plan.user_id, "plan_name": plan.plan_name, "steps": steps_payload(plan)} for plan in plans]
+
+        async def insert():
+            # すべてのプランを1回のRPC(=1トランザクション)で作成
+            plan_ids = await resources.db.create_plans_bulk(payload)
+            logging.info("Bulk plan creation", extra={"plans": len(plan_ids)})
+            for plan_id, plan in zip(plan_ids, plans):
+                await plan_written(plan_id, plan.user_id)
+            return plan_ids
+
+        # Idempotency-Key の再送には前のIDのリストを返す (キーは最初のプランのユーザーごとに記録する)
+        plan_ids = await journaled_write(
+            "plan_bulk", plans[0].user_id, key, {"plans": [plan.model_dump() for plan in plans]}, payload, insert, deferrable=False
+        )
+        return {"message": "Plans created successfully", "plan_ids": plan_ids}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# プロセス詳細エンドポイント (非推奨: /plans/{plan_id} か /schedule/{schedule_id}/full を使う)
+# パスの plan_id の工程を返す。以前のクライアントのために、?schedule_id= があればその予定のプランの工程を返す
+@router.get("/plans/name/{plan_id}", response_model=StepsResponse, deprecated=True)
+async def get_plan_by_name(plan_id: str, schedule_id: Optional[str] = None):
+    try:
+        if schedule_id is not None:
+            # schedule_idからプランを取得
+            schedules = await resources.db.get_schedule(schedule_id, "plan_id")
+
+            logging.debug("Plan fetch response: %s", schedules)
+
+            if not schedules:
+                raise HTTPException(status_code=404, detail="Plan not found")
+
+            plan_id = schedules[0].get("plan_id")
+
+        # 各工程の情報を取得 (仮のIDなら書き込まれるのを待って本当のIDで読む)
+        plan_id = await resolve_id("plan", plan_id)
+        if plan_id is None:
+            raise HTTPException(status_code=404, detail="Steps not found for plan")
+        plan = await get_cached_plan(plan_id)
+
+        if not plan or not plan["steps"]:
+            logging.error("Steps not found for plan: %s", plan_id)
+            raise HTTPException(status_code=404, detail="Steps not found for plan")
+
+        # 結果を整形 (process_orderの降順)
+        result = {
+            "steps": list(reversed(plan["steps"])),
+
+        }
+
+        return result
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+    
+
+
+# プラン取得エンドポイント
+# include で返す内容を選ぶ (どれもキャッシュの同じエントリから作るので、DBの読み込みは増えない)
+#   header:  plan_id, plan_name, total_minutes
+#   steps:   header + processes (process_orderの降順。既定で、今までのレスポンスと同じ)
+#   offsets: steps の各工程に、起床から始めるまでの分数 start_offset を付けたもの
+@router.get("/plans/{plan_id}", response_model=PlanDetailResponse, response_model_exclude_none=True)
+async def get_plan_by_id(plan_id: str, include: PlanInclude = PlanInclude.steps):
+    try:
+        # plan_idでプランと工程をキャッシュ経由で取得 (仮のIDなら書き込まれるのを待って本当のIDで読む)
+        plan_id = await resolve_id("plan", plan_id)
+        plan = await get_cached_plan(plan_id) if plan_id is not None else None
+
+        if not plan:
+            raise HTTPException(status_code=404, detail="Plan not found")
+
+        # キャッシュのエントリは共有なので、書き換えずに新しい辞書を作る
+        result = {"plan_id": plan["plan_id"], "plan_name": plan["plan_name"], "total_minutes": plan["total_minutes"]}
+        if include == PlanInclude.header:
+            return result
+
+        if not plan["steps"]:
+            logging.warning("No processes found for plan %s", plan_id)
+
+        if include == PlanInclude.offsets:
+            steps = [{**step, "start_offset": offset} for step, offset in zip(plan["steps"], plan["offsets"])]
+        else:
+            steps = plan["steps"]
+        # 結果を整形 (process_orderの降順)
+        result["processes"] = list(reversed(steps))
+        return result
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# ユーザのすべてのプランを取得するエンドポイント
+@router.get("/user/{user_id}/plans", response_model=List[PlanSummary])
+async def get_plans_by_user_id(user_id: str):
+    try:
+        # user_idでplan_reg情報を取得 (後回しにした登録があれば、書き込まれてから読む)
+        await settle_writes(user_id)
+        plans = await read_once("user_plans", "user_plans", user_id, lambda: resources.db.get_plans_by_user(user_id))
+
+        logging.debug("Plans fetch response: %s", plans)
+
+        if not plans:
+            raise HTTPException(status_code=404, detail="No plans found for user")
+
+        return plans
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
@@ -0,0 +1,360 @@
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+
+from cache import build_plan_entry
+from pagination import decode_cursor, encode_cursor
+from resources import (
+    get_cached_plan, get_plan_for_write, idempotency_key, journaled_write, optional_session, read_once, resolve_id, resources, schedules_written,
+    settle_writes
+)
+from scheduling import format_time, parse_time, wake_up_time, wake_up_times_batch
+from schemas import (
+    ScheduleBatchRequest, ScheduleBatchResponse, ScheduleFullResponse, ScheduleListResponse, ScheduleRegisterRequest,
+    ScheduleRegisterResponse, ScheduleResponse, ScheduleRow, ScheduleTimesResponse
+)
+from sessions import SessionUser
+
+# 予定の登録・取得 (以前の sche_reg.py を含む)
+router = APIRouter()
+
+# 一括登録で受け付けるスケジュール数の上限 (1年分)
+SCHEDULE_BATCH_LIMIT = 366
+
+# 予定一覧で返すカラムと1ページの件数
+SCHEDULE_COLUMNS = "schedule_id, date, departure_time, wake_up_time, plan_id"
+SCHEDULE_PAGE_SIZE = 100
+SCHEDULE_PAGE_MAX = 500
+
+
+async def fetch_schedule_page(user_id, response: Response, date_from: Optional[str], date_to: Optional[str], limit: int, cursor: Optional[str]) -> list:
+    # (date, schedule_id) 順に1ページ分の予定を取得する
+    # 続きがあるときは X-Next-Cursor ヘッダに次のページのカーソルを入れる
+    try:
+        for value in (date_from, date_to):
+            if value:
+                date.fromisoformat(value)
+        after = decode_cursor(cursor) if cursor else None
+        if after is not None:
+            # カーソルの値はそのままDBの絞り込み (PostgRESTの or=(...)) に入るので、日付とIDの形だけを通す
+            if len(after) != 2 or not isinstance(after[0], str) or type(after[1]) is not int:
+                raise ValueError("Invalid cursor")
+            after = [date.fromisoformat(after[0]).isoformat(), after[1]]
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # 1件多く取って、次のページがあるかどうかを判定する
+    schedules = await resources.db.list_schedules(user_id, SCHEDULE_COLUMNS, date_from, date_to, after, limit + 1)
+    if len(schedules) > limit:
+        schedules = schedules[:limit]
+        last = schedules[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last["date"], last["schedule_id"])
+    return schedules
+
+
+# 予定一覧エンドポイント
+@router.get("/schedules/", response_model=ScheduleListResponse)
+async def read_schedules(
+    response: Response,
+    username: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(SCHEDULE_PAGE_SIZE, ge=1, le=SCHEDULE_PAGE_MAX),
+    cursor: Optional[str] = None,
+    session: Optional[SessionUser] = Depends(optional_session)
+):
+    try:
+        # ユーザの取得 (セッショントークンがあればDBを読まない。無ければ username で探す)
+        if session is not None:
+            if username is not None and username != session.user_name:
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Cannot read another user's schedules")
+            user_id = session.user_id
+        elif username:
+            users = await resources.db.get_user_by_name(username, "user_id")
+            if not users:
+                raise HTTPException(status_code=404, detail="User not found")
+            user_id = users[0]["user_id"]
+        else:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated", headers={"WWW-Authenticate": "Bearer"})
+
+        # 予定の取得 (後回しにした登録があれば、書き込まれてから読む)
+        await settle_writes(user_id)
+        schedules = await fetch_schedule_page(user_id, response, date_from, date_to, limit, cursor)
+        if not schedules:
+            raise HTTPException(status_code=404, detail="No schedules found for the user")
+        
+        # レスポンスの作成
+        schedule_list = [
+            ScheduleResponse(
+                date=schedule["date"],
+                departure_time=schedule["departure_time"],
+                wake_up_time=schedule["wake_up_time"]
+            ) for schedule in schedules
+        ]
+        
+        return ScheduleListResponse(schedules=schedule_list)
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.error("Error occurred: %s", e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+@router.post("/register_schedule", response_model=ScheduleRegisterResponse)
+async def register_schedule(schedule_request: ScheduleRegisterRequest, key: Optional[str] = Depends(idempotency_key)):
+    try:
+        # 日付は 'YYYY-MM-DD'、出発時間は 'HH:MM:SS' にそろえる
+        # (SQLite・メモリのストレージはPostgresと違って不正な日付もそのまま保存する。'8:75' などは起床時間を計算できない)
+        try:
+            schedule_date = date.fromisoformat(schedule_request.date).isoformat()
+            departure_time = format_time(parse_time(schedule_request.departure_time))
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        # プランに対応するすべてのステップを取得 (仮のIDのプランは journal から)
+        plan_id, plan = await get_plan_for_write(schedule_request.plan_id)
+
+        if not plan or len(plan["steps"]) == 0:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No steps found for the given plan_id")
+
+        # wake_up_timeを計算 (出発時間 - 保存済みの合計所要時間)
+        _, wake_up = wake_up_time(departure_time, plan["total_minutes"])
+        schedule_data = {
+            "date": schedule_date,
+            "departure_time": departure_time,
+            "wake_up_time": wake_up,
+            "plan_id": plan_id,
+            "user_id": schedule_request.user_id
+        }
+
+        async def insert():
+            # Supabaseにデータを挿入（schedule_id を自動生成）
+            schedule_rows = await resources.db.insert_schedule(schedule_data)
+
+            # 挿入結果の確認
+            if not schedule_rows or len(schedule_rows) == 0:
+                logging.error("Failed to insert schedule: %s", schedule_rows)
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to register schedule")
+
+            # 挿入結果から schedule_id を取得
+            schedule_id = schedule_rows[0].get('schedule_id')  # フィールド名を 'id' に変更
+
+            if schedule_id is None:
+                logging.error("'id' not found in response: %s", schedule_rows)
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve schedule ID")
+
+            await schedules_written([schedule_id], schedule_request.user_id)
+            return schedule_id
+
+        # Idempotency-Key の再送には前のIDを、WRITE_BEHIND なら journal に書いて仮のIDを返す
+        schedule_id = await journaled_write("schedule", schedule_request.user_id, key, schedule_request.model_dump(), schedule_data, insert)
+
+        # スケジュールIDを返す
+        return ScheduleRegisterResponse(schedule_id=str(schedule_id))
+    
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.error("Error occurred: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
+
+def expand_schedule_batch(batch: ScheduleBatchRequest) -> list:
+    # entries の後に recurrence で決まる日付を続けて、(date, departure_time, plan_id) のリストに展開する
+    entries = [(entry.date, entry.departure_time, entry.plan_id) for entry in batch.entries]
+    rule = batch.recurrence
+    if rule is not None:
+        day = date.fromisoformat(rule.start_date)
+        end = date.fromisoformat(rule.end_date)
+        if (end - day).days >= SCHEDULE_BATCH_LIMIT:
+            raise ValueError(f"Recurrence must not span more than {SCHEDULE_BATCH_LIMIT} days")
+        while day <= end:
+            if day.weekday() in rule.days:
+                entries.append((day.isoformat(), rule.departure_time, rule.plan_id))
+            day += timedelta(days=1)
+    # 出発時間は 'HH:MM:SS' にそろえる (parse_time は '8:15' なども通すが、wake_up_times_batch は8文字を前提にする)
+    normalized = []
+    for entry_date, departure_time, plan_id in entries:
+        normalized.append((date.fromisoformat(entry_date).isoformat(), format_time(parse_time(departure_time)), plan_id))
+    return normalized
+
+
+# 予定一括登録エンドポイント (POST)
+# Idempotency-Key を付ければ、タイムアウトの後に送り直しても同じ予定が2回登録されない (同じキーの再送には前のIDを返す)
+@router.post("/register_schedule/batch", response_model=ScheduleBatchResponse)
+async def register_schedule_batch(batch: ScheduleBatchRequest, key: Optional[str] = Depends(idempotency_key)):
+    try:
+        entries = expand_schedule_batch(batch)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if not entries:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No schedules given")
+    if len(entries) > SCHEDULE_BATCH_LIMIT:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=f"At most {SCHEDULE_BATCH_LIMIT} schedules can be registered at once")
+
+    try:
+        async def load_plan(plan_id):
+            # 仮のIDのプランは書き込まれるのを待って本当のIDで読む (一括登録は後回しにしないので、本当のIDが要る)
+            plan_id = await resolve_id("plan", plan_id)
+            return plan_id, await get_cached_plan(plan_id) if plan_id is not None else None
+
+        # 使われているプランごとに1回だけ工程を取得
+        plan_ids = list(dict.fromkeys(plan_id for _, _, plan_id in entries))
+        plans = dict(zip(plan_ids, await asyncio.gather(*(load_plan(plan_id) for plan_id in plan_ids))))
+        for plan_id, (_, plan) in plans.items():
+            if not plan or len(plan["steps"]) == 0:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"No steps found for plan_id {plan_id}")
+
+        # 全件の起床時間をまとめて計算
+        wake_up_times, _ = wake_up_times_batch(
+            [departure_time for _, departure_time, _ in entries],
+            [plans[plan_id][1]["total_minutes"] for _, _, plan_id in entries]
+        )
+        rows = [{
+            "date": entry_date,
+            "departure_time": departure_time,
+            "wake_up_time": wake_up,
+            "plan_id": plans[plan_id][0],
+            "user_id": batch.user_id
+        } for (entry_date, departure_time, plan_id), wake_up in zip(entries, wake_up_times)]
+
+        async def insert():
+            # 1回の複数行insertで登録
+            schedule_rows = await resources.db.insert_schedules(rows)
+
+            if not schedule_rows or len(schedule_rows) != len(entries):
+                logging.error("Failed to insert schedules: %d of %d rows returned", len(schedule_rows or []), len(entries))
+                raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to register schedules")
+
+            schedule_ids = [row["schedule_id"] for row in schedule_rows]
+            await schedules_written(schedule_ids, batch.user_id)
+            return schedule_ids
+
+        # Idempotency-Key の再送には前のIDのリストを返す
+        schedule_ids = await journaled_write("schedule_batch", batch.user_id, key, batch.model_dump(), rows, insert, deferrable=False)
+
+        # 登録した順番のまま schedule_id を返す
+        return ScheduleBatchResponse(schedule_ids=[str(schedule_id) for schedule_id in schedule_ids])
+
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.error("Error occurred: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
+
+
+# 予定一覧エンドポイント
+@router.get("/schedules/user/{user_id}", response_model=List[ScheduleRow])
+async def get_schedules_by_user_id(
+    user_id: str,
+    response: Response,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    limit: int = Query(SCHEDULE_PAGE_SIZE, ge=1, le=SCHEDULE_PAGE_MAX),
+    cursor: Optional[str] = None
+):
+    try:
+        # user_idでschedule_reg情報を1ページ分取得 (期間の指定・カーソルによる続きの取得ができる)
+        await settle_writes(user_id)
+        schedules = await fetch_schedule_page(user_id, response, date_from, date_to, limit, cursor)
+
+        logging.debug("Schedules fetch response: %s", schedules)
+
+        if not schedules:
+            raise HTTPException(status_code=404, detail="Schedules not found for user")
+
+        return schedules
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# 次の予定エンドポイント (今日のまだ出発していない予定か、それ以降で最初の予定)
+@router.get("/schedules/user/{user_id}/next", response_model=ScheduleRow)
+async def get_next_schedule(user_id: str):
+    try:
+        await settle_writes(user_id)
+        now = datetime.now()
+        schedules = await resources.db.get_next_schedule(user_id, now.date().isoformat(), now.strftime('%H:%M:%S'), SCHEDULE_COLUMNS)
+
+        if not schedules:
+            raise HTTPException(status_code=404, detail="No upcoming schedule for user")
+
+        return schedules[0]
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# schedule_idを受け取ってdeparture_timeとwake_up_timeを取得するエンドポイント
+@router.get("/schedule/{schedule_id}/times", response_model=ScheduleTimesResponse)
+async def get_schedule_times(schedule_id: str):
+    try:
+        # schedule_idでschedule_reg情報を取得 (仮のIDなら書き込まれるのを待って本当のIDで読む)
+        schedule_id = await resolve_id("schedule", schedule_id)
+        if schedule_id is None:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+        schedules = await read_once("schedule_times", "schedule", schedule_id, lambda: resources.db.get_schedule(schedule_id, "departure_time, wake_up_time"))
+
+        logging.debug("Schedule fetch response: %s", schedules)
+
+        if not schedules:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+
+        schedule = schedules[0]
+
+        return {
+            "departure_time": schedule["departure_time"],
+            "wake_up_time": schedule["wake_up_time"]
+        }
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
+
+
+# 準備画面用に、予定の時刻・プラン・工程(開始時刻つき)をまとめて返すエンドポイント
+@router.get("/schedule/{schedule_id}/full", response_model=ScheduleFullResponse)
+async def get_schedule_full(schedule_id: str):
+    try:
+        schedule_id = await resolve_id("schedule", schedule_id)
+        if schedule_id is None:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+        schedules = await read_once("schedule_full", "schedule", schedule_id, lambda: resources.db.get_schedule_full(schedule_id))
+
+        if not schedules:
+            raise HTTPException(status_code=404, detail="Schedule not found")
+
+        schedule = schedules[0]
+        if not schedule.get("plan_reg"):
+            raise HTTPException(status_code=404, detail="Plan not found")
+
+        plan = build_plan_entry(schedule["plan_reg"], schedule["plan_reg"].get("process") or [])
+
+        # 各工程の開始時刻 = 起床時間 + 起床からのオフセット
+        wake_up = parse_time(schedule["wake_up_time"])
+        steps = [
+            {**step, "start_time": format_time(wake_up + offset * 60)}
+            for step, offset in zip(plan["steps"], plan["offsets"])
+        ]
+
+        return {
+            "schedule_id": schedule["schedule_id"],
+            "date": schedule["date"],
+            "departure_time": schedule["departure_time"],
+            "wake_up_time": schedule["wake_up_time"],
+            "plan": {"plan_id": plan["plan_id"], "plan_name": plan["plan_name"], "total_minutes": plan["total_minutes"]},
+            "steps": steps
+        }
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.exception("Unexpected error occurred")
+        raise HTTPException(status_code=500, detail=f"Internal Server Error: {str(e)}")
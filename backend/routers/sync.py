@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+import config
+from pagination import decode_cursor, encode_cursor
+from resources import current_session, resources, settle_writes
+from routers.schedules import SCHEDULE_COLUMNS
+from schemas import SyncResponse
+from sessions import SessionUser
+
+# 差分同期
+# 画面ごとに /user/{user_id}/plans や /schedules/user/{user_id} を全件読み直す代わりに、
+# 前回の since から後に追加・変更・削除されたプラン (工程を含む) と予定だけを返す。
+# 変更は change_log (sql/change_log.sql のトリガーが記録する) を version 順に読む。
+# 変更が無ければ change_log のインデックスを1回読むだけで、ほぼ空のレスポンスを返す。
+# since を付けずに呼ぶと最初から (= 全件) 返すので、初回はそれを more=false になるまで続けて読む。
+router = APIRouter()
+
+
+def settled_version(changes: list, since: int) -> int:
+    # SYNC_SETTLE_SECONDS より前に記録された変更のうち、最後の version
+    # (それより新しい変更は返すが、次の since には含めない → 次回もう一度返す)
+    threshold = datetime.now(timezone.utc) - timedelta(seconds=config.sync_settle_seconds)
+    settled = since
+    for change in changes:
+        if datetime.fromisoformat(change["logged_at"]) <= threshold:
+            settled = change["version"]
+    return settled
+
+
+@router.get("/sync", response_model=SyncResponse)
+async def sync(since: Optional[str] = None, session: SessionUser = Depends(current_session)):
+    try:
+        try:
+            version = int(decode_cursor(since)[0]) if since else 0
+        except (ValueError, IndexError, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid since token")
+
+        # 後回しにした登録があれば、書き込まれてから読む
+        await settle_writes(session.user_id)
+        # 1件多く取って、続きがあるかどうかを判定する
+        changes = await resources.db.list_changes(session.user_id, version, config.sync_page_size + 1)
+        more = len(changes) > config.sync_page_size
+        changes = changes[:config.sync_page_size]
+        if not changes:
+            return {"since": since or encode_cursor(0), "more": False}
+
+        # 同じ行が何度変わっていても、今の行を1回だけ返す
+        plan_ids = list(dict.fromkeys(change["entity_id"] for change in changes if change["entity"] == "plan"))
+        schedule_ids = list(dict.fromkeys(change["entity_id"] for change in changes if change["entity"] == "schedule"))
+
+        async def no_rows():
+            return []
+
+        plans, schedules = await asyncio.gather(
+            resources.db.get_plans_with_steps(session.user_id, plan_ids) if plan_ids else no_rows(),
+            resources.db.get_schedules_by_ids(session.user_id, schedule_ids, SCHEDULE_COLUMNS) if schedule_ids else no_rows()
+        )
+        for plan in plans:
+            plan["processes"] = sorted(plan.pop("process") or [], key=lambda step: step["process_order"])
+        # 変更されたのに見つからない行は削除された
+        found_plans = {plan["plan_id"] for plan in plans}
+        found_schedules = {schedule["schedule_id"] for schedule in schedules}
+
+        # 続きがあるときは、返した最後の変更まで進める (確定待ちで止まって同じページを返し続けないように)
+        next_version = changes[-1]["version"] if more else settled_version(changes, version)
+        return {
+            "since": encode_cursor(next_version),
+            "more": more,
+            "plans": plans,
+            "schedules": schedules,
+            "deleted": {
+                "plans": [plan_id for plan_id in plan_ids if plan_id not in found_plans],
+                "schedules": [schedule_id for schedule_id in schedule_ids if schedule_id not in found_schedules]
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error("Error occurred during sync: %s", e)
+        raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -0,0 +1,103 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from resources import current_session, resources, username_might_exist, username_registered
+from schemas import LoginResponse, RegisterResponse, StatusResponse, User, UserResponse
+from sessions import RevocationListFull, SessionUser
+
+# ユーザー登録・ログイン (以前の user_reg.py / login.py)
+router = APIRouter()
+
+
+#####ユーザー登録エンドポイント (POST)#####
+@router.post("/register", response_model=RegisterResponse)
+async def register_user(user: User):
+    try:
+        # フィルタが「無い」と答えた名前は、user_reg_log を読まずに登録に進む
+        existing = await username_might_exist(user.username) and await resources.db.get_user_by_name(user.username, "user_name")
+        if existing:
+            raise HTTPException(status_code=400, detail="User already exists")
+
+        else:
+            hashed_password = await resources.hasher.hash(user.password)
+
+            inserted = await resources.db.insert_user(user.username, hashed_password)
+            await username_registered(user.username)
+
+        # ここでステータスコードを確認
+        if inserted is None:
+            raise HTTPException(status_code=500, detail="Error inserting data into database")
+        # 登録した行が返ってきたら、そのままログイン済みにする
+        user_id = inserted[0].get("user_id") if inserted else None
+        token = resources.sessions.issue(user_id, user.username) if user_id is not None else None
+        return {"user_name": user.username, "status": "User registered successfully", "user_id": user_id, "token": token}
+    except HTTPException as http_exception:
+        raise http_exception
+    except Exception as e:
+        logging.error("Error occurred: %s", e)
+    # エラーログを記録
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+
+# ユーザー取得エンドポイント (GET)
+@router.get("/users/{user_name}", response_model=UserResponse)
+async def get_user(user_name: str):
+    # ユーザー情報を取得 (フィルタが「無い」と答えた名前はDBを読まない)
+    users = await username_might_exist(user_name) and await resources.db.get_user_by_name(user_name)
+
+    # ユーザーが存在しない場合
+    if not users:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    user_data = users[0]  # ユーザーデータを取得
+    return {"user_id": user_data["user_id"], "user_name": user_data["user_name"]}
+
+
+#ログインのエンドポイント
+@router.post("/login", response_model=LoginResponse)
+async def login_user(user: User):
+    try:
+        if not user.username or not user.password:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username and password are required")
+
+        users = await username_might_exist(user.username) and await resources.db.get_user_by_name(user.username, "user_id, user_name, password")
+
+        if not users:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+
+        user_data = users[0]
+
+        if await resources.hasher.verify(user.password, user_data["password"]):
+            # コスト設定が変わっていたら、平文が手元にあるこのタイミングでハッシュを作り直す
+            if resources.hasher.needs_rehash(user_data["password"]):
+                try:
+                    await resources.db.update_user_password(user_data["user_id"], await resources.hasher.hash(user.password))
+                except Exception as e:
+                    logging.warning("Failed to rehash password for user %s: %s", user_data["user_id"], e)
+            return {
+                "user_id": user_data["user_id"],
+                "user_name": user_data["user_name"],
+                "token": resources.sessions.issue(user_data["user_id"], user_data["user_name"]),
+                "expires_in": resources.sessions.ttl
+            }
+        else:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Incorrect password")
+    
+    except HTTPException as http_exception:
+        raise http_exception
+    
+    except Exception as e:
+        logging.error("Error occurred: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
+
+# ログアウト (このトークンを期限まで失効させる)
+@router.post("/logout", response_model=StatusResponse)
+async def logout_user(session: SessionUser = Depends(current_session)):
+    try:
+        await resources.sessions.revoke(session)
+    except RevocationListFull as e:
+        # 失効させられなかったトークンは通り続けるので、ログアウトできたことにはしない
+        logging.error("Logout refused: revocation list is full: %s", e)
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Logout is temporarily unavailable")
+    return {"status": "Logged out"}
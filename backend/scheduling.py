@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+# 起床時間の計算
+# 起床時間 = 出発時間 - 全工程の所要時間の合計 なので、工程を1つずつ並べ替えて
+# timedeltaを引く必要はない。時刻は「0時からの秒数」の整数で扱い、
+# 日付をまたぐ場合 (出発 00:30 で合計60分など) は前日の日付になる。
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def parse_time(value: str) -> int:
+    # 'HH:MM:SS' または 'HH:MM' を0時からの秒数にする
+    parts = value.split(":")
+    if len(parts) not in (2, 3):
+        raise ValueError(f"Invalid time format: {value}")
+    hours, minutes = int(parts[0]), int(parts[1])
+    seconds = int(parts[2]) if len(parts) == 3 else 0
+    if not (0 <= hours < 24 and 0 <= minutes < 60 and 0 <= seconds < 60):
+        raise ValueError(f"Invalid time format: {value}")
+    return hours * 3600 + minutes * 60 + seconds
+
+
+def format_time(seconds: int) -> str:
+    seconds %= SECONDS_PER_DAY
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+def total_minutes(steps: list) -> int:
+    return sum(int(step["step_time"]) for step in steps)
+
+
+def step_offsets(steps: list) -> list:
+    # process_order昇順に並んだ工程について、起床から各工程を始めるまでの分数 (累積和)
+    offsets = []
+    elapsed = 0
+    for step in steps:
+        offsets.append(elapsed)
+        elapsed += int(step["step_time"])
+    return offsets
+
+
+def wake_up_time(departure_time: str, minutes: int) -> tuple:
+    # (日付のずれ(0 か 負の日数), 'HH:MM:SS') を返す
+    wake_up = parse_time(departure_time) - minutes * 60
+    return wake_up // SECONDS_PER_DAY, format_time(wake_up)
+
+
+def wake_up_datetime(date: str, departure_time: str, wake_up_time: str) -> datetime:
+    # 保存された予定 (出発日, 出発時間, 起床時間) から起床の日時を求める
+    # 予定には出発日しか保存しないので、起床時間が出発時間より後なら日付をまたいだ (前日に起きる) とみなす
+    # (出発 00:30 / 起床 23:15 → 前日の 23:15。全工程の合計が24時間未満なら正しい)
+    departure_seconds = parse_time(departure_time)
+    wake_up_seconds = parse_time(wake_up_time)
+    day_offset = -1 if wake_up_seconds > departure_seconds else 0
+    return datetime.fromisoformat(date) + timedelta(days=day_offset, seconds=wake_up_seconds)
+
+
+def calculate_wake_up_time(departure_time: str, steps: list) -> str:
+    # 従来の calculate_wake_up_time と同じ引数・戻り値
+    return wake_up_time(departure_time, total_minutes(steps))[1]
+
+
+def wake_up_times_batch(departure_times: list, minutes: list, dates: list = None) -> tuple:
+    # 大量の (出発時間, 合計分数) の組をまとめて計算する
+    # 戻り値は (起床時間のリスト, 起床日のリスト (datesを渡さなければNone))
+    # numpyはこの関数でしか使わないので、ここで読み込む (起動を軽くするため)
+    import numpy as np
+
+    if len(departure_times) != len(minutes) or (dates is not None and len(dates) != len(minutes)):
+        raise ValueError("departure_times, minutes and dates must have the same length")
+    if not departure_times:
+        return [], ([] if dates is not None else None)
+
+    # 'HH:MM' は 'HH:MM:00' にそろえ、全部つなげた文字列を (n, 8) のuint8行列として読む
+    texts = [value if len(value) == 8 else value + ":00" for value in departure_times]
+    if any(len(text) != 8 or not text.isascii() for text in texts):
+        raise ValueError("departure_times must be 'HH:MM' or 'HH:MM:SS'")
+    chars = np.frombuffer("".join(texts).encode("ascii"), dtype=np.uint8).reshape(-1, 8).astype(np.int64) - ord("0")
+    departure = (chars[:, 0] * 10 + chars[:, 1]) * 3600 + (chars[:, 3] * 10 + chars[:, 4]) * 60 + chars[:, 6] * 10 + chars[:, 7]
+
+    wake_up = departure - np.asarray(minutes, dtype=np.int64) * 60
+    day_offsets = np.floor_divide(wake_up, SECONDS_PER_DAY)
+    wake_up = wake_up - day_offsets * SECONDS_PER_DAY
+
+    # 'HH:MM:SS' をバイト列のまま組み立てて、最後にまとめて文字列にする
+    hours, rest = np.divmod(wake_up, 3600)
+    mins, secs = np.divmod(rest, 60)
+    out = np.empty((len(texts), 8), dtype=np.uint8)
+    out[:, 0], out[:, 1] = hours // 10 + ord("0"), hours % 10 + ord("0")
+    out[:, 3], out[:, 4] = mins // 10 + ord("0"), mins % 10 + ord("0")
+    out[:, 6], out[:, 7] = secs // 10 + ord("0"), secs % 10 + ord("0")
+    out[:, 2] = out[:, 5] = ord(":")
+    joined = out.tobytes().decode("ascii")
+    wake_up_times = [joined[index:index + 8] for index in range(0, len(joined), 8)]
+
+    if dates is None:
+        return wake_up_times, None
+    wake_up_dates = (np.array(dates, dtype="datetime64[D]") + day_offsets).astype(str).tolist()
+    return wake_up_times, wake_up_dates
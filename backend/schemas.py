@@ -0,0 +1,174 @@
+from enum import Enum
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+# リクエスト・レスポンスのモデル
+# レスポンスはすべて response_model で型を決めて、必要なフィールドだけを返す
+# (Supabaseの行をそのまま返すと、列が増えたときに余計なデータまで返してしまう)。
+# 型が決まっていれば、FastAPIはjsonable_encoderでオブジェクトを1つずつたどらずに
+# pydantic-core でまとめてシリアライズできる。
+
+
+class User(BaseModel):
+    username: str
+    password: str
+
+class RegisterResponse(BaseModel):
+    user_name: str
+    status: str
+    user_id: Optional[int] = None
+    # 以降のリクエストで Authorization: Bearer <token> として送るセッショントークン
+    token: Optional[str] = None
+
+# ユーザー取得のレスポンス
+class UserResponse(BaseModel):
+    user_id: int
+    user_name: str
+
+class LoginResponse(UserResponse):
+    token: str
+    token_type: str = "bearer"
+    expires_in: int
+
+class StatusResponse(BaseModel):
+    status: str
+
+# /healthz・/readyz (どのワーカーが答えたか分かるようにpidを返す)
+class HealthResponse(BaseModel):
+    status: str
+    pid: int
+
+class ScheduleRegisterRequest(BaseModel):
+    date: str
+    departure_time: str
+    plan_id: str
+    user_id: str
+
+class ScheduleRegisterResponse(BaseModel):
+    schedule_id: str
+
+# 一括登録の1件分
+class ScheduleBatchEntry(BaseModel):
+    date: str
+    departure_time: str
+    plan_id: str
+
+# 繰り返しの指定 (例: 平日の08:15 → days=[0, 1, 2, 3, 4], departure_time="08:15:00")
+class ScheduleRecurrence(BaseModel):
+    plan_id: str
+    departure_time: str
+    start_date: str
+    end_date: str
+    days: List[int] = [0, 1, 2, 3, 4]  # 0=月曜 ... 6=日曜
+
+class ScheduleBatchRequest(BaseModel):
+    user_id: str
+    entries: List[ScheduleBatchEntry] = []
+    recurrence: Optional[ScheduleRecurrence] = None
+
+class ScheduleBatchResponse(BaseModel):
+    schedule_ids: List[str]
+
+# スケジュールのレスポンス
+class ScheduleResponse(BaseModel):
+    date: str  # 日付
+    departure_time: str  # 出発時間
+    wake_up_time: str  # 起床時間
+
+class ScheduleListResponse(BaseModel):
+    schedules: List[ScheduleResponse]
+
+# 予定一覧・次の予定の1件分 (SCHEDULE_COLUMNS と同じ列)
+class ScheduleRow(BaseModel):
+    schedule_id: int
+    date: str
+    departure_time: str
+    wake_up_time: str
+    plan_id: int
+
+class ScheduleTimesResponse(BaseModel):
+    departure_time: str
+    wake_up_time: str
+
+
+class ProcessCreate(BaseModel):
+    step_name: str
+    step_time: int
+
+class PlanCreate(BaseModel):
+    user_id: int
+    plan_name: str
+    steps: List[ProcessCreate]
+
+class PlanCreateResponse(BaseModel):
+    message: str
+    plan_id: int
+
+class PlanBulkResponse(BaseModel):
+    message: str
+    plan_ids: List[int]
+
+# 工程1件分
+class StepResponse(BaseModel):
+    step_name: str
+    step_time: int
+    process_order: int
+
+class StepsResponse(BaseModel):
+    steps: List[StepResponse]
+
+class PlanSummary(BaseModel):
+    plan_id: int
+    plan_name: str
+
+# /plans/{plan_id} の include で選ぶ内容
+class PlanInclude(str, Enum):
+    header = "header"  # プランのヘッダだけ (plan_id, plan_name, total_minutes)
+    steps = "steps"  # ヘッダ + 工程 (既定)
+    offsets = "offsets"  # ヘッダ + 起床からの開始オフセット(分)つきの工程
+
+class PlanStep(StepResponse):
+    start_offset: Optional[int] = None
+
+class PlanDetailResponse(BaseModel):
+    plan_id: int
+    plan_name: str
+    total_minutes: int
+    # include=header のときは返さない
+    processes: Optional[List[PlanStep]] = None
+
+# 準備画面用 (予定 + プラン + 開始時刻つきの工程)
+class PlanTotal(BaseModel):
+    plan_id: int
+    plan_name: str
+    total_minutes: int
+
+class TimedStep(StepResponse):
+    start_time: str
+
+class ScheduleFullResponse(BaseModel):
+    schedule_id: int
+    date: str
+    departure_time: str
+    wake_up_time: str
+    plan: PlanTotal
+    steps: List[TimedStep]
+
+
+# 差分同期 (GET /sync)
+class SyncPlan(PlanTotal):
+    processes: List[StepResponse]
+
+class SyncDeleted(BaseModel):
+    plans: List[int] = []
+    schedules: List[int] = []
+
+class SyncResponse(BaseModel):
+    # 次のリクエストの since にそのまま渡す
+    since: str
+    # true なら続きがある (すぐにもう一度呼ぶ)
+    more: bool
+    plans: List[SyncPlan] = []
+    schedules: List[ScheduleRow] = []
+    deleted: SyncDeleted = SyncDeleted()
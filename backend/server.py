@@ -0,0 +1,77 @@
+import argparse
+import logging
+import os
+import secrets
+
+import uvicorn
+
+import config
+from logs import setup_logging
+
+# 本番用の起動スクリプト
+# app.py の __main__ は開発用 (1プロセス)。本番はこちらで複数ワーカーを起動する。
+#
+#     cd backend
+#     python server.py                 # ワーカー数 = WEB_CONCURRENCY (0ならCPUコア数。PLAN_CACHE_BACKEND=redis でなければ1)
+#     python server.py --workers 4     # 2以上は PLAN_CACHE_BACKEND=redis が必要
+#
+# - uvloop (イベントループ) と httptools (HTTPパーサ) を使う
+# - SIGTERM / SIGINT を受けたら新しい接続の受け付けをやめ、処理中のリクエストが終わるのを
+#   SERVER_GRACEFUL_TIMEOUT 秒まで待ってから lifespan を閉じる (プールやキャッシュの後片付け)
+# - ワーカーが落ちたら親プロセスが起動し直す
+# - 各ワーカーの /healthz (生存) と /readyz (準備完了) をロードバランサーから確認する
+
+
+def worker_count(requested: int) -> int:
+    # 0 (既定) なら、ワーカー間で状態 (ログアウト・ETagのバージョンなど) を共有できるときだけCPUコア数にする
+    if requested:
+        return requested
+    if config.plan_cache_backend != "redis":
+        return 1
+    return os.cpu_count() or 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple uvicorn workers")
+    parser.add_argument("--host", default=config.server_host)
+    parser.add_argument("--port", type=int, default=config.server_port)
+    parser.add_argument("--workers", type=int, default=config.web_concurrency, help="0 = CPUコア数")
+    args = parser.parse_args()
+
+    setup_logging()
+    workers = worker_count(args.workers)
+    if workers > 1 and config.plan_cache_backend != "redis":
+        parser.error("more than one worker needs PLAN_CACHE_BACKEND=redis (sessions and ETag versions are per worker otherwise)")
+    # ワーカーのプロセスは環境変数を引き継ぐので、ワーカー数に合わせてbcryptのプール数などを決められる
+    # (workers=1 のときはこのプロセスでそのまま動くので、config も書き換えておく)
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    config.web_concurrency = workers
+    if not config.session_secret:
+        # ワーカーごとに別の鍵になると、別のワーカーが発行したトークンが通らないので、ここで1つ決めて渡す
+        # (再起動するとログインし直しになる。本番では SESSION_SECRET を設定すること)
+        logging.warning("SESSION_SECRET is not set; sharing a random secret between workers until restart")
+        config.session_secret = os.environ["SESSION_SECRET"] = secrets.token_urlsafe(32)
+
+    uvicorn.run(
+        "app:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+        backlog=config.server_backlog,
+        limit_concurrency=config.server_limit_concurrency or None,
+        limit_max_requests=config.server_max_requests or None,
+        timeout_keep_alive=config.server_keep_alive,
+        timeout_graceful_shutdown=config.server_graceful_timeout,
+        # アクセスログは出さない (計測は /metrics、エラーはアプリのログで見る)
+        access_log=False,
+        # ロードバランサーの X-Forwarded-For / X-Forwarded-Proto を信用する (信用する送信元は FORWARDED_ALLOW_IPS)
+        proxy_headers=True,
+        # ログの設定は logs.setup_logging に任せる
+        log_config=None
+    )
+
+
+if __name__ == "__main__":
+    main()
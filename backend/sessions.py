@@ -0,0 +1,148 @@
+import base64
+import hashlib
+import hmac
+import logging
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import orjson
+
+import config
+from cache import RedisConnection
+
+# ログインセッション (署名つきトークン)
+# /login と /register でユーザーIDと名前を入れたトークンを発行し、以降のリクエストは
+# Authorization: Bearer <token> の署名と期限を確かめるだけでユーザーが決まる
+# (user_reg_log を読み直さない / bcryptはログインのときだけ)。
+# トークンはサーバーに保存しないので、ログアウトしたトークンだけを期限まで失効リストに入れておく。
+# 形式: base64url(JSONのペイロード) + "." + base64url(HMAC-SHA256)
+
+
+@dataclass(frozen=True)
+class SessionUser:
+    user_id: int
+    user_name: str
+    token_id: str
+    expires_at: int
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip("=")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+class RevocationListFull(Exception):
+    # 失効リストが期限内のトークンでいっぱい。期限内のものを消すとログアウトしたトークンが通ってしまうので、追加を断る
+    pass
+
+
+class LocalRevocationBackend:
+    # ワーカーごとのメモリに持つ。期限切れのトークンはどうせ通らないので、期限が来たら消す
+    # 消すのは期限切れだけ。max_size は SESSION_TTL の間にログアウトされるトークン数より大きくしておく
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        # token_id → 期限 (UNIX時刻)。並びは追加順 (トークンの発行時刻はまちまちなので、期限順とは限らない)
+        self.revoked = OrderedDict()
+
+    async def add(self, token_id: str, expires_at: int):
+        now = time.time()
+        while self.revoked and next(iter(self.revoked.values())) < now:
+            self.revoked.popitem(last=False)
+        if len(self.revoked) >= self.max_size and token_id not in self.revoked:
+            # いっぱいのときは、先頭より後ろにある期限切れも探して消す
+            for expired in [key for key, value in self.revoked.items() if value < now]:
+                del self.revoked[expired]
+            if len(self.revoked) >= self.max_size:
+                raise RevocationListFull(f"{len(self.revoked)} unexpired revoked sessions (SESSION_REVOCATION_SIZE)")
+        self.revoked[token_id] = expires_at
+
+    async def contains(self, token_id: str) -> bool:
+        expires_at = self.revoked.get(token_id)
+        return expires_at is not None and expires_at >= time.time()
+
+    async def close(self):
+        pass
+
+
+class RedisRevocationBackend:
+    # 複数ワーカーで共有する。キーの期限をトークンの期限に合わせるので、掃除は要らない
+    def __init__(self, url: str, prefix: str = "revoked:"):
+        self.redis = RedisConnection(url)
+        self.prefix = prefix
+
+    async def add(self, token_id: str, expires_at: int):
+        ttl = max(int(expires_at - time.time()), 1)
+        await self.redis.command("SET", self.prefix + token_id, "1", "EX", ttl)
+
+    async def contains(self, token_id: str) -> bool:
+        return bool(await self.redis.command("EXISTS", self.prefix + token_id))
+
+    async def close(self):
+        await self.redis.close()
+
+
+class SessionManager:
+    def __init__(self, secret: bytes, ttl: int, revocations):
+        self.secret = secret
+        self.ttl = ttl
+        self.revocations = revocations
+
+    def _sign(self, payload: str) -> str:
+        return _b64encode(hmac.new(self.secret, payload.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, user_id: int, user_name: str) -> str:
+        payload = _b64encode(orjson.dumps({
+            "uid": user_id,
+            "name": user_name,
+            "exp": int(time.time()) + self.ttl,
+            "jti": secrets.token_urlsafe(12)
+        }))
+        return f"{payload}.{self._sign(payload)}"
+
+    def decode(self, token: str) -> SessionUser:
+        # 署名と期限を確かめる。通らなければ ValueError
+        payload, _, signature = token.partition(".")
+        if not signature or not hmac.compare_digest(signature, self._sign(payload)):
+            raise ValueError("Invalid session token")
+        try:
+            claims = orjson.loads(_b64decode(payload))
+            user = SessionUser(user_id=claims["uid"], user_name=claims["name"], token_id=claims["jti"], expires_at=claims["exp"])
+        except Exception:
+            raise ValueError("Invalid session token")
+        if user.expires_at < time.time():
+            raise ValueError("Session expired")
+        return user
+
+    async def verify(self, token: str) -> SessionUser:
+        user = self.decode(token)
+        if await self.revocations.contains(user.token_id):
+            raise ValueError("Session revoked")
+        return user
+
+    async def revoke(self, user: SessionUser):
+        await self.revocations.add(user.token_id, user.expires_at)
+
+    async def close(self):
+        await self.revocations.close()
+
+
+def create_session_manager() -> SessionManager:
+    secret = config.session_secret.encode('utf-8')
+    if not secret:
+        # 再起動や別のワーカーでは通らなくなるので、本番では必ず SESSION_SECRET を設定する
+        logging.warning("SESSION_SECRET is not set; using a random secret for this process")
+        secret = secrets.token_bytes(32)
+    # 共有するかどうかはプランキャッシュと同じ設定に従う
+    if config.plan_cache_backend == "redis":
+        revocations = RedisRevocationBackend(config.redis_url)
+    elif (config.web_concurrency or 1) == 1:
+        revocations = LocalRevocationBackend(max_size=config.session_revocation_size)
+    else:
+        # ワーカーごとの失効リストでは、ログアウトしたトークンが他のワーカーでは通ってしまう
+        raise RuntimeError("WEB_CONCURRENCY > 1 needs PLAN_CACHE_BACKEND=redis (logged out sessions must be shared between workers)")
+    return SessionManager(secret, ttl=config.session_ttl, revocations=revocations)
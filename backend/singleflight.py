@@ -0,0 +1,37 @@
+import asyncio
+
+# 同じキーの読み込みが同時に来たときに、上流(Supabase)への呼び出しを1回にまとめる (single-flight)
+# 家族やクラスで同じプランを共有していると、同じ plan_id への問い合わせが同じ秒にまとめて来るので、
+# 先に来たリクエストの呼び出しが終わるのを後から来たリクエストも待って、同じ結果を受け取る。
+# 結果は共有されるので、呼び出し側で書き換えないこと。
+
+
+class SingleFlight:
+    def __init__(self):
+        self.in_flight = {}
+        # do() が呼ばれた回数と、そのうち実行中の呼び出しに相乗りした回数
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key, func):
+        self.calls += 1
+        task = self.in_flight.get(key)
+        if task is not None and not task.done():
+            self.coalesced += 1
+        else:
+            # 最初の呼び出し元がキャンセルされても、相乗りしている呼び出し元のために最後まで実行する
+            task = asyncio.ensure_future(func())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight)
+        }
@@ -0,0 +1,75 @@
+-- GET /sync (差分同期) 用の変更履歴
+-- plan_reg / process / schedule_reg の行が追加・更新・削除されるたびに、トリガーで1行ずつ記録する。
+-- version はすべての変更を通して単調に増える番号で、クライアントは最後に受け取った version より後の変更だけを読む。
+-- 変更の中身は持たない (読むときに今の行を取り直し、見つからなければ削除されたと判断する)。
+-- process の変更は、その工程を持つプランの変更として記録する。
+
+create table if not exists change_log (
+    version bigserial primary key,
+    user_id bigint not null,
+    entity text not null,          -- 'plan' (plan_reg と process) / 'schedule' (schedule_reg)
+    entity_id bigint not null,
+    logged_at timestamptz not null default now()
+);
+
+-- GET /sync : where user_id = ? and version > ? order by version limit ?
+create index if not exists change_log_user_version_idx
+    on change_log (user_id, version);
+
+create or replace function log_plan_change() returns trigger
+language plpgsql
+as $$
+declare
+    changed plan_reg%rowtype;
+begin
+    if tg_op = 'DELETE' then changed := old; else changed := new; end if;
+    insert into change_log (user_id, entity, entity_id) values (changed.user_id, 'plan', changed.plan_id);
+    return null;
+end;
+$$;
+
+create or replace function log_process_change() returns trigger
+language plpgsql
+as $$
+declare
+    changed process%rowtype;
+begin
+    if tg_op = 'DELETE' then changed := old; else changed := new; end if;
+    -- プランごと消された (カスケード) ときはプラン側で記録済みなので、見つからなければ何もしない
+    insert into change_log (user_id, entity, entity_id)
+    select p.user_id, 'plan', p.plan_id from plan_reg p where p.plan_id = changed.plan_id;
+    return null;
+end;
+$$;
+
+create or replace function log_schedule_change() returns trigger
+language plpgsql
+as $$
+declare
+    changed schedule_reg%rowtype;
+begin
+    if tg_op = 'DELETE' then changed := old; else changed := new; end if;
+    insert into change_log (user_id, entity, entity_id) values (changed.user_id, 'schedule', changed.schedule_id);
+    return null;
+end;
+$$;
+
+drop trigger if exists plan_reg_change_log on plan_reg;
+create trigger plan_reg_change_log after insert or update or delete on plan_reg
+    for each row execute function log_plan_change();
+
+drop trigger if exists process_change_log on process;
+create trigger process_change_log after insert or update or delete on process
+    for each row execute function log_process_change();
+
+drop trigger if exists schedule_reg_change_log on schedule_reg;
+create trigger schedule_reg_change_log after insert or update or delete on schedule_reg
+    for each row execute function log_schedule_change();
+
+-- 既存データの埋め戻し (初めて実行したときだけ)
+insert into change_log (user_id, entity, entity_id)
+select user_id, 'plan', plan_id from plan_reg
+where not exists (select 1 from change_log)
+union all
+select user_id, 'schedule', schedule_id from schedule_reg
+where not exists (select 1 from change_log);
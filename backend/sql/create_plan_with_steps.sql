@@ -0,0 +1,64 @@
+-- プランと工程を1回のRPC(=1トランザクション)でまとめて登録する関数
+-- SupabaseのSQL Editorで実行しておくこと
+-- 途中で失敗した場合は plan_reg / process のどちらにも何も残らない
+
+create or replace function create_plan_with_steps(
+    p_user_id plan_reg.user_id%type,
+    p_plan_name text,
+    p_steps jsonb
+) returns jsonb
+language plpgsql
+as $$
+declare
+    new_plan_id plan_reg.plan_id%type;
+begin
+    -- 合計所要時間と各工程の開始オフセットもここで計算して保存する (plan_durations.sql)
+    insert into plan_reg (user_id, plan_name, total_minutes)
+    values (
+        p_user_id,
+        p_plan_name,
+        (select coalesce(sum((s ->> 'step_time')::int), 0) from jsonb_array_elements(p_steps) as s)
+    )
+    returning plan_id into new_plan_id;
+
+    -- 配列の順番をそのまま process_order (1始まり) にする
+    insert into process (plan_id, step_name, step_time, process_order, start_offset)
+    select new_plan_id,
+           steps.step_name,
+           steps.step_time,
+           steps.process_order,
+           (sum(steps.step_time) over (order by steps.process_order) - steps.step_time)::int
+    from (
+        select s.step ->> 'step_name' as step_name,
+               (s.step ->> 'step_time')::int as step_time,
+               s.ord::int as process_order
+        from jsonb_array_elements(p_steps) with ordinality as s(step, ord)
+    ) as steps;
+
+    return jsonb_build_object('plan_id', new_plan_id);
+end;
+$$;
+
+-- 複数のプランをまとめて登録する (オンボーディング時のインポート用)
+-- 1つでも失敗したら全体がロールバックされる
+create or replace function create_plans_bulk(p_plans jsonb) returns jsonb
+language plpgsql
+as $$
+declare
+    plan_item jsonb;
+    plan_ids jsonb := '[]'::jsonb;
+begin
+    for plan_item in select * from jsonb_array_elements(p_plans)
+    loop
+        plan_ids := plan_ids || jsonb_build_array(
+            create_plan_with_steps(
+                (plan_item ->> 'user_id')::bigint,
+                plan_item ->> 'plan_name',
+                plan_item -> 'steps'
+            ) -> 'plan_id'
+        );
+    end loop;
+
+    return jsonb_build_object('plan_ids', plan_ids);
+end;
+$$;
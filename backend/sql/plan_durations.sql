@@ -0,0 +1,19 @@
+-- プランの合計所要時間と、各工程の開始オフセット(起床から何分後に始めるか)を保存するカラム
+-- 書き込み時に一度だけ計算しておけば、起床時間の計算に工程を読み直す必要がなくなる
+-- create_plan_with_steps.sql より先に実行すること
+
+alter table plan_reg add column if not exists total_minutes int;
+alter table process add column if not exists start_offset int;
+
+-- 既存データの埋め戻し
+update process p
+set start_offset = o.start_offset
+from (
+    select process_id,
+           (sum(step_time) over (partition by plan_id order by process_order) - step_time)::int as start_offset
+    from process
+) o
+where p.process_id = o.process_id;
+
+update plan_reg r
+set total_minutes = coalesce((select sum(step_time) from process p where p.plan_id = r.plan_id), 0);
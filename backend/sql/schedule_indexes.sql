@@ -0,0 +1,14 @@
+-- 予定一覧・次の予定の取得で使うインデックス
+
+-- GET /schedules/user/{user_id} : user_id で絞り、(date, schedule_id) の順に並べてキーセットで読む
+--   where user_id = ? and date >= ? and date <= ?
+--     and (date > ? or (date = ? and schedule_id > ?))
+--   order by date, schedule_id limit ?
+create index if not exists schedule_reg_user_date_id_idx
+    on schedule_reg (user_id, date, schedule_id);
+
+-- GET /schedules/user/{user_id}/next : 今日以降で最初の出発を1件だけ読む
+--   where user_id = ? and date >= ? and (date > ? or (date = ? and departure_time >= ?))
+--   order by date, departure_time limit 1
+create index if not exists schedule_reg_user_date_departure_idx
+    on schedule_reg (user_id, date, departure_time);
@@ -0,0 +1,390 @@
+import functools
+import json
+import sqlite3
+import threading
+
+from db import Repository
+from metrics import upstream_call
+
+# 組み込みSQLiteのストレージエンジン (DB_BACKEND=sqlite)
+# 1台で動かすエッジ環境やテストで、Supabaseへのネットワーク往復なしに同じハンドラを動かす。
+# Repository の各メソッドをSQLで書き直したもので、ハンドラ・キャッシュ・計測はそのまま使える。
+# - WALモード: 読み込みは書き込みを待たない (書き込みは同時に1つ。待つのは busy_timeout まで)
+# - QueryRunner のスレッドごとに1つの接続を持つ (sqlite3 の接続はスレッド間で共有しない)
+# - SQLは呼び出しごとに同じ文字列になるように作る → 接続ごとの文のキャッシュ (prepared statement) に当たる。
+#   IN (...) の代わりに json_each(?) を使うのも、件数によってSQLが変わらないようにするため
+# - テーブル・インデックス・変更履歴のトリガーは sql/ のSupabase用のものと同じ形で、起動時に作る
+
+SCHEMA = """
+create table if not exists user_reg_log (
+    user_id integer primary key autoincrement,
+    user_name text not null unique,
+    password text not null,
+    created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+
+create table if not exists plan_reg (
+    plan_id integer primary key autoincrement,
+    user_id integer not null references user_reg_log (user_id) on delete cascade,
+    plan_name text not null,
+    total_minutes integer,
+    created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+-- GET /user/{user_id}/plans
+create index if not exists plan_reg_user_idx on plan_reg (user_id, plan_id);
+
+create table if not exists process (
+    process_id integer primary key autoincrement,
+    plan_id integer not null references plan_reg (plan_id) on delete cascade,
+    step_name text not null,
+    step_time integer not null,
+    process_order integer not null,
+    start_offset integer,
+    created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+-- プランの工程を process_order 順に読む
+create index if not exists process_plan_order_idx on process (plan_id, process_order);
+
+create table if not exists schedule_reg (
+    schedule_id integer primary key autoincrement,
+    user_id integer not null references user_reg_log (user_id) on delete cascade,
+    plan_id integer not null references plan_reg (plan_id) on delete cascade,
+    date text not null,
+    departure_time text not null,
+    wake_up_time text,
+    created_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+-- sql/schedule_indexes.sql と同じ (予定一覧のキーセットページネーション / 次の予定)
+create index if not exists schedule_reg_user_date_id_idx on schedule_reg (user_id, date, schedule_id);
+create index if not exists schedule_reg_user_date_departure_idx on schedule_reg (user_id, date, departure_time);
+-- プランを消したときのカスケード
+create index if not exists schedule_reg_plan_idx on schedule_reg (plan_id);
+
+-- sql/change_log.sql と同じ変更履歴
+create table if not exists change_log (
+    version integer primary key autoincrement,
+    user_id integer not null,
+    entity text not null,
+    entity_id integer not null,
+    logged_at text not null default (strftime('%Y-%m-%dT%H:%M:%f+00:00', 'now'))
+);
+create index if not exists change_log_user_version_idx on change_log (user_id, version);
+
+create trigger if not exists plan_reg_insert_log after insert on plan_reg begin
+    insert into change_log (user_id, entity, entity_id) values (new.user_id, 'plan', new.plan_id);
+end;
+create trigger if not exists plan_reg_update_log after update on plan_reg begin
+    insert into change_log (user_id, entity, entity_id) values (new.user_id, 'plan', new.plan_id);
+end;
+create trigger if not exists plan_reg_delete_log after delete on plan_reg begin
+    insert into change_log (user_id, entity, entity_id) values (old.user_id, 'plan', old.plan_id);
+end;
+-- 工程の変更はプランの変更として記録する (プランごと消されたときはプラン側で記録済み)
+create trigger if not exists process_insert_log after insert on process begin
+    insert into change_log (user_id, entity, entity_id) select user_id, 'plan', plan_id from plan_reg where plan_id = new.plan_id;
+end;
+create trigger if not exists process_update_log after update on process begin
+    insert into change_log (user_id, entity, entity_id) select user_id, 'plan', plan_id from plan_reg where plan_id = new.plan_id;
+end;
+create trigger if not exists process_delete_log after delete on process begin
+    insert into change_log (user_id, entity, entity_id) select user_id, 'plan', plan_id from plan_reg where plan_id = old.plan_id;
+end;
+create trigger if not exists schedule_reg_insert_log after insert on schedule_reg begin
+    insert into change_log (user_id, entity, entity_id) values (new.user_id, 'schedule', new.schedule_id);
+end;
+create trigger if not exists schedule_reg_update_log after update on schedule_reg begin
+    insert into change_log (user_id, entity, entity_id) values (new.user_id, 'schedule', new.schedule_id);
+end;
+create trigger if not exists schedule_reg_delete_log after delete on schedule_reg begin
+    insert into change_log (user_id, entity, entity_id) values (old.user_id, 'schedule', old.schedule_id);
+end;
+"""
+
+# select(columns) で指定できるカラム ("*" はこの順番)
+TABLE_COLUMNS = {
+    "user_reg_log": ("user_id", "user_name", "password", "created_at"),
+    "plan_reg": ("plan_id", "user_id", "plan_name", "total_minutes", "created_at"),
+    "process": ("process_id", "plan_id", "step_name", "step_time", "process_order", "start_offset", "created_at"),
+    "schedule_reg": ("schedule_id", "user_id", "plan_id", "date", "departure_time", "wake_up_time", "created_at"),
+}
+
+
+@functools.lru_cache(maxsize=256)
+def column_list(table: str, columns: str) -> str:
+    # "plan_id, plan_name" / "*" を、テーブルにあるカラムだけのSQLのカラムリストにする
+    # (カラム名はSQLに埋め込むので、知らない名前は断る)
+    allowed = TABLE_COLUMNS[table]
+    names = allowed if columns.strip() == "*" else tuple(name.strip() for name in columns.split(","))
+    for name in names:
+        if name not in allowed:
+            raise ValueError(f"Unknown column {name!r} for {table}")
+    return ", ".join(names)
+
+
+def _dict_row(cursor, row) -> dict:
+    return {description[0]: value for description, value in zip(cursor.description, row)}
+
+
+class SqliteResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+class SqliteQuery:
+    # QueryRunner のスレッドで execute() される1回分の操作 (supabase-py のクエリと同じ使い方)
+    def __init__(self, client, func, args: tuple):
+        self.client = client
+        self.func = func
+        self.args = args
+
+    def execute(self) -> SqliteResponse:
+        self.client.calls += 1
+        return SqliteResponse(self.func(self.client.connection(), *self.args))
+
+
+class SqliteClient:
+    def __init__(self, path: str, synchronous: str = "normal"):
+        if synchronous not in ("off", "normal", "full", "extra"):
+            raise ValueError(f"Invalid SQLITE_SYNCHRONOUS: {synchronous}")
+        self.path = path
+        self.synchronous = synchronous
+        self.local = threading.local()
+        # close() で閉じるために、全スレッドの接続を覚えておく
+        self.connections = []
+        self.lock = threading.Lock()
+        # 呼び出し回数 (ベンチマーク用。MemoryClient と同じ)
+        self.calls = 0
+        # テーブルは最初に1回だけ作る
+        self.connection().executescript(SCHEMA)
+
+    def connection(self) -> sqlite3.Connection:
+        # このスレッドの接続 (無ければ開く)
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, cached_statements=256)
+            connection.row_factory = _dict_row
+            connection.execute("pragma journal_mode=wal")
+            # WALでは normal でもコミットの順番は壊れない (電源断で最後の数件が消えることはある)
+            connection.execute(f"pragma synchronous={self.synchronous}")
+            connection.execute("pragma foreign_keys=on")
+            connection.execute("pragma busy_timeout=5000")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def close(self):
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+
+
+class transaction:
+    # with transaction(connection): ... の間の書き込みを1つのトランザクションにする (例外ならロールバック)
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("begin immediate")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("rollback" if exc_type else "commit")
+
+
+def _insert_plan(connection, user_id, plan_name: str, steps: list) -> int:
+    # sql/create_plan_with_steps.sql と同じ (合計時間と開始オフセットも保存する)
+    step_times = [int(step["step_time"]) for step in steps]
+    plan_id = connection.execute(
+        "insert into plan_reg (user_id, plan_name, total_minutes) values (?, ?, ?) returning plan_id", (user_id, plan_name, sum(step_times))
+    ).fetchone()["plan_id"]
+    rows = []
+    elapsed = 0
+    for order, (step, step_time) in enumerate(zip(steps, step_times), 1):
+        rows.append((plan_id, step["step_name"], step_time, order, elapsed))
+        elapsed += step_time
+    connection.executemany("insert into process (plan_id, step_name, step_time, process_order, start_offset) values (?, ?, ?, ?, ?)", rows)
+    return plan_id
+
+
+@functools.lru_cache(maxsize=64)
+def _insert_sql(table: str, columns: tuple) -> str:
+    column_list(table, ", ".join(columns))
+    return f"insert into {table} ({', '.join(columns)}) values ({', '.join('?' * len(columns))}) returning *"
+
+
+def _insert_rows(connection, table: str, rows: list) -> list:
+    inserted = []
+    with transaction(connection):
+        for row in rows:
+            columns = tuple(row)
+            inserted.append(connection.execute(_insert_sql(table, columns), tuple(row[column] for column in columns)).fetchone())
+    return inserted
+
+
+class SqliteRepository(Repository):
+    # Repository と同じメソッドを、supabase-py のクエリの代わりにSQLで実行する
+
+    async def run(self, func, *args) -> list:
+        return await self.execute(SqliteQuery(self.client, func, args))
+
+    def close(self):
+        super().close()
+        self.client.close()
+
+    # ----- user_reg_log -----
+    @upstream_call
+    async def get_user_by_name(self, user_name: str, columns: str = "*") -> list:
+        sql = f"select {column_list('user_reg_log', columns)} from user_reg_log where user_name = ?"
+        return await self.run(lambda connection: connection.execute(sql, (user_name,)).fetchall())
+
+    @upstream_call
+    async def insert_user(self, user_name: str, password_hash: str) -> list:
+        return await self.run(lambda connection: connection.execute(
+            "insert into user_reg_log (user_name, password) values (?, ?) returning *", (user_name, password_hash)
+        ).fetchall())
+
+    @upstream_call
+    async def update_user_password(self, user_id, password_hash: str) -> list:
+        return await self.run(lambda connection: connection.execute(
+            "update user_reg_log set password = ? where user_id = ? returning *", (password_hash, user_id)
+        ).fetchall())
+
+    @upstream_call
+    async def list_user_names(self, after_id=None, limit: int = 1000) -> list:
+        return await self.run(lambda connection: connection.execute(
+            "select user_id, user_name from user_reg_log where user_id > ? order by user_id limit ?", (after_id if after_id is not None else -1, limit)
+        ).fetchall())
+
+    # ----- plan_reg / process -----
+    @upstream_call
+    async def create_plan(self, user_id, plan_name: str, steps: list) -> dict:
+        def create(connection):
+            with transaction(connection):
+                return {"plan_id": _insert_plan(connection, user_id, plan_name, steps)}
+        return await self.run(create)
+
+    @upstream_call
+    async def create_plans_bulk(self, plans: list) -> list:
+        def create(connection):
+            with transaction(connection):
+                return [_insert_plan(connection, plan["user_id"], plan["plan_name"], plan["steps"]) for plan in plans]
+        return await self.run(create)
+
+    @upstream_call
+    async def get_plan(self, plan_id, columns: str = "plan_id, plan_name") -> list:
+        sql = f"select {column_list('plan_reg', columns)} from plan_reg where plan_id = ?"
+        return await self.run(lambda connection: connection.execute(sql, (plan_id,)).fetchall())
+
+    @upstream_call
+    async def get_plans_by_user(self, user_id, columns: str = "plan_id, plan_name") -> list:
+        sql = f"select {column_list('plan_reg', columns)} from plan_reg where user_id = ? order by plan_id"
+        return await self.run(lambda connection: connection.execute(sql, (user_id,)).fetchall())
+
+    @upstream_call
+    async def get_steps(self, plan_id, columns: str = "*", desc: bool = None) -> list:
+        sql = f"select {column_list('process', columns)} from process where plan_id = ?"
+        if desc is not None:
+            sql += " order by process_order desc" if desc else " order by process_order"
+        return await self.run(lambda connection: connection.execute(sql, (plan_id,)).fetchall())
+
+    @upstream_call
+    async def get_plans_with_steps(self, user_id, plan_ids: list) -> list:
+        def select(connection):
+            ids = json.dumps([int(plan_id) for plan_id in plan_ids])
+            plans = connection.execute(
+                "select plan_id, plan_name, total_minutes from plan_reg where user_id = ? and plan_id in (select value from json_each(?))", (user_id, ids)
+            ).fetchall()
+            by_id = {plan["plan_id"]: {**plan, "process": []} for plan in plans}
+            for step in connection.execute(
+                "select plan_id, step_name, step_time, process_order from process where plan_id in (select value from json_each(?)) order by plan_id, process_order", (ids,)
+            ):
+                plan = by_id.get(step.pop("plan_id"))
+                if plan is not None:
+                    plan["process"].append(step)
+            return list(by_id.values())
+        return await self.run(select)
+
+    # ----- schedule_reg -----
+    @upstream_call
+    async def insert_schedule(self, schedule_data: dict) -> list:
+        return await self.run(_insert_rows, "schedule_reg", [schedule_data])
+
+    @upstream_call
+    async def insert_schedules(self, rows: list) -> list:
+        # 1トランザクションで登録し、渡した順番のまま返す
+        return await self.run(_insert_rows, "schedule_reg", rows)
+
+    @upstream_call
+    async def get_schedule(self, schedule_id, columns: str = "*") -> list:
+        sql = f"select {column_list('schedule_reg', columns)} from schedule_reg where schedule_id = ?"
+        return await self.run(lambda connection: connection.execute(sql, (schedule_id,)).fetchall())
+
+    @upstream_call
+    async def get_schedule_full(self, schedule_id) -> list:
+        # Supabaseの埋め込みと同じ形 (schedule → plan_reg → process) を、結合した1回の読み込みから作る
+        def select(connection):
+            rows = connection.execute(
+                "select s.schedule_id, s.date, s.departure_time, s.wake_up_time, s.plan_id,"
+                " p.plan_name, p.total_minutes, pr.step_name, pr.step_time, pr.process_order, pr.start_offset"
+                " from schedule_reg s"
+                " left join plan_reg p on p.plan_id = s.plan_id"
+                " left join process pr on pr.plan_id = p.plan_id"
+                " where s.schedule_id = ? order by pr.process_order", (schedule_id,)
+            ).fetchall()
+            if not rows:
+                return []
+            first = rows[0]
+            schedule = {column: first[column] for column in ("schedule_id", "date", "departure_time", "wake_up_time", "plan_id")}
+            schedule["plan_reg"] = None if first["plan_name"] is None else {
+                "plan_id": first["plan_id"],
+                "plan_name": first["plan_name"],
+                "total_minutes": first["total_minutes"],
+                "process": [
+                    {column: row[column] for column in ("step_name", "step_time", "process_order", "start_offset")}
+                    for row in rows if row["process_order"] is not None
+                ]
+            }
+            return [schedule]
+        return await self.run(select)
+
+    @upstream_call
+    async def list_schedules(self, user_id, columns: str, date_from: str = None, date_to: str = None, after: list = None, limit: int = None) -> list:
+        # (user_id, date, schedule_id) のインデックスをそのまま順に読む
+        sql = f"select {column_list('schedule_reg', columns)} from schedule_reg where user_id = ?"
+        params = [user_id]
+        if date_from:
+            sql += " and date >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " and date <= ?"
+            params.append(date_to)
+        if after:
+            sql += " and (date, schedule_id) > (?, ?)"
+            params.extend(after)
+        sql += " order by date, schedule_id limit ?"
+        params.append(limit or -1)
+        return await self.run(lambda connection: connection.execute(sql, params).fetchall())
+
+    @upstream_call
+    async def get_schedules_by_ids(self, user_id, schedule_ids: list, columns: str) -> list:
+        sql = f"select {column_list('schedule_reg', columns)} from schedule_reg where user_id = ? and schedule_id in (select value from json_each(?))"
+        ids = json.dumps([int(schedule_id) for schedule_id in schedule_ids])
+        return await self.run(lambda connection: connection.execute(sql, (user_id, ids)).fetchall())
+
+    @upstream_call
+    async def get_next_schedule(self, user_id, today: str, now: str, columns: str) -> list:
+        sql = (
+            f"select {column_list('schedule_reg', columns)} from schedule_reg"
+            " where user_id = ? and date >= ? and (date, departure_time) >= (?, ?)"
+            " order by date, departure_time limit 1"
+        )
+        return await self.run(lambda connection: connection.execute(sql, (user_id, today, today, now)).fetchall())
+
+    # ----- change_log -----
+    @upstream_call
+    async def list_changes(self, user_id, since: int, limit: int) -> list:
+        return await self.run(lambda connection: connection.execute(
+            "select version, entity, entity_id, logged_at from change_log where user_id = ? and version > ? order by version limit ?", (user_id, since, limit)
+        ).fetchall())
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+# アプリはメモリのスタンドイン (run_app では組み込みSQLiteでも) で動かす (config は import 時に環境変数を読むので、アプリより先に設定する)
+os.environ["DB_BACKEND"] = "memory"
+os.environ["PLAN_CACHE_BACKEND"] = "local"
+os.environ["BCRYPT_ROUNDS"] = "4"
+os.environ["RATE_LIMIT_ENABLED"] = "0"
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["JOURNAL_PATH"] = os.path.join(tempfile.mkdtemp(), "journal.sqlite3")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def run_app(request, monkeypatch, tmp_path):
+    # run_app(body): アプリを起動し (lifespan込み)、body(client) を実行して結果を返す
+    # メモリのスタンドインと組み込みSQLiteの両方で同じテストを動かす (DB・journal はテストごとに新しく作る)
+    import httpx
+
+    import config
+    from app import app
+
+    monkeypatch.setattr(config, "db_backend", request.param)
+    monkeypatch.setattr(config, "sqlite_path", str(tmp_path / "app.sqlite3"))
+    monkeypatch.setattr(config, "journal_path", str(tmp_path / "journal.sqlite3"))
+
+    def run(body):
+        async def main():
+            transport = httpx.ASGITransport(app=app)
+            async with app.router.lifespan_context(app), httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await body(client)
+        return asyncio.run(main())
+    return run
+
+
+async def register(client, name: str = "tester") -> dict:
+    # ユーザーを登録して、以降のリクエストにトークンを付ける
+    registered = (await client.post("/register", json={"username": name, "password": "password"})).json()
+    client.headers["Authorization"] = f"Bearer {registered['token']}"
+    return registered
+
+
+async def create_plan(client, user_id, steps: list = None) -> int:
+    steps = steps or [{"step_name": "歯磨き", "step_time": 5}, {"step_name": "朝食", "step_time": 15}]
+    response = await client.post("/plans/", json={"user_id": user_id, "plan_name": "朝", "steps": steps})
+    response.raise_for_status()
+    return response.json()["plan_id"]
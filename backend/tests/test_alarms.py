@@ -0,0 +1,30 @@
+from datetime import date, datetime, timedelta
+
+import config
+from conftest import create_plan, register
+from resources import load_alarms
+
+
+def test_alarms_wake_up_on_previous_day(run_app, monkeypatch):
+    # 出発 00:30 / 75分のプランの起床は、出発日の前日 23:15
+    # 前日の起床が ALARM_HORIZON_HOURS 内に入る、範囲の翌日の予定も読む
+    departure_day = date.today() + timedelta(days=3)
+    wake_up = datetime.combine(departure_day - timedelta(days=1), datetime.min.time()) + timedelta(hours=23, minutes=15)
+    until = wake_up + timedelta(minutes=15)
+    monkeypatch.setattr(config, "alarm_horizon_hours", (until - datetime.now()).total_seconds() / 3600)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"], [{"step_name": "シャワー", "step_time": 60}, {"step_name": "朝食", "step_time": 15}])
+        response = await client.post("/register_schedule", json={
+            "user_id": str(user["user_id"]), "date": departure_day.isoformat(), "departure_time": "00:30:00", "plan_id": str(plan_id)
+        })
+        assert response.status_code == 200, response.text
+        return await load_alarms(user["user_id"])
+
+    alarms = sorted(run_app(body), key=lambda alarm: alarm[0])
+    assert [(datetime.fromtimestamp(alarm[0]), alarm[2]) for alarm in alarms] == [
+        (wake_up, -1),
+        (wake_up, 0),
+        (wake_up + timedelta(minutes=60), 1)
+    ]
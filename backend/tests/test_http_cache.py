@@ -0,0 +1,36 @@
+from conftest import create_plan, register
+from resources import resources
+
+
+def test_revalidation_skips_the_database(run_app):
+    # 一致するETagの確認は、DBを読まずに304を返す。書き込みの後は外れて読み直す
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        url = f"/user/{user['user_id']}/plans"
+        first = await client.get(url)
+        etag = first.headers["etag"]
+
+        before = resources.db.client.calls
+        revalidated = await client.get(url, headers={"If-None-Match": etag})
+        calls_on_revalidation = resources.db.client.calls - before
+
+        await create_plan(client, user["user_id"])
+        changed = await client.get(url, headers={"If-None-Match": etag})
+        return plan_id, first, revalidated, calls_on_revalidation, changed, etag
+
+    plan_id, first, revalidated, calls, changed, etag = run_app(body)
+    assert first.status_code == 200
+    assert revalidated.status_code == 304 and revalidated.content == b""
+    assert calls == 0
+    assert changed.status_code == 200 and changed.headers["etag"] != etag
+    assert len(changed.json()) == 2
+
+
+def test_wildcard_if_none_match_does_not_hide_missing_resources(run_app):
+    async def body(client):
+        await register(client)
+        missing = await client.get("/plans/999999", headers={"If-None-Match": "*"})
+        return missing.status_code
+
+    assert run_app(body) == 404
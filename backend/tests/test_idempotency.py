@@ -0,0 +1,129 @@
+import sqlite3
+
+import config
+from conftest import register
+from db import DatabaseTimeoutError
+from resources import resources
+
+STEPS = [{"step_name": "歯磨き", "step_time": 5}]
+
+
+def plan_request(client, user_id, key):
+    return client.post("/plans/", json={"user_id": user_id, "plan_name": "朝", "steps": STEPS}, headers={"Idempotency-Key": key})
+
+
+def test_retry_after_unknown_outcome_is_not_written_again(run_app, monkeypatch):
+    # タイムアウトではDBにコミットされているかもしれないので、同じキーの再送は書かずに409
+    async def body(client):
+        user = await register(client)
+        create_plan = resources.db.create_plan
+        attempts = []
+
+        async def timed_out(*args):
+            attempts.append(None)
+            await create_plan(*args)
+            raise DatabaseTimeoutError("Database call timed out")
+
+        monkeypatch.setattr(resources.db, "create_plan", timed_out)
+        first = await plan_request(client, user["user_id"], "key-1")
+        retry = await plan_request(client, user["user_id"], "key-1")
+        return first.status_code, retry.status_code, len(attempts)
+
+    assert run_app(body) == (500, 409, 1)
+
+
+def test_retry_after_rejected_write_is_written(run_app, monkeypatch):
+    # DBが断った (何も書かれていない) ときは、同じキーで送り直せばもう一度書く
+    async def body(client):
+        user = await register(client)
+        create_plan = resources.db.create_plan
+        attempts = []
+
+        async def rejected_once(*args):
+            attempts.append(None)
+            if len(attempts) == 1:
+                raise sqlite3.IntegrityError("FOREIGN KEY constraint failed")
+            return await create_plan(*args)
+
+        monkeypatch.setattr(resources.db, "create_plan", rejected_once)
+        first = await plan_request(client, user["user_id"], "key-2")
+        retry = await plan_request(client, user["user_id"], "key-2")
+        replay = await plan_request(client, user["user_id"], "key-2")
+        return first.status_code, retry.status_code, replay.json() == retry.json(), len(attempts)
+
+    assert run_app(body) == (500, 200, True, 2)
+
+
+def batch_request(client, user_id, plan_id, key, dates=("2026-01-05", "2026-01-06")):
+    return client.post("/register_schedule/batch", json={
+        "user_id": str(user_id),
+        "entries": [{"date": day, "departure_time": "08:15:00", "plan_id": str(plan_id)} for day in dates]
+    }, headers={"Idempotency-Key": key})
+
+
+def test_batch_retry_returns_the_same_schedules(run_app):
+    async def body(client):
+        user = await register(client)
+        plan_id = (await plan_request(client, user["user_id"], "plan")).json()["plan_id"]
+        first = await batch_request(client, user["user_id"], plan_id, "batch-1")
+        retry = await batch_request(client, user["user_id"], plan_id, "batch-1")
+        other = await batch_request(client, user["user_id"], plan_id, "batch-1", dates=("2026-02-01",))
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}")).json()
+        return first.json(), retry.json(), other.status_code, len(schedules)
+
+    first, retry, other, count = run_app(body)
+    assert retry == first and len(first["schedule_ids"]) == 2
+    assert other == 422
+    assert count == 2
+
+
+def test_batch_retry_after_unknown_outcome_is_not_written_again(run_app, monkeypatch):
+    async def body(client):
+        user = await register(client)
+        plan_id = (await plan_request(client, user["user_id"], "plan")).json()["plan_id"]
+        insert_schedules = resources.db.insert_schedules
+
+        async def timed_out(rows):
+            await insert_schedules(rows)
+            raise DatabaseTimeoutError("Database call timed out")
+
+        monkeypatch.setattr(resources.db, "insert_schedules", timed_out)
+        first = await batch_request(client, user["user_id"], plan_id, "batch-2")
+        monkeypatch.setattr(resources.db, "insert_schedules", insert_schedules)
+        retry = await batch_request(client, user["user_id"], plan_id, "batch-2")
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}")).json()
+        return first.status_code, retry.status_code, len(schedules)
+
+    assert run_app(body) == (500, 409, 2)
+
+
+def test_batch_accepts_provisional_plan_id(run_app, monkeypatch):
+    # WRITE_BEHIND で返った仮のIDのプランにも、書き込まれるのを待ってから一括登録できる
+    monkeypatch.setattr(config, "write_behind", True)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = (await plan_request(client, user["user_id"], "plan")).json()["plan_id"]
+        batch = await batch_request(client, user["user_id"], plan_id, "batch-3")
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}")).json()
+        plans = (await client.get(f"/user/{user['user_id']}/plans")).json()
+        return plan_id, batch.status_code, {schedule["plan_id"] for schedule in schedules}, [plan["plan_id"] for plan in plans]
+
+    plan_id, status_code, schedule_plans, plans = run_app(body)
+    assert plan_id < 0
+    assert status_code == 200
+    assert schedule_plans == set(plans) and len(plans) == 1 and plans[0] > 0
+
+
+def test_bulk_plans_retry_returns_the_same_plans(run_app):
+    async def body(client):
+        user = await register(client)
+        plans = [{"user_id": user["user_id"], "plan_name": name, "steps": STEPS} for name in ("平日", "休日")]
+        first = await client.post("/plans/bulk", json=plans, headers={"Idempotency-Key": "bulk-1"})
+        retry = await client.post("/plans/bulk", json=plans, headers={"Idempotency-Key": "bulk-1"})
+        listed = (await client.get(f"/user/{user['user_id']}/plans")).json()
+        return first.json()["plan_ids"], retry.json()["plan_ids"], len(listed)
+
+    first, retry, count = run_app(body)
+    assert retry == first and len(first) == 2
+    assert count == 2
@@ -0,0 +1,88 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+
+from db import DatabaseTimeoutError
+from journal import FLUSH_LEASE, Journal
+
+PLAN = {"user_id": 1, "plan_name": "朝", "steps": [{"step_name": "歯磨き", "step_time": 5}]}
+
+
+class FlakyDb:
+    # create_plans_bulk: error があれば、書いてから (committed) / 書かずに error を投げる
+    def __init__(self, error=None, committed=False):
+        self.error = error
+        self.committed = committed
+        self.written = []
+
+    async def create_plans_bulk(self, plans):
+        if self.error is not None and not self.committed:
+            error, self.error = self.error, None
+            raise error
+        start = len(self.written)
+        self.written += plans
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+        return list(range(start + 1, len(self.written) + 1))
+
+
+def run_journal(body):
+    async def main():
+        journal = Journal(os.path.join(tempfile.mkdtemp(), "journal.sqlite3"), True, 100, 0.01, 3, 0.01, 3600, 1)
+        journal.open()
+        try:
+            return await body(journal)
+        finally:
+            await journal.close()
+    return asyncio.run(main())
+
+
+async def flushed(entry, result_id):
+    pass
+
+
+async def flush_again(journal, db):
+    # バックオフの待ちを飛ばして、もう一度送る
+    await journal._run(journal.connection.execute, "update journal set next_attempt = 0")
+    return await journal.flush_once(db, flushed)
+
+
+async def state_of(journal, seq):
+    return (await journal._run(journal._lookup, "plan", seq))["state"]
+
+
+def test_timeout_after_commit_is_not_flushed_again():
+    async def body(journal):
+        entry = await journal.begin("plan", 1, None, {}, PLAN, True)
+        db = FlakyDb(DatabaseTimeoutError("Database call timed out"), committed=True)
+        await journal.flush_once(db, flushed)
+        await flush_again(journal, db)
+        return len(db.written), await state_of(journal, entry["seq"]), await journal.resolve("plan", -entry["seq"])
+
+    assert run_journal(body) == (1, "unknown", None)
+
+
+def test_rejected_flush_is_retried():
+    async def body(journal):
+        entry = await journal.begin("plan", 1, None, {}, PLAN, True)
+        db = FlakyDb(sqlite3.IntegrityError("FOREIGN KEY constraint failed"))
+        await journal.flush_once(db, flushed)
+        await flush_again(journal, db)
+        return len(db.written), await state_of(journal, entry["seq"])
+
+    assert run_journal(body) == (1, "done")
+
+
+def test_entry_left_flushing_is_not_flushed_again():
+    # 送信中にワーカーが落ちた行は、insert がコミットされたかもしれないので FLUSH_LEASE が過ぎても送り直さない
+    async def body(journal):
+        entry = await journal.begin("plan", 1, None, {}, PLAN, True)
+        claimed = await journal._run(journal._claim)
+        await journal._run(journal.connection.execute, "update journal set claimed_at = claimed_at - ?", (FLUSH_LEASE + 1,))
+        db = FlakyDb()
+        await journal.flush_once(db, flushed)
+        return len(claimed), len(db.written), await state_of(journal, entry["seq"])
+
+    assert run_journal(body) == (1, 0, "unknown")
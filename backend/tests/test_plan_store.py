@@ -0,0 +1,92 @@
+from cache import build_plan_entry
+from plan_store import PlanStore
+
+
+def entry(plan_id: int, step_time: int = 5) -> dict:
+    steps = [{"step_name": "歯磨き", "step_time": step_time, "process_order": 1}, {"step_name": "朝食", "step_time": 15, "process_order": 2}]
+    return build_plan_entry({"plan_id": plan_id, "plan_name": f"plan{plan_id}", "total_minutes": None}, steps)
+
+
+def fill(store: PlanStore, plan_ids) -> None:
+    for plan_id in plan_ids:
+        store.put(plan_id, entry(plan_id))
+
+
+def present(store: PlanStore, plan_ids) -> list:
+    # get は参照ビットを立てるので、追い出しの順番を調べるときは index を見る
+    return [plan_id for plan_id in plan_ids if plan_id in store.index]
+
+
+def test_evicts_in_clock_order_when_full():
+    store = PlanStore(capacity=3, ttl=3600)
+    fill(store, [1, 2, 3, 4, 5])
+    assert present(store, range(1, 6)) == [3, 4, 5]
+    assert store.evictions == 2
+    assert len(store) == 3
+
+
+def test_referenced_row_gets_a_second_chance():
+    store = PlanStore(capacity=3, ttl=3600)
+    fill(store, [1, 2, 3])
+    assert store.get(1)["plan_name"] == "plan1"
+    fill(store, [4])
+    # 1 は参照ビットを落とされて残り、次の 2 が追い出される
+    assert present(store, range(1, 5)) == [1, 3, 4]
+    # 針は 2 の次 (3) から進むので、1 より先に 3 が追い出される
+    fill(store, [5])
+    assert present(store, range(1, 6)) == [1, 4, 5]
+
+
+def test_compaction_keeps_entries_readable_and_hand_in_place():
+    store = PlanStore(capacity=2000, ttl=3600)
+    fill(store, range(1, 2001))
+    for plan_id in range(1, 1001):
+        store.get(plan_id)
+    # 1〜1000 は1周見逃されて 1001 が追い出され、針は 1002 の行を指す
+    fill(store, [2001])
+    assert 1001 not in store.index and store.hand == 1001
+    for plan_id in [*range(100, 1000), *range(1500, 1800)]:
+        store.delete(plan_id)
+
+    survivors = [*range(1, 100), 1000, *range(1002, 1500), *range(1800, 2002)]
+    # 死んだ行が1024を超えて生きている行より多くなった時点で詰め直している
+    assert len(store.plan_id) < 2001 and store.dead < 1024
+    assert len(store.plan_id) == len(survivors) + store.dead
+    assert sorted(store.index) == survivors
+    assert all(store.get(plan_id) == entry(plan_id) for plan_id in survivors)
+    # 針は詰め直した後も同じ行 (1002) を指し、満杯で足すと 1002 から追い出す
+    assert 0 <= store.hand <= len(store.plan_id)
+    assert store.plan_id[store.hand] == 1002
+    for plan_id in survivors:
+        store.referenced[store.index[plan_id]] = 0
+    store.capacity = len(store)
+    fill(store, [3000])
+    assert 1002 not in store.index and 1000 in store.index and store.get(3000) == entry(3000)
+
+
+def test_expired_entries_are_dropped():
+    store = PlanStore(capacity=10, ttl=-1)
+    store.put(1, entry(1))
+    store.put(2, entry(2, step_time=70000))
+    assert len(store) == 2
+    assert store.get(1) is None and store.get(2) is None
+    assert len(store) == 0
+
+
+def test_entries_that_do_not_fit_columns_are_kept_as_is():
+    store = PlanStore(capacity=2, ttl=3600)
+    large = entry(1, step_time=70000)
+    store.put(1, large)
+    store.put("abc", entry(2))
+    assert store.others.keys() == {"1", "abc"} and not store.index
+    assert store.get(1) == large and store.get("abc") == entry(2)
+    # 列に入れ直すと others からは消える
+    store.put(1, entry(1))
+    assert store.others.keys() == {"abc"} and store.get(1) == entry(1)
+    # 列が空になったら others から追い出す
+    store.delete(1)
+    store.put("def", entry(3))
+    store.put("ghi", entry(4))
+    assert len(store) == 2 and store.evictions == 1 and "abc" not in store.others
+    store.delete("def")
+    assert store.get("def") is None and len(store) == 1
@@ -0,0 +1,19 @@
+from conftest import create_plan, register
+
+STEPS = [{"step_name": "歯磨き", "step_time": 5}, {"step_name": "朝食", "step_time": 15}, {"step_name": "着替え", "step_time": 10}]
+
+
+def test_plan_with_offsets_and_user_plans(run_app):
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"], STEPS)
+        bulk = await client.post("/plans/bulk", json=[{"user_id": user["user_id"], "plan_name": f"休日{number}", "steps": STEPS} for number in range(2)])
+        detail = await client.get(f"/plans/{plan_id}", params={"include": "offsets"})
+        plans = await client.get(f"/user/{user['user_id']}/plans")
+        return plan_id, bulk.json()["plan_ids"], detail.json(), plans.json()
+
+    plan_id, bulk_ids, detail, plans = run_app(body)
+    assert detail["total_minutes"] == 30
+    # process_order の降順で、起床から始めるまでの分数つき
+    assert [(step["step_name"], step["start_offset"]) for step in detail["processes"]] == [("着替え", 20), ("朝食", 5), ("歯磨き", 0)]
+    assert sorted(plan["plan_id"] for plan in plans) == sorted([plan_id, *bulk_ids])
@@ -0,0 +1,22 @@
+import config
+
+ORIGIN = {"Origin": "http://localhost:3000"}
+
+
+def test_rate_limited_response_has_cors_headers(run_app, monkeypatch):
+    # 429 もCORSのヘッダ付きで返す (無いとブラウザからは通信エラーに見え、Retry-After も読めない)
+    monkeypatch.setattr(config, "rate_limit_enabled", True)
+    monkeypatch.setattr(config, "rate_limit_auth", "1/60")
+
+    async def body(client):
+        login = {"username": "nobody", "password": "password"}
+        first = await client.post("/login", json=login, headers=ORIGIN)
+        limited = await client.post("/login", json=login, headers=ORIGIN)
+        return first, limited
+
+    first, limited = run_app(body)
+    assert first.status_code != 429
+    assert limited.status_code == 429
+    assert limited.headers["access-control-allow-origin"] == "*"
+    assert "retry-after" in limited.headers["access-control-expose-headers"].lower()
+    assert limited.headers["retry-after"]
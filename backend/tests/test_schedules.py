@@ -0,0 +1,102 @@
+from conftest import create_plan, register
+from pagination import encode_cursor
+
+
+def test_batch_accepts_unpadded_departure_times(run_app):
+    # parse_time が通す書き方は、1件ずつの登録と同じく一括登録でも受け付ける
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        departures = ["8:15", "8:15:0", "8:15:00", "08:15"]
+        response = await client.post("/register_schedule/batch", json={
+            "user_id": str(user["user_id"]),
+            "entries": [{"date": "2026-01-05", "departure_time": departure, "plan_id": str(plan_id)} for departure in departures]
+        })
+        assert response.status_code == 200, response.text
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}")).json()
+        return schedules
+
+    schedules = run_app(body)
+    assert [(row["departure_time"], row["wake_up_time"]) for row in schedules] == [("08:15:00", "07:55:00")] * 4
+
+
+def test_batch_rejects_invalid_departure_time(run_app):
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        return await client.post("/register_schedule/batch", json={
+            "user_id": str(user["user_id"]),
+            "entries": [{"date": "2026-01-05", "departure_time": "8:75", "plan_id": str(plan_id)}]
+        })
+
+    assert run_app(body).status_code == 400
+
+
+def test_list_rejects_crafted_cursor(run_app):
+    # カーソルの中身が日付とIDでなければ、DBに渡さずに400
+    async def body(client):
+        user = await register(client)
+        url = f"/schedules/user/{user['user_id']}"
+        cursors = [
+            encode_cursor("2024-07-01,schedule_id.gt.0)", 1),
+            encode_cursor("2024-07-01", "1),or(user_id.gt.0"),
+            encode_cursor("2024-07-01", True),
+            encode_cursor(20240701, 1),
+            encode_cursor("2024-07-01"),
+            "not base64!",
+        ]
+        return [(await client.get(url, params={"cursor": cursor})).status_code for cursor in cursors]
+
+    assert run_app(body) == [400] * 6
+
+
+def test_register_rejects_invalid_date(run_app):
+    # Postgresなら断られる日付も、SQLite・メモリのストレージはそのまま保存してしまうので、ハンドラで400
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        request = {"departure_time": "08:15:00", "plan_id": str(plan_id), "user_id": str(user["user_id"])}
+        invalid = await client.post("/register_schedule", json={**request, "date": "not-a-date"})
+        valid = await client.post("/register_schedule", json={**request, "date": "2026-01-05"})
+        return invalid.status_code, valid.status_code
+
+    assert run_app(body) == (400, 200)
+
+
+def test_register_rejects_invalid_departure_time(run_app):
+    # 起床時間を計算できない出発時間は、500ではなく400 (正しい書き方は 'HH:MM:SS' にそろえて保存する)
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        request = {"date": "2026-01-05", "plan_id": str(plan_id), "user_id": str(user["user_id"])}
+        statuses = [(await client.post("/register_schedule", json={**request, "departure_time": departure})).status_code
+                    for departure in ("8:75", "25:00", "abc", "8:15")]
+        schedules = (await client.get(f"/schedules/user/{user['user_id']}")).json()
+        return statuses, [(row["departure_time"], row["wake_up_time"]) for row in schedules]
+
+    assert run_app(body) == ([400, 400, 400, 200], [("08:15:00", "07:55:00")])
+
+
+def test_list_pages_through_every_schedule(run_app):
+    # X-Next-Cursor をたどると、(date, schedule_id) 順に全件が1回ずつ返る
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        dates = ["2026-01-07", "2026-01-05", "2026-01-06", "2026-01-05", "2026-01-08"]
+        response = await client.post("/register_schedule/batch", json={
+            "user_id": str(user["user_id"]),
+            "entries": [{"date": day, "departure_time": "08:15:00", "plan_id": str(plan_id)} for day in dates]
+        })
+        ids = [int(schedule_id) for schedule_id in response.json()["schedule_ids"]]
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = await client.get(f"/schedules/user/{user['user_id']}", params=params)
+            pages.append([(row["date"], row["schedule_id"]) for row in page.json()])
+            cursor = page.headers.get("x-next-cursor")
+            if cursor is None:
+                return sorted(zip(dates, ids)), pages
+
+    expected, pages = run_app(body)
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [row for page in pages for row in page] == expected
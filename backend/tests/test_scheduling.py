@@ -0,0 +1,16 @@
+from datetime import datetime
+
+from scheduling import wake_up_datetime, wake_up_time
+
+
+def test_wake_up_time_rolls_over_to_previous_day():
+    assert wake_up_time("00:30:00", 75) == (-1, "23:15:00")
+    assert wake_up_time("08:00:00", 20) == (0, "07:40:00")
+
+
+def test_wake_up_datetime_from_stored_schedule():
+    # 出発日と、保存された出発時間・起床時間から起床の日時を求める
+    assert wake_up_datetime("2026-10-20", "00:30:00", "23:15:00") == datetime(2026, 10, 19, 23, 15)
+    assert wake_up_datetime("2026-10-20", "08:00:00", "07:40:00") == datetime(2026, 10, 20, 7, 40)
+    assert wake_up_datetime("2026-10-20", "8:00", "08:00:00") == datetime(2026, 10, 20, 8, 0)
+    assert wake_up_datetime("2026-01-01", "00:10", "23:50:00") == datetime(2025, 12, 31, 23, 50)
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import register
+from resources import resources
+from sessions import LocalRevocationBackend, RevocationListFull
+
+
+def test_revocation_list_keeps_unexpired_tokens():
+    # いっぱいでも期限内の失効は忘れない。期限切れだけを消して場所を作る
+    async def main():
+        backend = LocalRevocationBackend(max_size=2)
+        now = time.time()
+        await backend.add("a", now + 3600)
+        await backend.add("b", now + 3600)
+        with pytest.raises(RevocationListFull):
+            await backend.add("c", now + 3600)
+        kept = [await backend.contains("a"), await backend.contains("b"), await backend.contains("c")]
+
+        backend = LocalRevocationBackend(max_size=2)
+        await backend.add("live", now + 3600)
+        backend.revoked["expired"] = now - 1
+        await backend.add("new", now + 3600)
+        return kept, sorted(backend.revoked)
+
+    kept, remaining = asyncio.run(main())
+    assert kept == [True, True, False]
+    assert remaining == ["live", "new"]
+
+
+def test_logout_fails_closed_when_revocation_list_is_full(run_app):
+    async def body(client):
+        await register(client, "first")
+        first = dict(client.headers)
+        await register(client, "second")
+        resources.sessions.revocations.max_size = 1
+        assert (await client.post("/logout")).status_code == 200
+        # 2人目のログアウトは覚えられないので断る (トークンはまだ通る)
+        client.headers.update(first)
+        refused = await client.post("/logout")
+        still_valid = await client.post("/logout")
+        return refused.status_code, still_valid.status_code
+
+    assert run_app(body) == (503, 503)
@@ -0,0 +1,89 @@
+import asyncio
+
+from conftest import create_plan, register
+from resources import read_once, resources
+from singleflight import SingleFlight
+
+
+def test_read_after_write_does_not_join_older_read(run_app):
+    # 書き込みでバージョンが上がった後の読み込みは、その前に始まった読み込みに相乗りしない
+    async def body(client):
+        gate = asyncio.Event()
+        calls = []
+
+        async def slow_read():
+            calls.append(None)
+            number = len(calls)
+            await gate.wait()
+            return number
+
+        first = asyncio.ensure_future(read_once("test", "user_plans", 1, slow_read))
+        await asyncio.sleep(0)
+        joined = asyncio.ensure_future(read_once("test", "user_plans", 1, slow_read))
+        await asyncio.sleep(0)
+        await resources.versions.bump("user_plans", 1)
+        after_write = asyncio.ensure_future(read_once("test", "user_plans", 1, slow_read))
+        await asyncio.sleep(0.01)
+        gate.set()
+        return await asyncio.gather(first, joined, after_write), len(calls)
+
+    results, calls = run_app(body)
+    assert results == [1, 1, 2]
+    assert calls == 2
+
+
+def test_concurrent_misses_call_upstream_once():
+    # 同じキーの同時の読み込み N 件で、遅い上流を呼ぶのは1回だけ。全員が同じ結果を受け取る
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def slow_upstream():
+            calls.append(None)
+            await asyncio.sleep(0.05)
+            return {"plan_id": 1}
+
+        results = await asyncio.gather(*(flight.do(("plan", "1"), slow_upstream) for _ in range(20)))
+        return results, len(calls), flight.stats()
+
+    results, calls, stats = asyncio.run(main())
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert stats == {"calls": 20, "coalesced": 19, "in_flight": 0}
+
+
+def test_result_is_shared_when_first_caller_is_cancelled():
+    # 最初の呼び出し元がキャンセルされても、相乗りした呼び出し元は上流を呼び直さずに結果を受け取る
+    async def main():
+        flight = SingleFlight()
+        calls = []
+
+        async def slow_upstream():
+            calls.append(None)
+            await asyncio.sleep(0.05)
+            return "loaded"
+
+        first = asyncio.ensure_future(flight.do("key", slow_upstream))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("key", slow_upstream))
+        await asyncio.sleep(0)
+        first.cancel()
+        result = await second
+        return first.cancelled(), result, len(calls)
+
+    assert asyncio.run(main()) == (True, "loaded", 1)
+
+
+def test_concurrent_plan_requests_read_the_database_once(run_app):
+    # 遅いDB (メモリのスタンドインに遅延を足す) で、同じプランへの同時の GET は plan_reg / process を1回ずつしか読まない
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        resources.db.client.latency = 0.05
+        before = resources.db.client.calls
+        responses = await asyncio.gather(*(client.get(f"/plans/{plan_id}") for _ in range(10)))
+        return [response.status_code for response in responses], resources.db.client.calls - before
+
+    statuses, round_trips = run_app(body)
+    assert statuses == [200] * 10
+    assert round_trips == 2
@@ -0,0 +1,109 @@
+import config
+from conftest import create_plan, register
+from pagination import decode_cursor
+from resources import resources
+
+
+async def add_schedules(client, user_id, plan_id, dates: list) -> list:
+    response = await client.post("/register_schedule/batch", json={
+        "user_id": str(user_id),
+        "entries": [{"date": day, "departure_time": "08:15:00", "plan_id": str(plan_id)} for day in dates]
+    })
+    return [int(schedule_id) for schedule_id in response.json()["schedule_ids"]]
+
+
+def delete_schedule(schedule_id):
+    # 予定を消すエンドポイントは無いので、ストレージで直接消す (change_log には削除として残る)
+    if config.db_backend == "sqlite":
+        resources.db.client.connection().execute("delete from schedule_reg where schedule_id = ?", (schedule_id,))
+    else:
+        resources.db.client.table("schedule_reg").delete().eq("schedule_id", schedule_id).execute()
+
+
+def test_first_sync_returns_everything(run_app, monkeypatch):
+    monkeypatch.setattr(config, "sync_settle_seconds", 0)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        schedule_ids = await add_schedules(client, user["user_id"], plan_id, ["2026-01-05", "2026-01-06"])
+        first = (await client.get("/sync")).json()
+        again = (await client.get("/sync", params={"since": first["since"]})).json()
+        return plan_id, schedule_ids, first, again
+
+    plan_id, schedule_ids, first, again = run_app(body)
+    assert first["more"] is False
+    assert [plan["plan_id"] for plan in first["plans"]] == [plan_id]
+    assert [step["step_name"] for step in first["plans"][0]["processes"]] == ["歯磨き", "朝食"]
+    assert sorted(schedule["schedule_id"] for schedule in first["schedules"]) == schedule_ids
+    # 確定した変更まで進んだので、次は何も返らない
+    assert (again["plans"], again["schedules"], again["since"]) == ([], [], first["since"])
+
+
+def test_since_does_not_pass_unsettled_changes(run_app, monkeypatch):
+    # SYNC_SETTLE_SECONDS 以内の変更は返すが since に含めないので、次回もう一度返る
+    monkeypatch.setattr(config, "sync_settle_seconds", 3600)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        first = (await client.get("/sync")).json()
+        again = (await client.get("/sync", params={"since": first["since"]})).json()
+        monkeypatch.setattr(config, "sync_settle_seconds", 0)
+        settled = (await client.get("/sync", params={"since": again["since"]})).json()
+        after = (await client.get("/sync", params={"since": settled["since"]})).json()
+        return plan_id, first, again, settled, after
+
+    plan_id, first, again, settled, after = run_app(body)
+    assert decode_cursor(first["since"]) == [0]
+    assert [plan["plan_id"] for plan in first["plans"]] == [plan_id]
+    assert [plan["plan_id"] for plan in again["plans"]] == [plan_id] and again["since"] == first["since"]
+    assert decode_cursor(settled["since"])[0] > 0
+    assert after["plans"] == []
+
+
+def test_more_pages_through_all_changes(run_app, monkeypatch):
+    monkeypatch.setattr(config, "sync_settle_seconds", 0)
+    monkeypatch.setattr(config, "sync_page_size", 2)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        schedule_ids = await add_schedules(client, user["user_id"], plan_id, ["2026-01-05", "2026-01-06", "2026-01-07", "2026-01-08"])
+        pages, since = [], None
+        while True:
+            page = (await client.get("/sync", params={"since": since} if since else {})).json()
+            pages.append(page)
+            since = page["since"]
+            if not page["more"]:
+                return schedule_ids, pages
+
+    schedule_ids, pages = run_app(body)
+    assert len(pages) > 2
+    assert all(page["more"] for page in pages[:-1])
+    assert sorted(schedule["schedule_id"] for page in pages for schedule in page["schedules"]) == schedule_ids
+
+
+def test_deleted_schedules_are_reported(run_app, monkeypatch):
+    monkeypatch.setattr(config, "sync_settle_seconds", 0)
+
+    async def body(client):
+        user = await register(client)
+        plan_id = await create_plan(client, user["user_id"])
+        schedule_ids = await add_schedules(client, user["user_id"], plan_id, ["2026-01-05", "2026-01-06"])
+        first = (await client.get("/sync")).json()
+        delete_schedule(schedule_ids[0])
+        after = (await client.get("/sync", params={"since": first["since"]})).json()
+        return schedule_ids, after
+
+    schedule_ids, after = run_app(body)
+    assert after["deleted"] == {"plans": [], "schedules": [schedule_ids[0]]}
+    assert after["schedules"] == []
+
+
+def test_invalid_since_is_rejected(run_app):
+    async def body(client):
+        await register(client)
+        return [(await client.get("/sync", params={"since": since})).status_code for since in ("not base64!", "W10", "WyJhIl0")]
+
+    assert run_app(body) == [400] * 3
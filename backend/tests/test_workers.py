@@ -0,0 +1,24 @@
+import pytest
+
+import config
+import server
+from http_cache import create_version_store
+from sessions import create_session_manager
+
+
+def test_multiple_workers_without_redis(monkeypatch):
+    # ワーカーごとの状態では、他のワーカーの書き込みやログアウトが見えない
+    monkeypatch.setattr(config, "plan_cache_backend", "local")
+    monkeypatch.setattr(config, "web_concurrency", 2)
+    assert create_version_store().etags is False
+    with pytest.raises(RuntimeError):
+        create_session_manager()
+    # 既定 (0) のワーカー数は、共有できなければ1
+    assert server.worker_count(0) == 1
+
+
+def test_single_worker_keeps_local_state(monkeypatch):
+    monkeypatch.setattr(config, "plan_cache_backend", "local")
+    monkeypatch.setattr(config, "web_concurrency", 1)
+    assert create_version_store().etags is True
+    assert create_session_manager().revocations is not None
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import logging
+import math
+import time
+
+import config
+import metrics
+from cache import RedisConnection
+
+# ユーザー名のBloomフィルタ
+# /register・/login・/users/{user_name} はまずユーザー名があるかを user_reg_log に聞きに行くが、
+# 打ち間違いやリスト型攻撃の名前は必ず存在しない。登録済みの名前をBloomフィルタに入れておき、
+# 「確実に無い」と分かる名前はSupabaseに問い合わせずに答える。
+# Bloomフィルタは「無い」と答えたら必ず無い (「あるかもしれない」は設定した割合で外れる → いつも通りDBを読む)。
+# - 起動時にバックグラウンドで user_reg_log を user_id 順に少しずつ読んで作り、
+#   USERNAME_FILTER_REBUILD 秒ごとに作り直す (ダッシュボードなどで直接消した名前を落とすため)
+# - このAPIで登録した名前はその場で追加する
+# - 作り終わるまでは常に「あるかもしれない」と答える
+# 他のワーカーで登録された名前を知らないと「無い」と誤答してしまうので、ワーカーごとのフィルタ (local) は
+# 1ワーカーで動かすときだけ使う。複数ワーカーでは PLAN_CACHE_BACKEND=redis で共有する。
+
+
+def filter_size(capacity: int, fp_rate: float):
+    # capacity 件入れたときに誤答率が fp_rate になるビット数とハッシュ数
+    bits = max(int(math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)), 64)
+    hashes = max(int(round(bits / capacity * math.log(2))), 1)
+    return bits, hashes
+
+
+def bit_positions(name: str, bits: int, hashes: int) -> list:
+    # 128ビットのハッシュを2つに分けて k 個の位置を作る (double hashing)
+    # 0ビット目は「作り終わった」印に使うので、位置は 1..bits-1
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+    first = int.from_bytes(digest[:8], "little")
+    second = int.from_bytes(digest[8:], "little") | 1
+    return [1 + (first + i * second) % (bits - 1) for i in range(hashes)]
+
+
+class LocalFilterBackend:
+    # ワーカーのメモリに bytearray で持つ
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.current = None
+        # 作り直している途中のフィルタ (その間に登録された名前は両方に入れる)
+        self.next = None
+
+    @staticmethod
+    def _set(data: bytearray, positions: list):
+        for position in positions:
+            data[position >> 3] |= 1 << (position & 7)
+
+    async def contains(self, positions: list) -> bool:
+        data = self.current
+        if data is None:
+            return True
+        return all(data[position >> 3] & (1 << (position & 7)) for position in positions)
+
+    async def add(self, positions: list):
+        for data in (self.current, self.next):
+            if data is not None:
+                self._set(data, positions)
+
+    async def begin_rebuild(self) -> bool:
+        self.next = bytearray((self.bits + 7) // 8)
+        return True
+
+    async def add_batch(self, batch: list):
+        for positions in batch:
+            self._set(self.next, positions)
+
+    async def finish_rebuild(self):
+        self.current, self.next = self.next, None
+
+    async def abort_rebuild(self):
+        self.next = None
+
+    async def set_bits(self):
+        if self.current is None:
+            return 0
+        return int.from_bytes(self.current, "little").bit_count()
+
+    async def close(self):
+        pass
+
+
+class RedisFilterBackend:
+    # 複数ワーカーで共有する。ビット列はRedisの文字列1つで、BITFIELD の1往復で k ビットを読み書きする
+    # 作り直しは1ワーカーだけが行う (SET NX のロック)
+    def __init__(self, url: str, bits: int, interval: float, prefix: str = "usernames:"):
+        self.redis = RedisConnection(url)
+        self.bits = bits
+        self.interval = interval
+        self.key = prefix + "bits"
+        self.next_key = prefix + "next"
+        self.lock_key = prefix + "rebuild"
+
+    async def contains(self, positions: list) -> bool:
+        # 0ビット目 (作り終わった印) も一緒に読む。キーが無ければすべて0 → 「あるかもしれない」
+        args = []
+        for position in [0, *positions]:
+            args += ["GET", "u1", position]
+        ready, *values = await self.redis.command("BITFIELD", self.key, *args)
+        return not ready or all(values)
+
+    async def _set(self, key: str, positions: list):
+        args = []
+        for position in positions:
+            args += ["SET", "u1", position, 1]
+        await self.redis.command("BITFIELD", key, *args)
+
+    async def add(self, positions: list):
+        # 作り直している途中なら、そちらにも入れる (作り直しは next を作ってからDBを読み始めるので漏れない)
+        # next → 今のフィルタの順に入れるので、途中で入れ替わっても新しい方には必ず入る
+        if await self.redis.command("EXISTS", self.next_key):
+            await self._set(self.next_key, positions)
+        await self._set(self.key, positions)
+
+    async def begin_rebuild(self) -> bool:
+        # 他のワーカーが最近作り直していたら何もしない
+        if not await self.redis.command("SET", self.lock_key, "1", "NX", "EX", max(int(self.interval), 1)):
+            return False
+        await self.redis.command("DEL", self.next_key)
+        await self.redis.command("SETBIT", self.next_key, self.bits - 1, 0)
+        return True
+
+    async def add_batch(self, batch: list):
+        await self._set(self.next_key, [position for positions in batch for position in positions])
+
+    async def finish_rebuild(self):
+        await self.redis.command("SETBIT", self.next_key, 0, 1)
+        await self.redis.command("RENAME", self.next_key, self.key)
+
+    async def abort_rebuild(self):
+        await self.redis.command("DEL", self.next_key, self.lock_key)
+
+    async def set_bits(self):
+        return await self.redis.command("BITCOUNT", self.key)
+
+    async def close(self):
+        await self.redis.close()
+
+
+class UsernameFilter:
+    def __init__(self, backend, bits: int, hashes: int, batch_size: int, interval: float):
+        self.backend = backend
+        self.bits = bits
+        self.hashes = hashes
+        self.batch_size = batch_size
+        self.interval = interval
+        self.task = None
+        # 最後に作り直したときに読んだ件数と時刻
+        self.loaded = 0
+        self.loaded_at = 0.0
+
+    async def might_exist(self, name: str) -> bool:
+        # False なら確実に登録されていない。フィルタが使えないときは True (DBを読む)
+        try:
+            result = await self.backend.contains(bit_positions(name, self.bits, self.hashes))
+        except Exception as e:
+            logging.warning("Username filter lookup failed: %s", e)
+            result = True
+        metrics.username_filter_checks.inc("maybe" if result else "miss")
+        return result
+
+    async def add(self, name: str):
+        # 登録した後に呼ぶ。失敗してもリクエストは失敗させない
+        try:
+            await self.backend.add(bit_positions(name, self.bits, self.hashes))
+        except Exception as e:
+            logging.warning("Failed to add %s to the username filter: %s", name, e)
+
+    async def rebuild(self, db):
+        # user_reg_log を user_id 順に batch_size 件ずつ読んで新しいフィルタを作り、最後に入れ替える
+        if not await self.backend.begin_rebuild():
+            return
+        started = time.perf_counter()
+        loaded = 0
+        after = None
+        try:
+            while True:
+                rows = await db.list_user_names(after, self.batch_size)
+                if rows:
+                    await self.backend.add_batch([bit_positions(row["user_name"], self.bits, self.hashes) for row in rows])
+                    loaded += len(rows)
+                    after = rows[-1]["user_id"]
+                if len(rows) < self.batch_size:
+                    break
+            await self.backend.finish_rebuild()
+        except BaseException:
+            await self.backend.abort_rebuild()
+            raise
+        self.loaded, self.loaded_at = loaded, time.time()
+        logging.info("Rebuilt username filter", extra={"users": loaded, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1)})
+
+    async def _run(self, db):
+        while True:
+            try:
+                await self.rebuild(db)
+            except Exception as e:
+                logging.warning("Failed to rebuild the username filter: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self, db):
+        # lifespan の中 (イベントループの上) で呼ぶ
+        self.task = asyncio.get_running_loop().create_task(self._run(db))
+
+    async def stats(self) -> dict:
+        stats = {
+            "bits": self.bits,
+            "bytes": (self.bits + 7) // 8,
+            "hashes": self.hashes,
+            "loaded": self.loaded,
+            "loaded_at": self.loaded_at,
+        }
+        # 立っているビットの割合から、入っている件数と今の誤答率を推定する
+        try:
+            fill = await self.backend.set_bits() / self.bits
+        except Exception as e:
+            logging.warning("Failed to read username filter stats: %s", e)
+            return stats
+        stats["estimated_items"] = round(-self.bits / self.hashes * math.log(1 - fill)) if fill < 1 else self.bits
+        stats["false_positive_rate"] = fill ** self.hashes
+        return stats
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.backend.close()
+
+
+def create_username_filter():
+    bits, hashes = filter_size(config.username_filter_capacity, config.username_filter_fp_rate)
+    # 共有するかどうかはプランキャッシュと同じ設定に従う
+    if config.plan_cache_backend == "redis":
+        backend = RedisFilterBackend(config.redis_url, bits, interval=config.username_filter_rebuild)
+    elif (config.web_concurrency or 1) == 1:
+        backend = LocalFilterBackend(bits)
+    else:
+        # 他のワーカーの登録が見えないので使わない (常にDBを読む)
+        logging.warning("Username filter disabled: WEB_CONCURRENCY > 1 needs PLAN_CACHE_BACKEND=redis")
+        return None
+    return UsernameFilter(backend, bits, hashes, batch_size=config.username_filter_batch, interval=config.username_filter_rebuild)
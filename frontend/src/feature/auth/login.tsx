@@ -24,6 +24,8 @@ const Login = () => {
       .then((data) => {
         console.log(data);
         const userId = data.user_id;
+        // 以降のAPI呼び出しで Authorization: Bearer として送る
+        sessionStorage.setItem("token", data.token);
         navigate(`/user/${userId}`);
       })
       .catch((error) => {
@@ -10,6 +10,8 @@ interface Preparation {
 const PreparationPlan: React.FC = () => {
   const { userId } = useParams<{ userId: string }>(); // URLからuserIdを取得
   const [planName, setPlanName] = useState<string>("");
+  // フォームごとに1つのキー (二重送信・再送しても1回だけ登録される)
+  const [idempotencyKey] = useState<string>(() => crypto.randomUUID());
   const [preparations, setPreparations] = useState<Preparation[]>([
     { content: "", time: 0 },
   ]);
@@ -52,6 +54,7 @@ const PreparationPlan: React.FC = () => {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        "Idempotency-Key": idempotencyKey,
       },
       body: JSON.stringify(data),
     })
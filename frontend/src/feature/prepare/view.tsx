@@ -20,10 +20,7 @@ interface ScheduleTimes {
 
 const PreparationTimer: React.FC = () => {
   const { userId } = useParams<{ userId: string }>();
-  const { planId, scheduleId } = useParams<{
-    planId: string;
-    scheduleId: string;
-  }>();
+  const { scheduleId } = useParams<{ scheduleId: string }>();
   const [plan, setPlan] = useState<Plan | null>(null);
   const [currentStep, setCurrentStep] = useState<number>(0);
   const [timeLeft, setTimeLeft] = useState<number>(0);
@@ -32,33 +29,55 @@ const PreparationTimer: React.FC = () => {
   );
   const navigate = useNavigate();
 
-  // Fetch the plan details
+  // Fetch the schedule times, plan and steps in one request
   useEffect(() => {
-    fetch(`http://localhost:8000/plans/${planId}`)
+    fetch(`http://localhost:8000/schedule/${scheduleId}/full`)
       .then((res) => res.json())
       .then((data) => {
-        setPlan(data);
+        setScheduleTimes({
+          departure_time: data.departure_time,
+          wake_up_time: data.wake_up_time,
+        });
+        setPlan({
+          plan_id: data.plan.plan_id,
+          plan_name: data.plan.plan_name,
+          processes: data.steps,
+        });
         setCurrentStep(0);
-        if (data.processes.length > 0) {
-          setTimeLeft(parseInt(data.processes[0].step_time, 10) * 60);
+        if (data.steps.length > 0) {
+          setTimeLeft(parseInt(data.steps[0].step_time, 10) * 60);
         }
       })
       .catch((error) => {
-        console.error("Error fetching plan:", error);
+        console.error("Error fetching schedule:", error);
       });
-  }, [planId]);
+  }, [scheduleId]);
 
-  // Fetch the schedule times
+  // Step alarms pushed by the server: jump to the step that just started
+  // (the local countdown below only fills in the seconds between alarms)
   useEffect(() => {
-    fetch(`http://localhost:8000/schedule/${scheduleId}/times`)
-      .then((res) => res.json())
-      .then((data) => {
-        setScheduleTimes(data);
-      })
-      .catch((error) => {
-        console.error("Error fetching schedule times:", error);
-      });
-  }, [scheduleId]);
+    const token = sessionStorage.getItem("token");
+    if (!token || !plan) {
+      return;
+    }
+    const socket = new WebSocket(
+      `ws://localhost:8000/alarms/ws?token=${encodeURIComponent(token)}&schedule_id=${scheduleId}`
+    );
+    socket.onmessage = (message) => {
+      const event = JSON.parse(message.data);
+      if (event.type !== "step") {
+        return;
+      }
+      const index = plan.processes.findIndex(
+        (process) => process.process_order === event.process_order
+      );
+      if (index >= 0) {
+        setCurrentStep(index);
+        setTimeLeft(parseInt(event.step_time, 10) * 60);
+      }
+    };
+    return () => socket.close();
+  }, [plan, scheduleId]);
 
   // Handle the countdown timer
   useEffect(() => {
@@ -26,6 +26,8 @@ interface PlanDetails extends Plan {
 const ScheduleRegister: React.FC = () => {
   const { userId } = useParams<{ userId: string }>();
   const [date, setDate] = useState<string>("");
+  // フォームごとに1つのキー (二重送信・再送しても1回だけ登録される)
+  const [idempotencyKey] = useState<string>(() => crypto.randomUUID());
   const [departureTime, setDepartureTime] = useState<string>("");
   const [planId, setPlanId] = useState<string>("");
   const [plans, setPlans] = useState<Plan[]>([]);
@@ -75,6 +77,7 @@ const ScheduleRegister: React.FC = () => {
       method: "POST",
       headers: {
         "Content-Type": "application/json",
+        "Idempotency-Key": idempotencyKey,
       },
       body: JSON.stringify(data),
     })
@@ -15,7 +15,13 @@ const ScheduleList: React.FC = () => {
   const navigate = useNavigate();
 
   useEffect(() => {
-    fetch(`http://localhost:8000/schedules/user/${userId}`)
+    // 今日以降の予定だけを取得する (過去の履歴は読み込まない)
+    const today = new Date();
+    const from = `${today.getFullYear()}-${String(today.getMonth() + 1).padStart(
+      2,
+      "0"
+    )}-${String(today.getDate()).padStart(2, "0")}`;
+    fetch(`http://localhost:8000/schedules/user/${userId}?from=${from}`)
       .then((res) => {
         if (!res.ok) {
           throw new Error(`Error: ${res.statusText}`);